@@ -1,14 +1,29 @@
 # /home/pi/raspberry_to_gcp.py
+import sys
 import time
-import subprocess
+STARTUP_T0: float = time.perf_counter()     # Reference point of --profile-startup
+import queue
+import argparse
+import signal
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
-from collections import deque
-from typing import List, Optional, Dict, Any
-from google.cloud import bigquery, firestore
-from google.oauth2 import service_account
-import google.api_core.exceptions
+from collections import Counter, deque
+from typing import List, NamedTuple, Optional, Dict, Any, Tuple
+from gcp_clients import LazyClients, TokenCache, TokenRefresher, load_credentials, make_clients, query_rows
+from gam_image import Fat32Image, ImageWatcher, LogReader, TailResult, image_path_from_mtools_conf, make_log_reader
+from gam_parser import (GAMA_HEADER_PREFIX, FormatRegistry, LogBatch, LogFormat, Reading, default_registry,
+                        parse_device_time, parse_log_batch, parse_log_line, split_buffer)
+from gcp_sinks import (BQ_BATCH_MAX_BYTES, BQ_BATCH_MAX_LATENCY, BQ_BATCH_MAX_ROWS, BREAKER_FAILURE_RATE,
+                       BREAKER_MIN_CALLS, BREAKER_OPEN_DURATION, BREAKER_WINDOW, FS_HEARTBEAT_JITTER,
+                       FS_HEARTBEAT_PERIOD, BigQueryBatchWriter, CallStats, CircuitBreaker, DocumentMirror,
+                       HeartbeatCoalescer, LatestValueSink, call_with_deadline, insert_rows, row_insert_id,
+                       status_fields)
+from local_store import (CHECKPOINT_FILE, DEADLETTER_FILE, DEDUP_CAPACITY, DEDUP_FILE, OUTBOX_FILE, Checkpoint,
+                         DeadLetterFile, LineDeduplicator, line_digest, open_outbox)
+from pipeline import Liveness, Stage, StageStats, put, put_latest
+from service import Gate, GateResult, ReadinessGates, Watchdog, sd_notify, tcp_reachable, watchdog_interval
+IMPORTS_DONE: float = time.perf_counter()
 
 # ============================
 #         Configuration
@@ -16,27 +31,85 @@ import google.api_core.exceptions
 
 # Path to the log file (mtools path)
 LOG_FILE: str = "p:/LOGGER.GAM"
+# Backup file that rotate_logger.sh moves older lines into (same drive)
+BACKUP_LOG_FILE_NAME: str = "LOGS_BKP.GAM"
+# Format of the device timestamp in field 0 of each log line (parser, line keys and checkpoint)
+LOG_TIMESTAMP_FORMAT: str = "%m-%d-%Y %H:%M:%S"
+# Reader backend: "fat32" reads the image in-process, "mtype" shells out to mtools
+LOG_READER_BACKEND: str = "fat32"
+# How often (in seconds) to log how many reads the directory-entry probe saved
+PROBE_REPORT_INTERVAL: int = 3600
+# Wakeup mode: "inotify" waits for the gadget to write to the image, "poll" sleeps a fixed interval
+WAKEUP_MODE: str = "inotify"
+WAKEUP_DEBOUNCE: float = 0.2          # Seconds of quiet that end a burst of write events
+WAKEUP_FALLBACK_INTERVAL: int = 10    # Seconds before running a cycle anyway if no write is seen
 
 # Machine and Location Information
 MACHINE_NAME: str = "UIP 1 [G50-H] - Coteau"  # Name of the machine
 CURRENT_LOCATION = "Coteau-du-Lac"              # Current location name
 LOCATION_INFO = "POINT(-74.1771 45.3053)"       # Geographical coordinates of the location   
+# Columns shared by every row; added when rows reach a sink instead of stored per row
+STATIC_COLUMNS: Dict[str, Any] = {
+    "Machine": MACHINE_NAME,
+    "Location": LOCATION_INFO,
+    "Location Name": CURRENT_LOCATION,
+}
+# Columns that identify a row; hashed into its BigQuery insertId
+INSERT_ID_COLUMNS: Tuple[str, ...] = ("Machine", "Timestamp", "Minute ID")
 
 # Google Cloud Configuration
 SERVICE_ACCOUNT_FILE: str = "2-auth-key.json"   # Path to the service account JSON file
+TOKEN_CACHE_FILE: str = "/home/pi/.gcp_token.json"  # Access token reused across restarts (mode 0600)
 PROJECT_ID: str = "gf-canada-iot"                 # Google Cloud project ID
 DATASET_ID: str = "GF_CAN_Machines"               # BigQuery dataset ID
 TABLE_ID: str = "gamma-machines-pi"               # BigQuery table ID
 FIRESTORE_COLLECTION: str = "gamma_machines_status"  # Firestore collection name
+GCP_TRANSPORT: str = "official"     # "official" (google-cloud clients) or "rest" (lean google-auth + HTTP client)
+# Firestore heartbeat throttle: FS_HEARTBEAT_PERIOD / FS_HEARTBEAT_JITTER in gcp_sinks.py
+RECONCILE_LOOKBACK_DAYS: int = 7    # --reconcile only scans BigQuery rows this recent
+RECONCILE_TIMEOUT: float = 60.0     # Seconds the --reconcile query may take
 
 # ============================
 #      Retry Configurations
 # ============================
 MAX_ATTEMPTS_BQ: int = 3            # Maximum attempts for BigQuery
 INITIAL_DELAY_BQ: int = 3           # Initial delay (in seconds) for BigQuery retries
+CALL_TIMEOUT_BQ: float = 15.0       # Seconds one insertAll request may take
+DEADLINE_BQ: float = 45.0           # Seconds one batch may take across all attempts and backoff
 MAX_ATTEMPTS_FS: int = 3            # Maximum attempts for Firestore
 INITIAL_DELAY_FS: int = 2           # Initial delay (in seconds) for Firestore retries
-COOL_DOWN_PERIOD: int = 25          # Cooldown period (in seconds) after repeated failures
+CALL_TIMEOUT_FS: float = 10.0       # Seconds one Firestore read or write may take
+DEADLINE_FS: float = 20.0           # Seconds one Firestore update may take across all attempts and backoff
+
+# ============================
+#     BigQuery Batching
+# ============================
+# Circuit breaker (BREAKER_*) and batch flush (BQ_BATCH_*) settings live in gcp_sinks.py; the outbox,
+# checkpoint, dedup and dead-letter files (OUTBOX_FILE, CHECKPOINT_FILE, ...) in local_store.py
+CATCHUP_FLUSH_ROWS: int = 50        # A read yielding this many rows is flushed at once (catch-up)
+CATCHUP_CHUNK_ROWS: int = 250       # Rows appended to the outbox in one transaction (catch-up, --replay)
+
+# ============================
+#          Pipeline
+# ============================
+PIPELINE_QUEUE_SIZE: int = 1000     # Capacity of each queue between stages
+BQ_QUEUE_SIZE: int = 100            # Capacity of the BigQuery stage's inbox, in chunks of rows
+PIPELINE_REPORT_INTERVAL: int = 300 # How often (in seconds) to log per-stage metrics
+PIPELINE_STOP_TIMEOUT: float = 30.0 # Seconds each stage gets to drain on shutdown
+# Watchdog budgets: seconds one unit of work may run without progress before the stage counts as
+# stalled and the systemd watchdog ping (WatchdogSec in the unit) is withheld
+READER_BUDGET: float = 120.0        # One read cycle (mtype / image read, backlog read, queueing)
+PARSER_BUDGET: float = 120.0        # Parsing one read
+FIRESTORE_BUDGET: float = 90.0      # One Firestore update (mirror read + DEADLINE_FS)
+BIGQUERY_BUDGET: float = 120.0      # One BigQuery batch (DEADLINE_BQ), or the timer between batches
+
+# ============================
+#      Startup Readiness
+# ============================
+IMAGE_READY_TIMEOUT: float = 60.0   # Seconds to wait for the USB image to exist and read as FAT32
+LOGGER_READY_TIMEOUT: float = 30.0  # Seconds to wait, once the image is ready, for LOGGER.GAM in it
+NETWORK_READY_TIMEOUT: float = 120.0  # Seconds to wait for DNS and a TCP route to the Google APIs
+NETWORK_PROBE_HOST: str = "bigquery.googleapis.com"  # Host resolved and connected to by the network gate
 
 # ============================
 #       Timezone Mapping
@@ -46,14 +119,43 @@ TIMEZONES: Dict[str, str] = {
     "Coteau-du-Lac": "America/Toronto",
     "Calmar": "America/Edmonton"
 }
+# Resolved once at startup; the parser converts device timestamps with them
+LOCAL_TZ: ZoneInfo = ZoneInfo(TIMEZONES.get(CURRENT_LOCATION, "UTC"))
+UTC_TZ: timezone = timezone.utc
 
 # ============================
 #     Initialize Clients
 # ============================
-# Load credentials from the service account file and initialize the Google Cloud clients
-credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
-bigquery_client: bigquery.Client = bigquery.Client(project=PROJECT_ID, credentials=credentials)
-firestore_client: firestore.Client = firestore.Client(project=PROJECT_ID, credentials=credentials)
+# (step, seconds since the script started importing), reported by --profile-startup
+startup_marks: List[Tuple[str, float]] = [("imports", IMPORTS_DONE - STARTUP_T0)]
+
+def mark_startup(step: str) -> None:
+    """Records that a startup step finished, for --profile-startup."""
+    startup_marks.append((step, time.perf_counter() - STARTUP_T0))
+
+def build_clients() -> Tuple[Any, Any]:
+    """
+    Loads the service account credentials, with the cached access token if it
+    is still valid, and builds the BigQuery and Firestore clients. Runs on a
+    background thread (see LazyClients), so importing the client libraries does
+    not delay the first read of LOGGER.GAM.
+
+    Returns:
+        tuple: (BigQuery client, Firestore client).
+    """
+    credentials = load_credentials(SERVICE_ACCOUNT_FILE, token_cache)
+    mark_startup("credentials loaded")
+    built = make_clients(GCP_TRANSPORT, PROJECT_ID, credentials)
+    token_refresher.track(credentials)
+    mark_startup("cloud clients built")
+    return built
+
+# Access token persisted across restarts and refreshed before it expires
+token_cache = TokenCache(TOKEN_CACHE_FILE)
+token_refresher = TokenRefresher(token_cache)
+
+# Built in the background once the network gate is decided; each call waits for them within its timeout
+clients = LazyClients(build_clients)
 
 # ============================
 #     Logging Configuration
@@ -71,214 +173,902 @@ logging.basicConfig(
 #     Function Definitions
 # ============================
 
-def get_log_lines() -> List[str]:
+# Reader for LOGGER.GAM, opened once on first use
+log_reader: Optional[LogReader] = None
+# Counters of the last three log lines seen by the parser stage (for Running / Stopped).
+# Kept across rotations: the first lines of a new LOGGER.GAM continue the counter sequence
+recent_counters: deque = deque(maxlen=3)
+# Key of the newest line already handed to the outbox; older lines are skipped
+high_water: Optional[Tuple[datetime, int, int]] = None
+# Persisted copy of `high_water`
+checkpoint = Checkpoint(CHECKPOINT_FILE)
+# Content-based duplicate suppression, keyed on each line's own text
+dedup = LineDeduplicator(DEDUP_FILE, DEDUP_CAPACITY)
+# Fields of the Firestore status document as last read or written
+fs_mirror = DocumentMirror()
+fs_mirror_loaded: bool = False
+# Throttle for Firestore writes that only bump PI_Timestamp
+heartbeats = HeartbeatCoalescer(FS_HEARTBEAT_PERIOD, FS_HEARTBEAT_JITTER)
+# Newest reading seen by the Firestore stage; heartbeats while LOGGER.GAM is idle repeat it
+fs_latest: Optional[Reading] = None
+# Known log layouts, keyed by the GAMA header, and the layout of the current LOGGER.GAM
+log_formats: FormatRegistry = default_registry()
+log_format: LogFormat = log_formats.generic
+# Chunks of rows the outbox could not store yet (e.g. disk full); the checkpoint waits for them
+unstored: deque = deque()
+# Attempts, timeouts and expired deadlines of the cloud calls
+bq_calls = CallStats("BigQuery insert")
+fs_calls = CallStats("Firestore write")
+# Rows BigQuery rejected, counted per error reason, and where the invalid ones are kept
+bq_row_errors: Counter = Counter()
+dead_letters = DeadLetterFile(DEADLETTER_FILE)
+mark_startup("module setup")
+
+class RowChunk(NamedTuple):
+    """Rows of one read sent to the BigQuery stage, kept as columns until they reach the outbox."""
+    batch: LogBatch                  # Columns of the rows
+    statuses: List[str]              # Running / Stopped status of each row
+    ingest_time: float               # When the lines were read, epoch seconds
+    digests: List[bytes]             # Line digests, recorded once the rows are in the outbox
+
+class CatchUpMark(NamedTuple):
+    """Marker sent to the BigQuery stage after the rows of one read."""
+    key: Tuple[datetime, int, int]   # Key of the last row queued before the marker
+    flush: bool                      # Flush now instead of waiting for the latency window
+
+def get_log_reader() -> LogReader:
     """
-    Retrieves the content of LOGGER.GAM using mtype and returns it as a list of lines.
-    
+    Returns the LOGGER.GAM reader, creating it on first use.
+
     Returns:
-        List[str]: A list of strings, each representing a line from LOGGER.GAM.
+        LogReader: The configured reader backend.
     """
-    try:
-        result = subprocess.run(
-            ["mtype", LOG_FILE],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True  # Ensures output is a string
-        )
-        lines: List[str] = result.stdout.strip().split('\n')
-        return lines
-    except subprocess.CalledProcessError as e:
-        logging.error("mtype command failed: %s", e.stderr.strip())
-        return []
-    except FileNotFoundError:
-        logging.error("mtype command not found. Please install mtools.")
-        return []
-
-def parse_log_line(log_line: str) -> Optional[Dict[str, Any]]:
-    """
-    Parses a single line from the log file and converts it into a dictionary
-    with appropriate data types and additional metadata.
+    global log_reader
+    if log_reader is None:
+        log_reader = make_log_reader(LOG_READER_BACKEND, LOG_FILE)
+        logging.info("Using %s reader for %s.", log_reader.name, LOG_FILE)
+    return log_reader
+
+def get_new_log_lines() -> TailResult:
+    """
+    Retrieves only the lines appended to LOGGER.GAM since the previous call.
+
+    Returns:
+        TailResult: The new lines and whether the file was rotated in between.
+    """
+    return get_log_reader().read_new_lines()
+
+def line_key(log_line: str) -> Optional[Tuple[datetime, int, int]]:
+    """
+    Builds the ordering key of a log line: device timestamp, Minute ID and Counter.
+    The line is parsed by parse_log_line(), which accepts exactly the lines the
+    parser stage does, and the key equals the one the parser stage builds.
 
     Parameters:
         log_line (str): A line from the log file.
 
     Returns:
-        dict or None: Parsed data as a dictionary if successful, else None.
+        tuple or None: The key, or None for the header and malformed lines.
     """
-    values = log_line.split(";")
-    if len(values) < 17:
-        logging.error("Invalid log line: %s", log_line)
+    try:
+        reading = parse_log_line(log_line, LOCAL_TZ, log_format, time_format=LOG_TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    return (datetime.fromtimestamp(reading.timestamp, LOCAL_TZ).replace(tzinfo=None),
+            reading.get("Minute ID"), reading.get("Counter"))
+
+def save_checkpoint(key: Tuple[datetime, int, int]) -> None:
+    """
+    Persists the key of the last line handed to the outbox. Once a row is in
+    the durable outbox its upload is guaranteed, so the next run resumes after
+    this line without asking BigQuery what was sent.
+
+    Parameters:
+        key (tuple): Key returned by line_key().
+    """
+    checkpoint.save({
+        "Log Timestamp": key[0].strftime(LOG_TIMESTAMP_FORMAT),
+        "Minute ID": key[1],
+        "Counter": key[2],
+    })
+
+def load_checkpoint() -> Optional[Tuple[datetime, int, int]]:
+    """
+    Reads the key of the last line handed to the outbox by a previous run.
+
+    Returns:
+        tuple or None: The key, or None if there is no usable checkpoint.
+    """
+    state = checkpoint.load()
+    if not state:
         return None
     try:
-        local_tz = ZoneInfo(TIMEZONES.get(CURRENT_LOCATION, "UTC"))
-        now: datetime = datetime.now(local_tz)
-        now_utc: datetime = now.astimezone(ZoneInfo("UTC"))
-        formatted_timestamp: str = now_utc.isoformat()
-        return {
-            "Timestamp": formatted_timestamp,
-            "Minute ID": int(values[1]),
-            "ISO Temp Real": float(values[2]),
-            "ISO Temp Set": float(values[3]),
-            "RESIN Temp Real": float(values[4]),
-            "RESIN Temp Set": float(values[5]),
-            "HOSE Temp Real": float(values[6]),
-            "HOSE Temp Set": float(values[7]),
-            "Value8": float(values[8]),
-            "Value9": float(values[9]),
-            "ISO Amperage": float(values[10]),
-            "RESIN Amperage": float(values[11]),
-            "ISO Pressure": float(values[12]),
-            "RESIN Pressure": float(values[13]),
-            "Counter": int(values[14]),
-            "Value15": float(values[15]),
-            "Status": values[16],
-            "Machine": MACHINE_NAME,
-            "Location": LOCATION_INFO,
-            "Location Name": CURRENT_LOCATION,
-        }
-    except ValueError as e:
-        logging.error("Timestamp parse error: %s", e)
+        return (parse_device_time(state["Log Timestamp"], LOG_TIMESTAMP_FORMAT),
+                int(state["Minute ID"]), int(state["Counter"]))
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error("Ignoring malformed checkpoint %s: %s", state, e)
         return None
 
-def send_to_bigquery(data: Dict[str, Any]) -> None:
+def detect_log_format(lines: List[str]) -> None:
     """
-    Inserts a single row of data into BigQuery with exponential backoff and circuit breaker logic.
+    Selects the parser layout from the GAMA header, if `lines` starts with one.
+
+    The header is the first line of LOGGER.GAM, so it is seen on the first read
+    and again after every rotation; lines without a header keep the current layout.
 
     Parameters:
-        data (dict): The data to be inserted into BigQuery.
+        lines (list): Lines read from the start of a log file, or newly appended lines.
     """
-    table_id: str = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
-    for attempt in range(1, MAX_ATTEMPTS_BQ + 1):
-        try:
-            errors = bigquery_client.insert_rows_json(table_id, [data])
-            if errors:
-                logging.error("BigQuery errors on attempt %d: %s", attempt, errors)
-            else:
-                logging.info("Data inserted into BigQuery successfully on attempt %d.", attempt)
-                return  # Exit after successful insert
-        except google.api_core.exceptions.GoogleAPIError as e:
-            logging.error("GoogleAPIError on BigQuery attempt %d: %s", attempt, e)
-        except Exception as e:
-            logging.exception("Unexpected error on BigQuery attempt %d", attempt)
-        
-        if attempt < MAX_ATTEMPTS_BQ:
-            delay = INITIAL_DELAY_BQ * (2 ** (attempt - 1))
-            logging.debug("Retrying BigQuery insertion in %d seconds (exponential backoff)...", delay)
-            time.sleep(delay)
-    
-    logging.error("Failed to insert data into BigQuery after %d attempts. Triggering circuit breaker cooldown.", MAX_ATTEMPTS_BQ)
-    logging.debug("Cooling down for %d seconds.", COOL_DOWN_PERIOD)
-    time.sleep(COOL_DOWN_PERIOD)
+    global log_format
+    if not lines or not lines[0].startswith(GAMA_HEADER_PREFIX):
+        return
+    fmt = log_formats.select(lines[0])
+    if fmt is not log_format:
+        logging.info("Log header %r: parsing with the %s layout.", lines[0].strip(), fmt.name)
+        log_format = fmt
 
-def update_firestore(data: Dict[str, Any], previous_status: Optional[str]) -> None:
+def line_status(counter: int, two_lines_before: int) -> str:
     """
-    Updates a Firestore document with exponential backoff and circuit breaker logic.
+    Derives the machine status from the line counter: the machine is running
+    while the counter moves (compared with two lines earlier) and is not zero.
 
     Parameters:
-        data (dict): The data containing status and timestamp information.
-        previous_status (str or None): The previous status to compare against.
+        counter (int): Counter of the line.
+        two_lines_before (int): Counter of the line two lines earlier.
+
+    Returns:
+        str: "Running" or "Stopped".
     """
-    doc_ref = firestore_client.collection(FIRESTORE_COLLECTION).document(MACHINE_NAME)
-    ts: datetime = datetime.fromisoformat(data["Timestamp"])
-    for attempt in range(1, MAX_ATTEMPTS_FS + 1):
-        try:
-            if previous_status != data["Status"]:
-                doc_ref.set({
-                    "Location": data["Location Name"],
-                    "Status": data["Status"],
-                    "Timestamp": ts,
-                    "PI_Timestamp": ts
-                })
-                logging.info("Firestore document set successfully on attempt %d.", attempt)
-            else:
-                doc_ref.update({
-                    "PI_Timestamp": ts
-                })
-                logging.info("Firestore document updated successfully on attempt %d.", attempt)
-            return  # Exit if successful
-        except google.api_core.exceptions.ServiceUnavailable as e:
-            logging.error("Firestore ServiceUnavailable on attempt %d: %s", attempt, e)
-        except google.api_core.exceptions.GoogleAPIError as e:
-            logging.error("Firestore GoogleAPIError on attempt %d: %s", attempt, e)
-        except Exception as e:
-            logging.exception("Unexpected error on Firestore attempt %d", attempt)
-        
-        if attempt < MAX_ATTEMPTS_FS:
-            delay = INITIAL_DELAY_FS * (2 ** (attempt - 1))
-            logging.debug("Retrying Firestore update in %d seconds (exponential backoff)...", delay)
-            time.sleep(delay)
-    
-    logging.error("Failed to update Firestore after %d attempts. Triggering circuit breaker cooldown.", MAX_ATTEMPTS_FS)
-    logging.debug("Cooling down for %d seconds.", COOL_DOWN_PERIOD)
-    time.sleep(COOL_DOWN_PERIOD)
+    return "Running" if counter != two_lines_before and counter != 0 else "Stopped"
+
+def log_rejects(batch: LogBatch, source: str) -> None:
+    """
+    Logs the lines the batch parser rejected.
+
+    Parameters:
+        batch (LogBatch): Result of parse_log_batch().
+        source (str): Where the lines came from, for the log message.
+    """
+    for reject in batch.rejects:
+        logging.error("Rejected line %d of %s (%s): %s", reject.line_number + 1, source, reject.reason, reject.line)
+
+def send_to_bigquery(rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Inserts a batch of rows into BigQuery with exponential backoff. Each request
+    is bounded by CALL_TIMEOUT_BQ and the whole batch by DEADLINE_BQ, so a
+    stalled connection cannot hold the BigQuery stage indefinitely. Every row
+    carries an insertId derived from INSERT_ID_COLUMNS, so a retry after a
+    timed-out request that BigQuery had in fact accepted does not duplicate it.
+    Only rows that failed with a retryable reason are resent; invalid rows are
+    written to DEADLETTER_FILE instead of failing the batch.
+
+    Parameters:
+        rows (list): The rows to be inserted into BigQuery.
+
+    Returns:
+        list: Indices of the rows still to be sent once the attempts ran out (empty on success).
+    """
+    table_id: str = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
+    row_ids: List[str] = [row_insert_id(row, INSERT_ID_COLUMNS) for row in rows]
+
+    def insert(batch: List[Dict[str, Any]], batch_ids: List[str], timeout: float) -> List[Dict[str, Any]]:
+        # retry=None: retries are done by insert_rows, within the deadline
+        return clients.bigquery(timeout).insert_rows_json(table_id, batch, row_ids=batch_ids, timeout=timeout, retry=None)
+
+    dead_lettered: int = dead_letters.rows_written
+    pending: List[int] = insert_rows(insert, rows, row_ids, bq_calls, bq_row_errors, dead_letters.write,
+                                     deadline=DEADLINE_BQ, call_timeout=CALL_TIMEOUT_BQ,
+                                     max_attempts=MAX_ATTEMPTS_BQ, base_delay=INITIAL_DELAY_BQ)
+    rejected: int = dead_letters.rows_written - dead_lettered
+    if rejected:
+        logging.error("%d invalid rows written to %s.", rejected, DEADLETTER_FILE)
+    if pending:
+        logging.error("Failed to insert %d of %d rows into BigQuery; they stay in the outbox.", len(pending), len(rows))
+    else:
+        logging.info("%d rows inserted into BigQuery successfully.", len(rows) - rejected)
+    return pending
 
 def get_latest_sent() -> Optional[Dict[str, Any]]:
     """
-    Retrieves the latest sent data from BigQuery for the current machine and location.
+    Retrieves the key columns of the newest row in BigQuery for this machine and
+    location. Only used by --reconcile: normal startup reads the local checkpoint
+    instead. The query projects just the columns of the line key and only scans
+    the last RECONCILE_LOOKBACK_DAYS days, which prunes partitions on a
+    partitioned table.
 
     Returns:
-        dict or None: The most recent row of data as a dictionary if found, else None.
+        dict or None: Timestamp (UTC datetime), Minute ID and Counter of the newest row, or None if there is none.
     """
     query: str = f"""
-        SELECT * FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`
+        SELECT Timestamp, `Minute ID`, Counter FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`
         WHERE `Location Name` = @current_location AND `Machine` = @machine_name
+          AND Timestamp >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @lookback_days DAY)
         ORDER BY Timestamp DESC
         LIMIT 1
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("current_location", "STRING", CURRENT_LOCATION),
-            bigquery.ScalarQueryParameter("machine_name", "STRING", MACHINE_NAME)
-        ]
-    )
-    query_job = bigquery_client.query(query, job_config=job_config)
-    results = query_job.result()
-    for row in results:
-        return dict(row)
-    return None
+    rows = query_rows(clients.bigquery(RECONCILE_TIMEOUT), PROJECT_ID, query, [
+        ("current_location", "STRING", CURRENT_LOCATION),
+        ("machine_name", "STRING", MACHINE_NAME),
+        ("lookback_days", "INT64", RECONCILE_LOOKBACK_DAYS),
+    ], timeout=RECONCILE_TIMEOUT)
+    return rows[0] if rows else None
+
+def firestore_document(reading: Reading) -> Dict[str, Any]:
+    """
+    Builds the fields the Firestore status document should hold for a reading.
+
+    Parameters:
+        reading (Reading): The newest reading.
+
+    Returns:
+        dict: Location, Status, PI_Timestamp, and Timestamp if the status changed.
+    """
+    return status_fields(fs_mirror, CURRENT_LOCATION, reading.status,
+                         datetime.fromtimestamp(reading.timestamp, UTC_TZ),
+                         datetime.fromtimestamp(reading.ingest_time, UTC_TZ))
+
+def load_firestore_mirror() -> None:
+    """
+    Seeds the local mirror from the Firestore status document. If it cannot be
+    read, the next write sends every field with merge instead, and the read is
+    tried again before the following one. Called by the Firestore stage before
+    its first write, so startup does not wait for it.
+    """
+    global fs_mirror_loaded
+    try:
+        doc_ref = clients.firestore(CALL_TIMEOUT_FS).collection(FIRESTORE_COLLECTION).document(MACHINE_NAME)
+        snapshot = doc_ref.get(timeout=CALL_TIMEOUT_FS)
+    except Exception as e:
+        logging.error("Could not read Firestore document %s: %s", MACHINE_NAME, e)
+        return
+    fs_mirror.seed(snapshot.to_dict() if snapshot.exists else None)
+    fs_mirror_loaded = True
+    logging.info("Firestore document %s: status %s.", MACHINE_NAME, fs_mirror.get("Status"))
+
+def update_firestore(data: Reading) -> bool:
+    """
+    Writes the fields of the Firestore status document that differ from the local
+    mirror, as one field-masked update, with exponential backoff bounded by
+    CALL_TIMEOUT_FS per request and DEADLINE_FS overall.
+
+    Parameters:
+        data (Reading): The reading containing status and timestamp information.
+
+    Returns:
+        bool: True if the document is up to date, False after all attempts failed.
+    """
+    desired: Dict[str, Any] = firestore_document(data)
+    changes: Dict[str, Any] = fs_mirror.diff(desired)
+    if not changes:
+        return True
+
+    def write(timeout: float) -> None:
+        # retry=None: retries are done by call_with_deadline, within the deadline
+        doc_ref = clients.firestore(timeout).collection(FIRESTORE_COLLECTION).document(MACHINE_NAME)
+        if fs_mirror.known:
+            # Only the listed fields are written (field mask); the rest are left alone
+            doc_ref.update(changes, timeout=timeout, retry=None)
+        else:
+            doc_ref.set(changes, merge=True, timeout=timeout, retry=None)
+
+    try:
+        call_with_deadline(write, fs_calls, deadline=DEADLINE_FS, call_timeout=CALL_TIMEOUT_FS,
+                           max_attempts=MAX_ATTEMPTS_FS, base_delay=INITIAL_DELAY_FS)
+    except Exception as e:
+        logging.error("Failed to update Firestore: %s", e)
+        return False
+    fs_mirror.apply(changes, len(desired) - len(changes))
+    logging.info("Firestore document updated (%s).", ", ".join(changes))
+    return True
+
+def check_image_ready() -> bool:
+    """Readiness gate: the USB image exists and its boot sector reads as FAT32."""
+    drive, _, _ = LOG_FILE.rpartition(":")
+    Fat32Image(image_path_from_mtools_conf(drive)).close()
+    return True
+
+def check_logger_ready() -> bool:
+    """Readiness gate: LOGGER.GAM has a directory entry in the image."""
+    drive, _, file_name = LOG_FILE.rpartition(":")
+    image = Fat32Image(image_path_from_mtools_conf(drive))
+    try:
+        return image.find_entry(file_name.lstrip("/")) is not None
+    finally:
+        image.close()
+
+def check_network_ready() -> bool:
+    """Readiness gate: the Google APIs resolve and accept a TCP connection."""
+    return tcp_reachable(NETWORK_PROBE_HOST)
+
+def start_readiness_gates() -> ReadinessGates:
+    """
+    Starts the startup gates: the image, then LOGGER.GAM inside it, and, in
+    parallel, the network. The cloud clients are built once the network gate
+    is decided (passed or timed out).
+
+    Returns:
+        ReadinessGates: The running gates.
+    """
+    def gate_done(result: GateResult) -> None:
+        mark_startup(f"gate {result.name} {'ready' if result.ready else 'timed out'}")
+        if result.name == "network":
+            clients.start()
+
+    return ReadinessGates([
+        Gate("image", check_image_ready, IMAGE_READY_TIMEOUT),
+        Gate("logger", check_logger_ready, LOGGER_READY_TIMEOUT, requires=("image",)),
+        Gate("network", check_network_ready, NETWORK_READY_TIMEOUT),
+    ], on_done=gate_done).start()
+
+def make_image_watcher() -> Optional[ImageWatcher]:
+    """
+    Creates the inotify watcher on the USB image when event-driven wakeups are enabled.
+
+    Returns:
+        ImageWatcher or None: The watcher, or None to fall back to fixed polling.
+    """
+    if WAKEUP_MODE != "inotify":
+        return None
+    image = getattr(get_log_reader(), "image", None)
+    image_path: str = image.image_path if image is not None else image_path_from_mtools_conf()
+    try:
+        watcher = ImageWatcher(image_path, debounce=WAKEUP_DEBOUNCE)
+        logging.info("Waiting for writes to %s (fallback every %d s).", image_path, WAKEUP_FALLBACK_INTERVAL)
+        return watcher
+    except OSError as e:
+        logging.error("inotify unavailable (%s); falling back to polling.", e)
+        return None
+
+def wait_for_next_cycle(watcher: Optional[ImageWatcher], interval: int) -> None:
+    """
+    Blocks until the next monitoring cycle should run.
+
+    Parameters:
+        watcher (ImageWatcher or None): inotify watcher, or None for fixed polling.
+        interval (int): Polling interval in seconds when no watcher is available.
+    """
+    if watcher is None:
+        time.sleep(interval)
+    else:
+        watcher.wait(WAKEUP_FALLBACK_INTERVAL)
+
+def parse_stage(lines: TailResult, fs_queue: queue.Queue, bq_queue: queue.Queue, fs_stats: StageStats,
+                liveness: Optional[Liveness] = None) -> None:
+    """
+    Pipeline stage: turns every newly read line into a row.
+
+    Each line newer than `high_water` becomes a BigQuery row, so nothing is lost
+    when several lines arrive between reads, after a restart, or during catch-up.
+    Rows are handed on in chunks of up to CATCHUP_CHUNK_ROWS, each appended to
+    the outbox in one transaction and followed by a checkpoint, so a long
+    catch-up resumes from its last chunk. Lines whose content digest was
+    already handed to the outbox are suppressed.
+    Only the newest row of the read goes to Firestore. Without a checkpoint (first
+    run) only the newest line of the first read is uploaded.
+
+    Parameters:
+        lines (TailResult): Lines read from LOGGER.GAM and whether it was rotated.
+        fs_queue (queue.Queue): Inbox of the Firestore stage (latest value wins).
+        bq_queue (queue.Queue): Inbox of the BigQuery stage (blocks when full).
+        fs_stats (StageStats): Firestore stage stats, to count dropped updates.
+        liveness (Liveness or None): Progress tracker of the parser; every chunk handed on is progress.
+    """
+    global high_water
+    newest: Optional[int] = None
+    queued = 0
+    chunk: List[int] = []
+    statuses: List[str] = []
+    digests: List[bytes] = []
+    first_emitted = len(lines.lines) - 1 if high_water is None else 0
+    ingest_time: float = time.time()
+
+    detect_log_format(lines.lines)
+    batch: LogBatch = parse_log_batch(lines.lines, LOCAL_TZ, log_format, time_format=LOG_TIMESTAMP_FORMAT)
+    log_rejects(batch, LOG_FILE)
+    minutes, counters = batch.column("Minute ID"), batch.column("Counter")
+    # Compare keys as epoch seconds rather than converting every line back to local time
+    floor = ((high_water[0].replace(tzinfo=LOCAL_TZ).timestamp(), high_water[1], high_water[2])
+             if high_water is not None else None)
+
+    def key(row: int) -> Tuple[datetime, int, int]:
+        return (datetime.fromtimestamp(batch.timestamps[row], LOCAL_TZ).replace(tzinfo=None),
+                int(minutes[row]), int(counters[row]))
+
+    for row in range(len(batch)):
+        counter = int(counters[row])
+        recent_counters.append(counter)
+        if len(recent_counters) < 3 or batch.line_numbers[row] < first_emitted:
+            continue
+        if floor is not None and (batch.timestamps[row], int(minutes[row]), counter) <= floor:
+            continue
+
+        status: str = line_status(counter, recent_counters[0])
+        newest = row
+        newest_status = status
+        digest: bytes = line_digest(lines.lines[batch.line_numbers[row]])
+        if dedup.contains(digest):
+            continue
+        chunk.append(row)
+        statuses.append(status)
+        digests.append(digest)
+        queued += 1
+        if len(chunk) >= CATCHUP_CHUNK_ROWS:
+            put(bq_queue, RowChunk(batch.select(chunk), statuses, ingest_time, digests), liveness)
+            # Checkpoint after every full chunk, not only at the end of the read
+            put(bq_queue, CatchUpMark(key(row), False), liveness)
+            chunk, statuses, digests = [], [], []
+
+    if chunk:
+        put(bq_queue, RowChunk(batch.select(chunk), statuses, ingest_time, digests), liveness)
+    if newest is None:
+        return
+    high_water = key(newest)
+    # Only the newest line becomes a Reading, for Firestore
+    put_latest(fs_queue, batch.reading(newest, newest_status, ingest_time), fs_stats)
+    if queued:
+        put(bq_queue, CatchUpMark(high_water, queued >= CATCHUP_FLUSH_ROWS), liveness)
+
+def firestore_sink_stage(reading: Reading, fs_sink: LatestValueSink, coalescer: HeartbeatCoalescer) -> None:
+    """
+    Pipeline stage: writes status changes to Firestore immediately and
+    heartbeat-only updates at most once per FS_HEARTBEAT_PERIOD.
+
+    Parameters:
+        reading (Reading): The newest reading.
+        fs_sink (LatestValueSink): Firestore sink behind its circuit breaker.
+        coalescer (HeartbeatCoalescer): Heartbeat throttle.
+    """
+    global fs_latest
+    fs_latest = reading
+    # Until the document was read or fully written; not while the breaker refuses calls
+    if not fs_mirror_loaded and not fs_mirror.known and fs_sink.breaker.retry_after() == 0:
+        load_firestore_mirror()
+    changes = fs_mirror.diff(firestore_document(reading))
+    if coalescer.should_send(any(name != "PI_Timestamp" for name in changes)):
+        fs_sink.submit(reading)
+
+def firestore_tick(fs_sink: LatestValueSink, coalescer: HeartbeatCoalescer) -> float:
+    """
+    Timer hook of the Firestore stage: retries a buffered update, and refreshes
+    PI_Timestamp once a heartbeat is due even if no line arrived (e.g. the
+    machine is off and LOGGER.GAM is not growing).
+
+    Parameters:
+        fs_sink (LatestValueSink): Firestore sink behind its circuit breaker.
+        coalescer (HeartbeatCoalescer): Heartbeat throttle.
+
+    Returns:
+        float: Seconds until the next retry or heartbeat.
+    """
+    retry = fs_sink.tick()
+    if fs_latest is None or fs_sink.pending is not None:
+        return retry
+    if coalescer.time_until_due() <= 0:
+        # The newest reading again, read "now": only PI_Timestamp changes
+        firestore_sink_stage(Reading(fs_latest.timestamp, time.time(), fs_latest.values, fs_latest.status,
+                                     fs_latest.fields), fs_sink, coalescer)
+    return min(retry, coalescer.time_until_due())
+
+def store_chunk(chunk: RowChunk, bq_writer: BigQueryBatchWriter) -> bool:
+    """
+    Appends the rows of a chunk to the outbox, then records their line digests.
+
+    Parameters:
+        chunk (RowChunk): Rows of one read.
+        bq_writer (BigQueryBatchWriter): Batching writer for BigQuery rows.
+
+    Returns:
+        bool: True if the rows are stored, False if the append failed (e.g. disk full).
+    """
+    try:
+        bq_writer.add_many(chunk.batch.to_rows(chunk.statuses, chunk.ingest_time, STATIC_COLUMNS))
+    except Exception:
+        logging.exception("Could not store %d rows in the outbox", len(chunk.batch))
+        return False
+    for digest in chunk.digests:
+        dedup.add(digest)
+    return True
+
+def store_unstored(bq_writer: BigQueryBatchWriter) -> bool:
+    """
+    Retries, in order, the chunks whose append to the outbox failed.
+
+    Parameters:
+        bq_writer (BigQueryBatchWriter): Batching writer for BigQuery rows.
+
+    Returns:
+        bool: True once no chunk is waiting to be stored.
+    """
+    while unstored and store_chunk(unstored[0], bq_writer):
+        unstored.popleft()
+    return not unstored
+
+def bigquery_sink_stage(item: Any, bq_writer: BigQueryBatchWriter) -> None:
+    """
+    Pipeline stage: stores rows in the outbox, then records their line digests
+    and the checkpoint. A chunk whose append fails is kept and retried before
+    any newer chunk; until it is stored the checkpoint is held at the last line
+    before it, so a restart re-reads those lines instead of skipping them.
+
+    Parameters:
+        item (RowChunk or CatchUpMark): Rows of one read, or the marker closing the read.
+        bq_writer (BigQueryBatchWriter): Batching writer for BigQuery rows.
+    """
+    stored = store_unstored(bq_writer)
+    if isinstance(item, CatchUpMark):
+        if stored:
+            save_checkpoint(item.key)
+            dedup.persist()
+        else:
+            logging.error("Checkpoint held: %d chunks of rows are not in the outbox yet.", len(unstored))
+        if item.flush:
+            # Catch-up: send full batches back to back instead of waiting
+            bq_writer.flush("catch-up")
+        return
+    if not stored or not store_chunk(item, bq_writer):
+        unstored.append(item)
+
+def queue_backlog(reader: LogReader, line_queue: queue.Queue, liveness: Optional[Liveness] = None) -> None:
+    """
+    Queues lines that a rotation moved into LOGS_BKP.GAM before they were uploaded.
+    Runs at startup and whenever a read reports a rotation.
+
+    The two lines preceding the backlog are included as context for the Running /
+    Stopped status of the first backlog lines; they are skipped as already sent.
+    `high_water` may lag behind reads still in the parser queue; the extra lines
+    this includes are skipped by the parser, which sees them in order.
+
+    Parameters:
+        reader (LogReader): Reader for the USB drive.
+        line_queue (queue.Queue): Inbox of the parser stage.
+        liveness (Liveness or None): Progress tracker of the reader.
+    """
+    if high_water is None:
+        return
+    context = 0
+
+    def wanted(line: str) -> bool:
+        nonlocal context
+        key = line_key(line)
+        if key is not None and key > high_water and context == 0:
+            return True
+        context += 1
+        return context <= 2
+
+    try:
+        backlog: List[str] = reader.read_backlog(BACKUP_LOG_FILE_NAME, wanted)
+    except Exception:
+        logging.exception("Could not read %s", BACKUP_LOG_FILE_NAME)
+        return
+    if len(backlog) > 2:
+        logging.info("Catching up %d lines from %s.", len(backlog) - min(context, 2), BACKUP_LOG_FILE_NAME)
+    put(line_queue, TailResult(backlog, False), liveness)
+
+def make_breaker(name: str) -> CircuitBreaker:
+    """
+    Creates a circuit breaker for one sink from the configuration above.
+
+    Parameters:
+        name (str): Sink name used in log messages.
+
+    Returns:
+        CircuitBreaker: The breaker.
+    """
+    return CircuitBreaker(name, BREAKER_WINDOW, BREAKER_FAILURE_RATE, BREAKER_MIN_CALLS, BREAKER_OPEN_DURATION)
+
+def bigquery_tick(bq_writer: BigQueryBatchWriter) -> float:
+    """
+    Timer hook of the BigQuery stage: retries chunks the outbox could not store
+    and flushes an overdue batch.
+
+    Parameters:
+        bq_writer (BigQueryBatchWriter): Batching writer for BigQuery rows.
+
+    Returns:
+        float: Seconds until the stage should be woken again.
+    """
+    store_unstored(bq_writer)
+    bq_writer.maybe_flush()
+    return min(bq_writer.time_until_due(), WAKEUP_FALLBACK_INTERVAL)
+
+def log_pipeline_metrics(reader_stats: StageStats, stages: List[Stage]) -> None:
+    """
+    Logs queue depth, throughput and latency for every pipeline stage.
+
+    Parameters:
+        reader_stats (StageStats): Stats of the reader loop.
+        stages (list): The worker stages.
+    """
+    for snap in [reader_stats.snapshot()] + [stage.stats.snapshot() for stage in stages]:
+        logging.info("Stage %-9s depth %3d, items %5d, dropped %4d, latency mean %.3f s max %.3f s.",
+                     snap.name, snap.depth, snap.items, snap.dropped, snap.mean_latency, snap.max_latency)
+    logging.info("Dedup: %d of %d rows suppressed as duplicate inserts since start.", dedup.suppressed, dedup.checked)
+    logging.info("Firestore: %d writes, %d heartbeat writes avoided, %d fields written, %d unchanged fields skipped.",
+                 heartbeats.sent, heartbeats.avoided, fs_mirror.fields_written, fs_mirror.fields_skipped)
+    for calls in (bq_calls, fs_calls):
+        logging.info("Calls: %s.", calls)
+    logging.info("Access token: %d background refreshes, %d failed.", token_refresher.refreshes, token_refresher.failures)
+    if bq_row_errors:
+        logging.info("BigQuery row errors: %s; %d rows dead-lettered.",
+                     ", ".join(f"{reason} {count}" for reason, count in bq_row_errors.most_common()),
+                     dead_letters.rows_written)
+    logging.info("Parser: %s layout, %d unknown log headers since start.", log_format.name, log_formats.unknown_headers)
 
 def continuously_monitor(interval: int = 1) -> None:
     """
     Continuously monitors the LOGGER.GAM file for changes and processes new entries.
+    Each poll first checks the file's directory entry and skips the cycle when it
+    has not changed; otherwise only the bytes appended since the previous read are
+    fetched. With WAKEUP_MODE = "inotify" each cycle waits for the gadget to write
+    to the image instead of sleeping a fixed interval.
+
+    Reading, parsing, Firestore and BigQuery run as separate pipeline stages joined
+    by bounded queues, so a slow or failing sink no longer stalls the others.
+    Each sink has its own circuit breaker: while it is open, BigQuery rows wait in
+    the outbox and only the latest Firestore update is kept, instead of sleeping.
+    Every line newer than the persisted checkpoint is uploaded, including lines a
+    rotation moved into LOGS_BKP.GAM while the service was down; a large backlog
+    is flushed in full batches before falling back to live tailing.
+    Rows are committed to the on-disk outbox first and drained to BigQuery in
+    batches, so rows logged while offline or pending at a reboot are uploaded in
+    order once the network is back.
+    Startup waits for the USB image and LOGGER.GAM (readiness gates) instead of
+    a fixed delay and then reports READY to systemd. The cloud clients are
+    built in the background once the network gate is decided, so tailing starts
+    without waiting for the network or the client libraries.
+    Under WatchdogSec the systemd watchdog is pinged only while the reader, the
+    parser and both sinks make progress within their budgets.
+
+    Parameters:
+        interval (int): Time in seconds between each check of the log file when polling.
+    """
+    # Open the reader only once the image is usable; otherwise it would fall back to mtype
+    gates: ReadinessGates = start_readiness_gates()
+    gates.wait("image", "logger")
+    reader: LogReader = get_log_reader()
+    watcher: Optional[ImageWatcher] = make_image_watcher()
+    bq_writer = BigQueryBatchWriter(
+        send_to_bigquery, BQ_BATCH_MAX_ROWS, BQ_BATCH_MAX_BYTES, BQ_BATCH_MAX_LATENCY,
+        outbox=open_outbox(OUTBOX_FILE), breaker=make_breaker("bigquery"),
+    )
+    fs_sink = LatestValueSink(update_firestore, make_breaker("firestore"))
+
+    line_queue: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    fs_queue: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    bq_queue: queue.Queue = queue.Queue(maxsize=BQ_QUEUE_SIZE)
+    firestore_stage = Stage("firestore", fs_queue, lambda item: firestore_sink_stage(item, fs_sink, heartbeats),
+                            tick=lambda: firestore_tick(fs_sink, heartbeats), budget=FIRESTORE_BUDGET)
+    bigquery_stage = Stage("bigquery", bq_queue, lambda item: bigquery_sink_stage(item, bq_writer),
+                           tick=lambda: bigquery_tick(bq_writer), budget=BIGQUERY_BUDGET)
+    parser_stage = Stage("parser", line_queue,
+                         lambda lines: parse_stage(lines, fs_queue, bq_queue, firestore_stage.stats,
+                                                   parser_stage.liveness),
+                         budget=PARSER_BUDGET)
+    stages: List[Stage] = [parser_stage, firestore_stage, bigquery_stage]
+    # A catch-up flush sends many batches in one call; each batch counts as progress
+    bq_writer.progress = bigquery_stage.liveness.progress
+    for stage in stages:
+        stage.start()
+    reader_liveness = Liveness("reader", READER_BUDGET)
+    watchdog: Optional[Watchdog] = None
+    watchdog_period: Optional[float] = watchdog_interval()
+    sd_notify(f"READY=1\nSTATUS=Tailing {LOG_FILE} with the {reader.name} reader")
+    if watchdog_period:
+        # Ping at twice the rate systemd requires, and only while every stage makes progress
+        watchdog = Watchdog([reader_liveness] + [stage.liveness for stage in stages], watchdog_period / 2)
+        watchdog.start()
+
+    global high_water
+    high_water = load_checkpoint()
+    if high_water is None:
+        logging.info("No checkpoint found; starting from the newest line.")
+    else:
+        logging.info("Resuming after line %s (Minute ID %d, Counter %d).",
+                     high_water[0].strftime(LOG_TIMESTAMP_FORMAT), high_water[1], high_water[2])
+        # LOGS_BKP.GAM has no header: take the layout from LOGGER.GAM's header first
+        try:
+            detect_log_format(reader.read_lines()[:1])
+        except Exception:
+            logging.exception("Could not read the header of %s", LOG_FILE)
+        reader_liveness.begin()
+        queue_backlog(reader, line_queue, reader_liveness)
+        reader_liveness.end()
+
+    try:
+        read_loop(reader, watcher, line_queue, stages, interval, reader_liveness)
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
+        # Drain in pipeline order, then flush rows still buffered for BigQuery
+        parser_stage.stop(PIPELINE_STOP_TIMEOUT)
+        firestore_stage.stop(PIPELINE_STOP_TIMEOUT)
+        if bigquery_stage.stop(PIPELINE_STOP_TIMEOUT):
+            bq_writer.close()
+
+def read_loop(reader: LogReader, watcher: Optional[ImageWatcher], line_queue: queue.Queue,
+              stages: List[Stage], interval: int, liveness: Liveness) -> None:
+    """
+    Reader stage: feeds newly appended lines into the pipeline until the process is stopped.
+    Blocks when the parser queue is full, which pauses reading without losing lines.
 
     Parameters:
-        interval (int): Time in seconds between each check of the log file.
+        reader (LogReader): Reader for LOGGER.GAM.
+        watcher (ImageWatcher or None): inotify watcher, or None for fixed polling.
+        line_queue (queue.Queue): Inbox of the parser stage.
+        stages (list): The worker stages, for metrics.
+        interval (int): Polling interval in seconds when no watcher is available.
+        liveness (Liveness): Progress tracker of the reader, for the watchdog.
     """
-    global last_sent
-    last_three: deque = deque(maxlen=3)
+    reader_stats = StageStats("reader")
+    next_probe_report: float = time.monotonic() + PROBE_REPORT_INTERVAL
+    next_metrics_report: float = time.monotonic() + PIPELINE_REPORT_INTERVAL
+    reported_hits, reported_misses = reader.probe_counters()
     
     while True:
+        liveness.begin()
         try:
-            lines: List[str] = get_log_lines()
-            last_three.clear()
-            for line in lines:
-                last_three.append(line)
-            
-            if len(last_three) == 3:
-                third_last, _, last = last_three
-                try:
-                    last_digit: int = int(last.strip().split(";")[-2])
-                    third_last_digit: int = int(third_last.strip().split(";")[-2])
-                    status: str = "Running" if last_digit != third_last_digit and last_digit != 0 else "Stopped"
-                    last_with_status: str = f"{last.strip()};{status}"
-                    previous_status: Optional[str] = last_sent.get('Status') if last_sent is not None else None
-                    data: Optional[Dict[str, Any]] = parse_log_line(last_with_status)
-                    if data:
-                        update_firestore(data, previous_status)
-                        if data == last_sent:
-                            continue
-                        send_to_bigquery(data)
-                        last_sent = data
-                except (ValueError, IndexError) as e:
-                    logging.error("Line processing error: %s", e)
+            now = time.monotonic()
+            if now >= next_probe_report:
+                hits, misses = reader.probe_counters()
+                logging.info("Change probe: %d unchanged polls skipped, %d full reads in the last %d s.",
+                             hits - reported_hits, misses - reported_misses, PROBE_REPORT_INTERVAL)
+                reported_hits, reported_misses = hits, misses
+                next_probe_report += PROBE_REPORT_INTERVAL
+            if now >= next_metrics_report:
+                log_pipeline_metrics(reader_stats, stages)
+                next_metrics_report += PIPELINE_REPORT_INTERVAL
+
+            # Unchanged directory entry: nothing new to read, parse or upload
+            if reader.has_changed():
+                start = time.monotonic()
+                new_lines: TailResult = get_new_log_lines()
+                reader_stats.record(time.monotonic() - start)
+                if new_lines.rotated:
+                    # Lines appended since the last read were moved into LOGS_BKP.GAM; queue them
+                    # first, or the new file's lines would move the high-water mark past them
+                    queue_backlog(reader, line_queue, liveness)
+                if new_lines.lines or new_lines.rotated:
+                    put(line_queue, new_lines, liveness)
         except Exception as e:
             logging.exception("Monitoring error")
-        time.sleep(interval)
+        liveness.end()
+        wait_for_next_cycle(watcher, interval)
+
+def replay_log_file(path: str) -> None:
+    """
+    Uploads every line of a saved LOGGER.GAM / LOGS_BKP.GAM copy (historical
+    replay), then exits. The file is parsed in one batch; lines already handed to
+    the outbox (per the dedup file) are skipped and the checkpoint is left alone.
+    Rows that cannot be sent stay in the outbox for the service to upload.
+    Stop the service while replaying.
+
+    Parameters:
+        path (str): Local path of the log file to replay.
+    """
+    with open(path, "rb") as f:
+        lines: List[str] = split_buffer(f.read())
+    start = time.monotonic()
+    detect_log_format(lines)
+    batch: LogBatch = parse_log_batch(lines, LOCAL_TZ, log_format, time_format=LOG_TIMESTAMP_FORMAT)
+    logging.info("Parsed %d lines of %s in %.2f s (%d rejected).",
+                 len(batch), path, time.monotonic() - start, len(batch.rejects))
+    log_rejects(batch, path)
+
+    # No readiness gates here: start building the clients while the rows are appended
+    clients.start()
+    bq_writer = BigQueryBatchWriter(
+        send_to_bigquery, BQ_BATCH_MAX_ROWS, BQ_BATCH_MAX_BYTES, BQ_BATCH_MAX_LATENCY,
+        outbox=open_outbox(OUTBOX_FILE),
+    )
+    counters = batch.column("Counter")
+    ingest_time: float = time.time()
+    queued = 0
+    chunk: List[int] = []
+    statuses: List[str] = []
+    digests: List[bytes] = []
+
+    def append_chunk() -> None:
+        # Rows go from the columns to the outbox in one transaction per chunk;
+        # digests are recorded once the rows are stored
+        bq_writer.add_many(batch.select(chunk).to_rows(statuses, ingest_time, STATIC_COLUMNS))
+        for digest in digests:
+            dedup.add(digest)
+        chunk.clear()
+        statuses.clear()
+        digests.clear()
+
+    try:
+        # The first two lines only provide the Running / Stopped context
+        for row in range(2, len(batch)):
+            digest: bytes = line_digest(lines[batch.line_numbers[row]])
+            if dedup.contains(digest):
+                continue
+            counter = int(counters[row])
+            chunk.append(row)
+            statuses.append(line_status(counter, int(counters[row - 2])))
+            digests.append(digest)
+            queued += 1
+            if len(chunk) >= CATCHUP_CHUNK_ROWS:
+                append_chunk()
+        append_chunk()
+    finally:
+        bq_writer.close()
+        dedup.persist()
+    logging.info("Replayed %d rows from %s (%d already sent, %d sent now, %d left in the outbox).",
+                 queued, path, max(0, len(batch) - 2) - queued, bq_writer.rows_sent,
+                 bq_writer.outbox.pending_rows)
+
+def reconcile_checkpoint() -> None:
+    """
+    Moves the checkpoint forward to the newest row in BigQuery, then exits. For
+    a Pi whose checkpoint was lost or is behind (e.g. after replacing the SD
+    card): without it, the service would upload only the newest line, or resend
+    lines BigQuery already holds. A checkpoint already at or past that row is
+    left alone. Stop the service while reconciling.
+    """
+    clients.start()
+    row = get_latest_sent()
+    if row is None:
+        logging.info("No row in BigQuery for %s in the last %d days; checkpoint left alone.",
+                     MACHINE_NAME, RECONCILE_LOOKBACK_DAYS)
+        return
+    key = (row["Timestamp"].astimezone(LOCAL_TZ).replace(tzinfo=None), int(row["Minute ID"]), int(row["Counter"]))
+    local = load_checkpoint()
+    if local is not None and local >= key:
+        logging.info("Checkpoint (line %s) is already at or past BigQuery's newest row.",
+                     local[0].strftime(LOG_TIMESTAMP_FORMAT))
+        return
+    save_checkpoint(key)
+    logging.info("Checkpoint moved to BigQuery's newest row: line %s, Minute ID %d, Counter %d.",
+                 key[0].strftime(LOG_TIMESTAMP_FORMAT), key[1], key[2])
+
+def profile_startup() -> None:
+    """
+    Runs the startup path once without uploading anything and prints how long
+    each step took, counted from the first import of this script: imports,
+    module setup, the readiness gates, opening the reader, the first read and
+    parse of LOGGER.GAM, and building the cloud clients in the background.
+    Stop the service first.
+    """
+    gates: ReadinessGates = start_readiness_gates()
+    gates.wait("image", "logger")
+    reader: LogReader = get_log_reader()
+    mark_startup(f"{reader.name} reader opened")
+    new_lines: TailResult = get_new_log_lines()
+    mark_startup(f"first read ({len(new_lines.lines)} lines)")
+    detect_log_format(new_lines.lines[:1])
+    batch: LogBatch = parse_log_batch(new_lines.lines, LOCAL_TZ, log_format, time_format=LOG_TIMESTAMP_FORMAT)
+    mark_startup(f"first parse ({len(batch)} rows)")
+    gates.wait("network")
+    try:
+        clients.get(timeout=60.0)
+    except Exception as e:
+        print(f"Cloud clients failed: {e}")
+    previous = 0.0
+    for step, seconds in sorted(startup_marks, key=lambda mark: mark[1]):
+        print(f"{seconds:8.3f} s  (+{seconds - previous:6.3f} s)  {step}")
+        previous = seconds
 
 # ============================
 #         Main Execution
 # ============================
 if __name__ == "__main__":
-    last_sent: Optional[Dict[str, Any]] = get_latest_sent()
-    continuously_monitor()
+    parser = argparse.ArgumentParser(description="Upload LOGGER.GAM readings to BigQuery and Firestore.")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="upload every line of a saved LOGGER.GAM / LOGS_BKP.GAM copy, then exit")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="move the checkpoint forward to the newest row in BigQuery, then exit")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long imports, the first log read and client setup take, then exit")
+    args = parser.parse_args()
+
+    # Turn systemd's SIGTERM into SystemExit so buffered rows are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.profile_startup:
+        profile_startup()
+    elif args.replay:
+        replay_log_file(args.replay)
+    elif args.reconcile:
+        reconcile_checkpoint()
+    else:
+        continuously_monitor()
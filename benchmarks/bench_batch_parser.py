@@ -0,0 +1,89 @@
+# benchmarks/bench_batch_parser.py
+"""
+Parses a synthetic LOGGER.GAM backlog line by line (split, float()/int() per
+field and one record per line, as the monitor did before) and with the columnar
+batch parser, and reports the throughput of both, end to end to the BigQuery
+JSON rows the sink sends. The batch time is split into building the columns and
+building the rows from them.
+
+    python3 benchmarks/bench_batch_parser.py --lines 1000000 --bad-every 10000
+"""
+import os
+import sys
+import time
+import argparse
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gam_parser import G250_FIELDS, Reading, parse_log_batch, split_buffer  # noqa: E402
+
+HEADER = b"GAMA LOG TYPE: G-250 H D;VERSION: 090617;METRIC: N\r\n"
+LOCAL_TZ = ZoneInfo("America/Toronto")
+STATIC = {"Machine": "G-250", "Location": "Main St", "Location Name": "Plant"}
+
+
+def synthetic_log(lines: int, bad_every: int) -> bytes:
+    """Builds a log with one line every 2 s and a malformed line every `bad_every` lines."""
+    start = datetime(2025, 3, 2).timestamp()
+    out = [HEADER]
+    for i in range(lines):
+        stamp = datetime.fromtimestamp(start + 2 * i).strftime("%m-%d-%Y %H:%M:%S")
+        iso = "8x2" if bad_every and i % bad_every == bad_every - 1 else "82"
+        out.append(f"{stamp};{91597 + i // 30};{iso};80;90;88;81;69;500;1;0;0;{620 + i % 7};770;{940 + i};0\r\n"
+                   .encode())
+    return b"".join(out)
+
+
+def parse_per_line(lines: List[str]) -> List[Dict[str, Any]]:
+    """Former path: one split, 16 conversions, one record and one row per line."""
+    rows = []
+    for line in lines:
+        values = line.split(";")
+        if len(values) < 16:
+            continue
+        try:
+            stamp = values[0]
+            device_time = datetime(int(stamp[6:10]), int(stamp[0:2]), int(stamp[3:5]), int(stamp[11:13]),
+                                   int(stamp[14:16]), int(stamp[17:19]), tzinfo=LOCAL_TZ)
+            reading = Reading(device_time.timestamp(), 0.0,
+                              array("d", [field.kind(values[field.index]) for field in G250_FIELDS]), "Running")
+            rows.append(reading.to_row(STATIC))
+        except ValueError:
+            pass
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--bad-every", type=int, default=10_000, help="0 for no malformed lines")
+    args = parser.parse_args()
+
+    data = synthetic_log(args.lines, args.bad_every)
+    lines = split_buffer(data)
+    print(f"synthetic log: {args.lines} lines, {len(data) / 1e6:.1f} MB")
+
+    start = time.perf_counter()
+    expected = parse_per_line(lines)
+    per_line = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = parse_log_batch(lines, LOCAL_TZ)
+    columns = time.perf_counter() - start
+    rows = batch.to_rows(["Running"] * len(batch), 0.0, STATIC)
+    batched = time.perf_counter() - start
+
+    assert rows == expected, "rows differ"
+    if args.bad_every:
+        assert len(batch.rejects) == args.lines // args.bad_every, "rejects missing"
+    print(f"per line: {per_line:.2f} s ({args.lines / per_line:,.0f} lines/s)")
+    print(f"batch:    {batched:.2f} s ({args.lines / batched:,.0f} lines/s), of which columns {columns:.2f} s, "
+          f"{len(batch.rejects)} rejected, first at line {batch.rejects[0].line_number if batch.rejects else '-'}")
+
+
+if __name__ == "__main__":
+    main()
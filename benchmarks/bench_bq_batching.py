@@ -0,0 +1,84 @@
+# benchmarks/bench_bq_batching.py
+"""
+Replays one row every 2 s against a stand-in BigQuery endpoint and reports how
+many insert requests the batching writer makes compared to one row per request.
+
+    python3 benchmarks/bench_bq_batching.py --hours 1 --max-latency 5
+"""
+import os
+import sys
+import argparse
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gcp_sinks import BigQueryBatchWriter  # noqa: E402
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeBigQueryClient:
+    """Stand-in for bigquery.Client that records insert_rows_json calls."""
+
+    def __init__(self) -> None:
+        self.requests: List[List[Dict[str, Any]]] = []
+
+    def insert_rows_json(self, table_id: str, rows: List[Dict[str, Any]]) -> list:
+        self.requests.append(list(rows))
+        return []
+
+
+def sample_row(i: int) -> Dict[str, Any]:
+    return {
+        "Timestamp": f"2025-03-02T17:{(i // 30) % 60:02d}:{(i * 2) % 60:02d}+00:00",
+        "Minute ID": 91597 + i // 30, "ISO Temp Real": 82.0, "ISO Temp Set": 80.0,
+        "RESIN Temp Real": 90.0, "RESIN Temp Set": 88.0, "HOSE Temp Real": 81.0,
+        "HOSE Temp Set": 69.0, "Value8": 500.0, "Value9": 1.0, "ISO Amperage": 0.0,
+        "RESIN Amperage": 0.0, "ISO Pressure": 620.0, "RESIN Pressure": 770.0,
+        "Counter": 940 + i, "Value15": 0.0, "Status": "Running",
+        "Machine": "UIP 1 [G50-H] - Coteau", "Location": "POINT(-74.1771 45.3053)",
+        "Location Name": "Coteau-du-Lac",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--period", type=float, default=2.0, help="seconds between log lines")
+    parser.add_argument("--max-rows", type=int, default=500)
+    parser.add_argument("--max-bytes", type=int, default=1_000_000)
+    parser.add_argument("--max-latency", type=float, default=5.0)
+    args = parser.parse_args()
+
+    clock = FakeClock()
+    client = FakeBigQueryClient()
+    writer = BigQueryBatchWriter(
+        lambda rows: [error["index"] for error in client.insert_rows_json("project.dataset.table", rows)],
+        args.max_rows, args.max_bytes, args.max_latency, clock=clock,
+    )
+    total = int(args.hours * 3600 / args.period)
+    for i in range(total):
+        clock.now = i * args.period
+        writer.maybe_flush()
+        writer.add(sample_row(i))
+    clock.now = total * args.period
+    writer.close()
+
+    assert sum(len(r) for r in client.requests) == total, "rows lost"
+    assert all(len(r) <= args.max_rows for r in client.requests), "row limit exceeded"
+    worst = max(m.latency for m in writer.recent)
+    print(f"rows: {total}, requests: {len(client.requests)} (unbatched: {total}), "
+          f"mean rows/batch: {total / len(client.requests):.1f}, "
+          f"worst wait: {worst:.1f} s, final flush: {writer.recent[-1].reason}")
+
+
+if __name__ == "__main__":
+    main()
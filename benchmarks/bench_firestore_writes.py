@@ -0,0 +1,109 @@
+# benchmarks/bench_firestore_writes.py
+"""
+Replays one reading every 2 s against a stand-in Firestore document and counts
+the writes and fields sent, comparing the former "set() on status change,
+update() otherwise" logic with the mirrored, field-masked and coalesced writer.
+
+    python3 benchmarks/bench_firestore_writes.py --hours 24 --change-every 1800
+"""
+import os
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gcp_sinks import DocumentMirror, HeartbeatCoalescer, status_fields  # noqa: E402
+
+LOCATION = "Coteau-du-Lac"
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeDocument:
+    """Stand-in for a Firestore DocumentReference that records every write."""
+
+    def __init__(self) -> None:
+        self.data: Dict[str, Any] = {}
+        self.writes: List[Tuple[str, int]] = []
+
+    def set(self, fields: Dict[str, Any], merge: bool = False) -> None:
+        self.data = {**self.data, **fields} if merge else dict(fields)
+        self.writes.append(("set", len(fields)))
+
+    def update(self, fields: Dict[str, Any]) -> None:
+        if not self.data:
+            raise KeyError("update() of a missing document")
+        self.data.update(fields)
+        self.writes.append(("update", len(fields)))
+
+
+def readings(hours: float, period: float, change_every: int):
+    """Yields (seconds, device time, status); the status flips every `change_every` readings."""
+    start = datetime(2025, 3, 2, tzinfo=timezone.utc)
+    for i in range(int(hours * 3600 / period)):
+        status = "Running" if (i // change_every) % 2 == 0 else "Stopped"
+        yield i * period, start + timedelta(seconds=i * period), status
+
+
+def former(args: argparse.Namespace) -> FakeDocument:
+    doc = FakeDocument()
+    previous = None
+    for _, ts, status in readings(args.hours, args.period, args.change_every):
+        if previous != status:
+            doc.set({"Location": LOCATION, "Status": status, "Timestamp": ts, "PI_Timestamp": ts})
+        else:
+            doc.update({"PI_Timestamp": ts})
+        previous = status
+    return doc
+
+
+def mirrored(args: argparse.Namespace) -> Tuple[FakeDocument, DocumentMirror, HeartbeatCoalescer]:
+    doc = FakeDocument()
+    mirror = DocumentMirror()
+    clock = FakeClock()
+    heartbeats = HeartbeatCoalescer(args.heartbeat, 0.2, clock=clock, rng=random.Random(0))
+    for seconds, ts, status in readings(args.hours, args.period, args.change_every):
+        clock.now = seconds
+        desired = status_fields(mirror, LOCATION, status, ts, ts)
+        changes = mirror.diff(desired)
+        if not heartbeats.should_send(any(name != "PI_Timestamp" for name in changes)):
+            continue
+        if mirror.known:
+            doc.update(changes)
+        else:
+            doc.set(changes, merge=True)
+        mirror.apply(changes, len(desired) - len(changes))
+        assert doc.data == mirror.fields, "mirror diverged from the document"
+    return doc, mirror, heartbeats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--period", type=float, default=2.0, help="seconds between readings")
+    parser.add_argument("--change-every", type=int, default=1800, help="readings between status changes")
+    parser.add_argument("--heartbeat", type=float, default=60.0, help="FS_HEARTBEAT_PERIOD in seconds")
+    args = parser.parse_args()
+
+    before = former(args)
+    after, mirror, heartbeats = mirrored(args)
+    assert after.data["Status"] == before.data["Status"], "final status differs"
+    assert after.data["Timestamp"] == before.data["Timestamp"], "status change time differs"
+    print(f"former:   {len(before.writes)} writes, {sum(n for _, n in before.writes)} fields")
+    print(f"mirrored: {len(after.writes)} writes, {sum(n for _, n in after.writes)} fields "
+          f"({heartbeats.avoided} heartbeats avoided, {mirror.fields_skipped} unchanged fields skipped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/bench_gcp_transport.py
+"""
+Compares the official google-cloud clients with the lean REST transport
+(gcp_clients.py): time to import and build both clients, resident memory, and
+the time for a series of insertAll calls and Firestore document updates.
+
+All calls go to a local HTTP stand-in for the BigQuery and Firestore REST APIs
+started by this script, so no network or credentials are needed:
+
+    python3 benchmarks/bench_gcp_transport.py --calls 200
+
+Each transport runs in a fresh interpreter so imports and RSS are not shared.
+The official Firestore client speaks gRPC, which the stand-in does not serve;
+for it only the client construction is measured. Reads VmRSS from /proc
+(Linux only). What the REST transport sends is checked by
+tests/test_gcp_transport.py, not here.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+PROJECT_ID = "bench-project"
+TABLE = f"{PROJECT_ID}.bench_dataset.bench_table"
+
+
+def rss_kib() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmRSS not found")
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Answers insertAll, documents:commit and document GETs like the real APIs."""
+
+    protocol_version = "HTTP/1.1"   # keep-alive, as the Google front ends do
+    documents = {}
+
+    def reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.split("?")[0].endswith("/insertAll"):
+            self.reply(200, {"kind": "bigquery#tableDataInsertAllResponse"})
+        elif self.path.endswith("/documents:commit"):
+            for write in request["writes"]:
+                document = self.documents.setdefault(write["update"]["name"], {})
+                document.update(write["update"]["fields"])
+            self.reply(200, {"writeResults": [{}], "commitTime": datetime.now(timezone.utc).isoformat()})
+        else:
+            self.reply(404, {"error": {"code": 404, "message": self.path}})
+
+    def do_GET(self) -> None:
+        name = unquote(self.path.split("/v1/", 1)[-1])
+        if name in self.documents:
+            self.reply(200, {"name": name, "fields": self.documents[name]})
+        else:
+            self.reply(404, {"error": {"code": 404, "message": "not found"}})
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def measure(transport: str, url: str, calls: int) -> None:
+    from google.auth.credentials import AnonymousCredentials
+    from gcp_clients import make_clients
+
+    before = rss_kib()
+    start = time.perf_counter()
+    bigquery_client, firestore_client = make_clients(transport, PROJECT_ID, AnonymousCredentials(),
+                                                     bigquery_endpoint=url, firestore_endpoint=url)
+    startup = time.perf_counter() - start
+    after_startup = rss_kib()
+
+    row = {"Timestamp": "2025-03-02T17:00:09+00:00", "Minute ID": 91597, "Counter": 949, "Status": "Running"}
+    start = time.perf_counter()
+    for i in range(calls):
+        bigquery_client.insert_rows_json(TABLE, [row], row_ids=[str(i)], timeout=10.0, retry=None)
+    inserts = time.perf_counter() - start
+
+    updates = "n/a (gRPC)"
+    if transport == "rest":
+        doc_ref = firestore_client.collection("bench").document("machine")
+        doc_ref.set({"Status": "Running"}, merge=True, timeout=10.0)
+        start = time.perf_counter()
+        for _ in range(calls):
+            doc_ref.update({"PI_Timestamp": datetime.now(timezone.utc)}, timeout=10.0)
+        updates = f"{(time.perf_counter() - start) * 1000 / calls:.2f} ms/update"
+
+    print(f"{transport:8s} import + build: {startup:.2f} s, RSS: +{(after_startup - before) / 1024:.1f} MiB "
+          f"(total {rss_kib() / 1024:.1f} MiB), insertAll: {inserts * 1000 / calls:.2f} ms/call, Firestore: {updates}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--transport", choices=["official", "rest"], help="measure one transport in this process")
+    parser.add_argument("--url", help="stand-in URL (set by the parent process)")
+    args = parser.parse_args()
+
+    if args.transport:
+        measure(args.transport, args.url, args.calls)
+        return
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for transport in ("official", "rest"):
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--calls", str(args.calls),
+                            "--transport", transport, "--url", url], check=False)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# benchmarks/bench_log_reader.py
+"""
+Compares the per-poll cost of the LOGGER.GAM reader backends.
+
+Run on the Pi (mtools configured, image present):
+    python3 benchmarks/bench_log_reader.py --polls 200
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gam_image import LogReader, make_log_reader  # noqa: E402
+
+
+def time_polls(reader: LogReader, polls: int) -> List[float]:
+    """
+    Times repeated full reads of the log file.
+
+    Parameters:
+        reader (LogReader): Backend under test.
+        polls (int): Number of reads to perform.
+
+    Returns:
+        List[float]: Duration of each read in milliseconds.
+    """
+    durations: List[float] = []
+    for _ in range(polls):
+        start = time.perf_counter()
+        reader.read_lines()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log-file", default="p:/LOGGER.GAM", help="mtools path of the log file")
+    parser.add_argument("--image", default=None, help="image file (defaults to the one in mtools.conf)")
+    parser.add_argument("--polls", type=int, default=100, help="reads per backend")
+    args = parser.parse_args()
+
+    for backend in ("mtype", "fat32"):
+        # No silent fallback: a "fat32" figure must come from the FAT32 reader
+        reader = make_log_reader(backend, args.log_file, args.image, fallback=False)
+        lines = len(reader.read_lines())
+        durations = time_polls(reader, args.polls)
+        reader.close()
+        print(f"{reader.name:>6}: {lines} lines, "
+              f"mean {statistics.mean(durations):.3f} ms, "
+              f"p50 {statistics.median(durations):.3f} ms, "
+              f"max {max(durations):.3f} ms per poll")
+
+
+if __name__ == "__main__":
+    main()
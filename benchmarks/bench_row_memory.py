@@ -0,0 +1,96 @@
+# benchmarks/bench_row_memory.py
+"""
+Measures the resident memory of an in-memory backlog of parsed rows, comparing
+the former 20-key dict per line with the compact Reading record.
+
+    python3 benchmarks/bench_row_memory.py --rows 100000
+
+Each representation is built in a fresh interpreter so the RSS figures do not
+include memory freed by the other run. Reads VmRSS from /proc (Linux only).
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gam_parser import G250_FIELDS, Reading  # noqa: E402
+
+LOCAL_TZ = ZoneInfo("America/Toronto")
+STATIC_COLUMNS: Dict[str, Any] = {
+    "Machine": "UIP 1 [G50-H] - Coteau",
+    "Location": "POINT(-74.1771 45.3053)",
+    "Location Name": "Coteau-du-Lac",
+}
+
+
+def rss_kib() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmRSS not found")
+
+
+def sample_line(i: int) -> str:
+    return (f"03-02-2025 {(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d};{91597 + i // 30};82;80;90;88;81;69;"
+            f"500;1;0;0;{620 + i % 7};770;{940 + i};0;Running")
+
+
+def as_dict(values: List[str], ingest_time: float) -> Dict[str, Any]:
+    """The row layout used before Reading: every column stored in every row."""
+    device_time = datetime(int(values[0][6:10]), int(values[0][0:2]), int(values[0][3:5]),
+                           int(values[0][11:13]), int(values[0][14:16]), int(values[0][17:19]), tzinfo=LOCAL_TZ)
+    row: Dict[str, Any] = {
+        "Timestamp": device_time.astimezone(timezone.utc).isoformat(),
+        "Ingest Timestamp": datetime.fromtimestamp(ingest_time, timezone.utc).isoformat(),
+    }
+    for field in G250_FIELDS:
+        row[field.name] = field.kind(values[field.index])
+    row["Status"] = values[16]
+    row.update(STATIC_COLUMNS)
+    return row
+
+
+def as_reading(values: List[str], ingest_time: float) -> Reading:
+    device_time = datetime(int(values[0][6:10]), int(values[0][0:2]), int(values[0][3:5]),
+                           int(values[0][11:13]), int(values[0][14:16]), int(values[0][17:19]), tzinfo=LOCAL_TZ)
+    return Reading(device_time.timestamp(), ingest_time,
+                   array("d", [field.kind(values[field.index]) for field in G250_FIELDS]), values[16])
+
+
+def measure(mode: str, rows: int) -> None:
+    build = as_dict if mode == "dict" else as_reading
+    lines = [sample_line(i).split(";") for i in range(rows)]
+    before = rss_kib()
+    start = time.perf_counter()
+    backlog = [build(values, 1_740_000_000.0 + i) for i, values in enumerate(lines)]
+    elapsed = time.perf_counter() - start
+    grown = rss_kib() - before
+    if mode == "reading":
+        assert backlog[0].to_row(STATIC_COLUMNS) == as_dict(lines[0], 1_740_000_000.0), "row mismatch"
+    print(f"{mode:8s} rows: {len(backlog)}, RSS growth: {grown / 1024:.1f} MiB "
+          f"({grown * 1024 / len(backlog):.0f} bytes/row), build: {elapsed:.2f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--mode", choices=["dict", "reading"], help="measure one representation in this process")
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args.mode, args.rows)
+        return
+    for mode in ("dict", "reading"):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--rows", str(args.rows), "--mode", mode], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,734 @@
+# /home/pi/gam_image.py
+"""
+In-process access to LOGGER.GAM inside the USB gadget image (/piusb.bin).
+
+The image is a plain FAT32 filesystem that the host machine writes to through
+the mass-storage gadget. Instead of spawning `mtype` every poll, this module
+opens the image once, parses the boot sector and walks the FAT directly.
+The `mtype` path is kept as a fallback backend behind the same interface.
+"""
+import os
+import re
+import time
+import ctypes
+import select
+import struct
+import logging
+import subprocess
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+# ============================
+#         Configuration
+# ============================
+MTOOLS_CONF: str = "/etc/mtools.conf"      # System-wide mtools configuration
+DEFAULT_IMAGE_FILE: str = "/piusb.bin"     # Image used when mtools.conf has no drive entry
+DEFAULT_DRIVE: str = "p"                   # mtools drive letter mapped to the image
+
+DIR_ENTRY_SIZE: int = 32
+ATTR_LONG_NAME: int = 0x0F
+ATTR_VOLUME_ID: int = 0x08
+ATTR_DIRECTORY: int = 0x10
+FAT32_EOC: int = 0x0FFFFFF8                # Any FAT entry >= this marks end of chain
+FAT32_MASK: int = 0x0FFFFFFF
+
+IN_MODIFY: int = 0x00000002                # inotify: file was modified
+IN_CLOSE_WRITE: int = 0x00000008           # inotify: writable file was closed
+
+
+class Fat32Error(Exception):
+    """Raised when the image is not a readable FAT32 filesystem."""
+
+
+class TailResult(NamedTuple):
+    """Outcome of one incremental read of the log file."""
+    lines: List[str]       # Complete lines appended since the previous read
+    rotated: bool          # True if the file was truncated or replaced since then
+
+
+class DirEntry(NamedTuple):
+    """A short-name (8.3) directory entry as stored on disk."""
+    name: str              # Display name, e.g. "LOGGER.GAM"
+    attributes: int
+    first_cluster: int
+    size: int
+    write_time: int        # Raw FAT time word
+    write_date: int        # Raw FAT date word
+    offset: int            # Absolute byte offset of the entry inside the image
+
+
+# ============================
+#     Function Definitions
+# ============================
+
+def image_path_from_mtools_conf(drive: str = DEFAULT_DRIVE, conf_path: str = MTOOLS_CONF) -> str:
+    """
+    Resolves the image file behind an mtools drive letter.
+
+    Parameters:
+        drive (str): mtools drive letter (without the colon).
+        conf_path (str): Path to the mtools configuration file.
+
+    Returns:
+        str: The configured image path, or DEFAULT_IMAGE_FILE if not found.
+    """
+    pattern = re.compile(r'^\s*drive\s+' + re.escape(drive) + r'\s*:\s*file\s*=\s*"([^"]+)"', re.IGNORECASE)
+    try:
+        with open(conf_path, "r") as conf:
+            for line in conf:
+                match = pattern.match(line)
+                if match:
+                    return match.group(1)
+    except OSError as e:
+        logging.debug("Could not read %s: %s", conf_path, e)
+    return DEFAULT_IMAGE_FILE
+
+
+def to_short_name(file_name: str) -> bytes:
+    """
+    Converts a file name such as "LOGGER.GAM" into its padded 11-byte 8.3 form.
+
+    Parameters:
+        file_name (str): File name with optional extension.
+
+    Returns:
+        bytes: The 11-byte name as stored in a FAT directory entry.
+    """
+    base, _, ext = file_name.upper().partition(".")
+    return (base[:8].ljust(8) + ext[:3].ljust(3)).encode("ascii")
+
+
+class Fat32Image:
+    """
+    Read-only view of a FAT32 image file kept open for the lifetime of the process.
+
+    Reads go through os.pread on a single descriptor, so every call observes the
+    bytes the gadget most recently wrote without reopening the file.
+    """
+
+    def __init__(self, image_path: str):
+        self.image_path = image_path
+        self.fd: int = os.open(image_path, os.O_RDONLY)
+        try:
+            self._parse_boot_sector()
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def _parse_boot_sector(self) -> None:
+        boot = os.pread(self.fd, 512, 0)
+        if len(boot) < 512 or boot[510:512] != b"\x55\xaa":
+            raise Fat32Error(f"{self.image_path}: missing boot sector signature")
+        (self.bytes_per_sector, self.sectors_per_cluster, reserved_sectors,
+         num_fats) = struct.unpack_from("<HBHB", boot, 11)
+        fat_size_16 = struct.unpack_from("<H", boot, 22)[0]
+        fat_size_32 = struct.unpack_from("<I", boot, 36)[0]
+        self.root_cluster: int = struct.unpack_from("<I", boot, 44)[0]
+        if fat_size_16 != 0 or fat_size_32 == 0 or self.bytes_per_sector == 0 or self.sectors_per_cluster == 0:
+            raise Fat32Error(f"{self.image_path}: not a FAT32 filesystem")
+        self.cluster_size: int = self.bytes_per_sector * self.sectors_per_cluster
+        self.fat_offset: int = reserved_sectors * self.bytes_per_sector
+        self.data_offset: int = (reserved_sectors + num_fats * fat_size_32) * self.bytes_per_sector
+
+    def close(self) -> None:
+        """Closes the underlying file descriptor."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def cluster_offset(self, cluster: int) -> int:
+        """
+        Returns the absolute byte offset of a data cluster.
+
+        Parameters:
+            cluster (int): Cluster number (>= 2).
+
+        Returns:
+            int: Byte offset of the cluster inside the image.
+        """
+        return self.data_offset + (cluster - 2) * self.cluster_size
+
+    def next_cluster(self, cluster: int) -> Optional[int]:
+        """
+        Looks up the FAT entry for a cluster.
+
+        Parameters:
+            cluster (int): Current cluster number.
+
+        Returns:
+            int or None: The next cluster in the chain, or None at end of chain.
+        """
+        raw = os.pread(self.fd, 4, self.fat_offset + cluster * 4)
+        value = struct.unpack("<I", raw)[0] & FAT32_MASK
+        if value >= FAT32_EOC or value < 2:
+            return None
+        return value
+
+    def cluster_chain(self, first_cluster: int, limit: Optional[int] = None) -> List[int]:
+        """
+        Follows a cluster chain through the FAT.
+
+        Parameters:
+            first_cluster (int): First cluster of the file or directory.
+            limit (int or None): Stop after this many clusters.
+
+        Returns:
+            List[int]: Cluster numbers in file order.
+        """
+        chain: List[int] = []
+        cluster: Optional[int] = first_cluster if first_cluster >= 2 else None
+        seen = set()
+        while cluster is not None and cluster not in seen:
+            chain.append(cluster)
+            seen.add(cluster)
+            if limit is not None and len(chain) >= limit:
+                break
+            cluster = self.next_cluster(cluster)
+        return chain
+
+    def find_entry(self, file_name: str) -> Optional[DirEntry]:
+        """
+        Searches the root directory for a file by its 8.3 name.
+
+        Parameters:
+            file_name (str): File name such as "LOGGER.GAM".
+
+        Returns:
+            DirEntry or None: The matching entry, or None if the file is absent.
+        """
+        wanted = to_short_name(file_name)
+        for cluster in self.cluster_chain(self.root_cluster):
+            base = self.cluster_offset(cluster)
+            block = os.pread(self.fd, self.cluster_size, base)
+            for pos in range(0, len(block), DIR_ENTRY_SIZE):
+                first = block[pos]
+                if first == 0x00:
+                    return None
+                if first == 0xE5:
+                    continue
+                attributes = block[pos + 11]
+                if attributes == ATTR_LONG_NAME or attributes & (ATTR_VOLUME_ID | ATTR_DIRECTORY):
+                    continue
+                if block[pos:pos + 11] == wanted:
+                    return self.decode_entry(block[pos:pos + DIR_ENTRY_SIZE], base + pos, file_name.upper())
+        return None
+
+    def read_entry(self, offset: int) -> bytes:
+        """
+        Reads the raw 32 bytes of a directory entry.
+
+        Parameters:
+            offset (int): Absolute byte offset of the entry.
+
+        Returns:
+            bytes: The raw directory entry.
+        """
+        return os.pread(self.fd, DIR_ENTRY_SIZE, offset)
+
+    @staticmethod
+    def decode_entry(raw: bytes, offset: int, name: str) -> DirEntry:
+        """
+        Decodes a raw 32-byte directory entry.
+
+        Parameters:
+            raw (bytes): The raw directory entry.
+            offset (int): Absolute byte offset of the entry.
+            name (str): Display name to attach to the entry.
+
+        Returns:
+            DirEntry: The decoded entry.
+        """
+        attributes = raw[11]
+        cluster_hi, write_time, write_date, cluster_lo, size = struct.unpack_from("<HHHHI", raw, 20)
+        return DirEntry(name, attributes, (cluster_hi << 16) | cluster_lo, size, write_time, write_date, offset)
+
+    def read_file(self, entry: DirEntry) -> bytes:
+        """
+        Reads the full content of a file described by a directory entry.
+
+        Parameters:
+            entry (DirEntry): The file's directory entry.
+
+        Returns:
+            bytes: The file content, truncated to the recorded size.
+        """
+        if entry.size == 0:
+            return b""
+        needed = -(-entry.size // self.cluster_size)
+        parts: List[bytes] = []
+        for cluster in self.cluster_chain(entry.first_cluster, limit=needed):
+            parts.append(os.pread(self.fd, self.cluster_size, self.cluster_offset(cluster)))
+        return b"".join(parts)[:entry.size]
+
+    def read_chain_range(self, chain: List[int], start: int, end: int) -> bytes:
+        """
+        Reads bytes [start, end) of a file whose cluster chain is already known.
+
+        Parameters:
+            chain (List[int]): The file's clusters in order.
+            start (int): First byte offset to read.
+            end (int): Byte offset to stop at (exclusive).
+
+        Returns:
+            bytes: The requested range.
+        """
+        first_index = start // self.cluster_size
+        last_index = (end - 1) // self.cluster_size
+        data = b"".join(
+            os.pread(self.fd, self.cluster_size, self.cluster_offset(cluster))
+            for cluster in chain[first_index:last_index + 1]
+        )
+        base = first_index * self.cluster_size
+        return data[start - base:end - base]
+
+
+class DirEntryProbe:
+    """
+    Cheap "has the file changed?" check based on its 32-byte directory entry.
+
+    After the first lookup the entry's position in the root directory is
+    remembered, so each check costs one small read instead of a directory scan
+    and a full file read. The root directory is only scanned again when the slot
+    no longer holds the file (deleted or recreated by a rotation).
+    """
+
+    def __init__(self, image: Fat32Image, file_name: str):
+        self.image = image
+        self.file_name = file_name
+        self.short_name: bytes = to_short_name(file_name)
+        self.entry: Optional[DirEntry] = None
+        self.hits: int = 0      # Checks that found the file unchanged
+        self.misses: int = 0    # Checks that found a change (a full read follows)
+
+    def lookup(self) -> Optional[DirEntry]:
+        """
+        Returns the current directory entry, re-reading only its 32 bytes when
+        its position is already known.
+
+        Returns:
+            DirEntry or None: The entry, or None if the file is absent.
+        """
+        if self.entry is not None:
+            raw = self.image.read_entry(self.entry.offset)
+            if raw[:11] == self.short_name and raw[11] != ATTR_LONG_NAME:
+                return self.image.decode_entry(raw, self.entry.offset, self.entry.name)
+        return self.image.find_entry(self.file_name)
+
+    def check(self) -> bool:
+        """
+        Compares size, first cluster and write time against the previous check.
+
+        Returns:
+            bool: True if the file changed (or is seen for the first time).
+        """
+        previous = self.entry
+        entry = self.lookup()
+        self.entry = entry
+        changed = (
+            entry is None or previous is None
+            or (entry.size, entry.first_cluster, entry.write_time, entry.write_date)
+            != (previous.size, previous.first_cluster, previous.write_time, previous.write_date)
+        )
+        if changed:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return changed
+
+
+# ============================
+#        Reader Backends
+# ============================
+
+def split_complete_lines(chunk: bytes) -> Tuple[List[str], int]:
+    """
+    Splits a chunk of appended bytes into complete lines.
+
+    Parameters:
+        chunk (bytes): Bytes appended to the log since the last consumed offset.
+
+    Returns:
+        Tuple[List[str], int]: The complete lines (without line endings) and the
+        number of bytes they span, so a trailing partial line is left unconsumed.
+    """
+    end = chunk.rfind(b"\n") + 1
+    if end == 0:
+        return [], 0
+    text = chunk[:end].decode("utf-8", errors="replace")
+    lines = [line.rstrip("\r") for line in text.split("\n")[:-1]]
+    return [line for line in lines if line.strip()], end
+
+
+def newest_lines(lines: List[str], is_newer: Callable[[str], bool]) -> Tuple[List[str], bool]:
+    """
+    Collects the trailing run of lines accepted by `is_newer`.
+
+    Parameters:
+        lines (List[str]): Lines in file order.
+        is_newer (callable): Returns True for lines that still need uploading.
+
+    Returns:
+        Tuple[List[str], bool]: The accepted lines in file order, and True if the
+        scan stopped at an older line (False if every line was accepted).
+    """
+    taken: List[str] = []
+    for line in reversed(lines):
+        if not is_newer(line):
+            taken.reverse()
+            return taken, True
+        taken.append(line)
+    taken.reverse()
+    return taken, False
+
+
+class LogReader:
+    """Common interface for the LOGGER.GAM reader backends."""
+
+    name: str = "base"
+    offset: int = 0        # Bytes of the log already returned by read_new_lines()
+
+    def read_bytes(self) -> Optional[bytes]:
+        """
+        Returns the raw content of the log file.
+
+        Returns:
+            bytes or None: File content, or None if it could not be read.
+        """
+        raise NotImplementedError
+
+    def read_lines(self) -> List[str]:
+        """
+        Returns the log file split into lines, mirroring `mtype | split('\\n')`
+        read in text mode: CRLF and CR line ends are translated, so no line
+        keeps a trailing "\\r".
+
+        Returns:
+            List[str]: Lines of the log file, or an empty list on failure.
+        """
+        content = self.read_bytes()
+        if content is None:
+            return []
+        text = content.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+        return text.strip().split("\n")
+
+    def read_new_lines(self) -> TailResult:
+        """
+        Returns only the complete lines appended since the previous call.
+
+        The generic implementation still reads the whole file and slices it at the
+        remembered byte offset; backends that can seek override it.
+
+        Returns:
+            TailResult: New lines and whether the file was rotated.
+        """
+        content = self.read_bytes()
+        if content is None:
+            return TailResult([], False)
+        rotated = len(content) < self.offset
+        if rotated:
+            logging.info("Log file shrank from %d to %d bytes; restarting from the top.", self.offset, len(content))
+            self.offset = 0
+        lines, consumed = split_complete_lines(content[self.offset:])
+        self.offset += consumed
+        return TailResult(lines, rotated)
+
+    def read_file_bytes(self, file_name: str) -> Optional[bytes]:
+        """
+        Returns the raw content of another file on the same drive (e.g. LOGS_BKP.GAM).
+
+        Parameters:
+            file_name (str): File name in the root directory.
+
+        Returns:
+            bytes or None: File content, or None if it could not be read.
+        """
+        raise NotImplementedError
+
+    def read_backlog(self, file_name: str, is_newer: Callable[[str], bool]) -> List[str]:
+        """
+        Returns the trailing lines of a file that `is_newer` accepts, stopping at
+        the first older line. Used to recover lines that a rotation moved into
+        LOGS_BKP.GAM before they were uploaded.
+
+        Parameters:
+            file_name (str): File name in the root directory.
+            is_newer (callable): Returns True for lines that still need uploading.
+
+        Returns:
+            List[str]: The accepted lines in file order.
+        """
+        content = self.read_file_bytes(file_name)
+        if not content:
+            return []
+        lines, _ = split_complete_lines(content + b"\n")
+        return newest_lines(lines, is_newer)[0]
+
+    def has_changed(self) -> bool:
+        """
+        Cheap pre-check run before a read. Backends without a probe always
+        report a change so the caller falls through to a full read.
+
+        Returns:
+            bool: True if the log may have changed since the previous check.
+        """
+        return True
+
+    def probe_counters(self) -> Tuple[int, int]:
+        """
+        Returns the change-probe counters.
+
+        Returns:
+            Tuple[int, int]: (unchanged polls skipped, polls that needed a read).
+        """
+        return 0, 0
+
+    def close(self) -> None:
+        """Releases any resources held by the backend."""
+
+
+class Fat32LogReader(LogReader):
+    """Reads LOGGER.GAM straight from the FAT32 image without a subprocess."""
+
+    name = "fat32"
+
+    def __init__(self, file_name: str, image_path: Optional[str] = None):
+        self.file_name = file_name
+        self.image = Fat32Image(image_path or image_path_from_mtools_conf())
+        self.probe = DirEntryProbe(self.image, file_name)
+        # Tail position: first cluster of the file being tailed and the cluster
+        # holding byte `offset`, so each poll only follows the FAT forward.
+        self.first_cluster: Optional[int] = None
+        self.chain_index: int = 0
+        self.chain_cluster: int = 0
+
+    def _find(self) -> Optional[DirEntry]:
+        entry = self.probe.lookup()
+        if entry is None:
+            logging.error("%s not found in %s", self.file_name, self.image.image_path)
+        return entry
+
+    def read_bytes(self) -> Optional[bytes]:
+        entry = self._find()
+        if entry is None:
+            return None
+        return self.image.read_file(entry)
+
+    def _rewind(self, first_cluster: int) -> None:
+        self.first_cluster = first_cluster
+        self.offset = 0
+        self.chain_index = 0
+        self.chain_cluster = first_cluster
+
+    def read_new_lines(self) -> TailResult:
+        entry = self._find()
+        if entry is None:
+            return TailResult([], False)
+        rotated = False
+        if entry.first_cluster != self.first_cluster or entry.size < self.offset:
+            if self.first_cluster is not None:
+                rotated = True
+                logging.info("%s was rotated (size %d -> %d, first cluster %s -> %d); restarting from the top.",
+                             self.file_name, self.offset, entry.size, self.first_cluster, entry.first_cluster)
+            self._rewind(entry.first_cluster)
+        if entry.size <= self.offset:
+            return TailResult([], rotated)
+
+        cluster_size = self.image.cluster_size
+        # Walk forward from the remembered cluster to the one holding `offset`.
+        target_index = self.offset // cluster_size
+        while self.chain_index < target_index:
+            next_cluster = self.image.next_cluster(self.chain_cluster)
+            if next_cluster is None:
+                logging.warning("%s: cluster chain ended early; restarting from the top.", self.file_name)
+                self._rewind(entry.first_cluster)
+                return TailResult([], True)
+            self.chain_index += 1
+            self.chain_cluster = next_cluster
+
+        # Read only the clusters spanning [offset, size).
+        clusters: List[int] = [self.chain_cluster]
+        last_index = (entry.size - 1) // cluster_size
+        while target_index + len(clusters) - 1 < last_index:
+            next_cluster = self.image.next_cluster(clusters[-1])
+            if next_cluster is None:
+                break
+            clusters.append(next_cluster)
+        data = b"".join(os.pread(self.image.fd, cluster_size, self.image.cluster_offset(c)) for c in clusters)
+        start = self.offset - target_index * cluster_size
+        end = min(entry.size - target_index * cluster_size, len(data))
+        lines, consumed = split_complete_lines(data[start:end])
+
+        self.offset += consumed
+        new_index = self.offset // cluster_size
+        if new_index - target_index < len(clusters):
+            self.chain_index = new_index
+            self.chain_cluster = clusters[new_index - target_index]
+        return TailResult(lines, rotated)
+
+    def read_file_bytes(self, file_name: str) -> Optional[bytes]:
+        entry = self.image.find_entry(file_name)
+        if entry is None:
+            return None
+        return self.image.read_file(entry)
+
+    def read_backlog(self, file_name: str, is_newer: Callable[[str], bool], chunk_size: int = 65536) -> List[str]:
+        # Scan backwards in chunks so a large LOGS_BKP.GAM is only read as far as needed.
+        entry = self.image.find_entry(file_name)
+        if entry is None or entry.size == 0:
+            return []
+        chain = self.image.cluster_chain(entry.first_cluster, limit=-(-entry.size // self.image.cluster_size))
+        collected: List[str] = []
+        carry = b""
+        end = min(entry.size, len(chain) * self.image.cluster_size)
+        while end > 0:
+            start = max(0, end - chunk_size)
+            data = self.image.read_chain_range(chain, start, end) + carry
+            if start > 0:
+                # The first line of the chunk may be cut; keep it for the next chunk
+                cut = data.find(b"\n") + 1
+                carry, data = data[:cut], data[cut:]
+                if cut == 0:
+                    carry, data = data, b""
+            lines, _ = split_complete_lines(data + b"\n")
+            taken, stopped = newest_lines(lines, is_newer)
+            collected = taken + collected
+            if stopped:
+                return collected
+            end = start
+        return collected
+
+    def has_changed(self) -> bool:
+        return self.probe.check()
+
+    def probe_counters(self) -> Tuple[int, int]:
+        return self.probe.hits, self.probe.misses
+
+    def close(self) -> None:
+        self.image.close()
+
+
+class MtypeLogReader(LogReader):
+    """Reads LOGGER.GAM through the `mtype` command from mtools."""
+
+    name = "mtype"
+
+    def __init__(self, mtools_path: str):
+        self.mtools_path = mtools_path
+
+    def read_bytes(self) -> Optional[bytes]:
+        return self._mtype(self.mtools_path)
+
+    def read_file_bytes(self, file_name: str) -> Optional[bytes]:
+        drive = self.mtools_path.split(":", 1)[0]
+        return self._mtype(f"{drive}:/{file_name}")
+
+    def _mtype(self, mtools_path: str) -> Optional[bytes]:
+        try:
+            result = subprocess.run(
+                ["mtype", mtools_path],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            return result.stdout
+        except subprocess.CalledProcessError as e:
+            logging.error("mtype command failed: %s", e.stderr.decode(errors="replace").strip())
+            return None
+        except FileNotFoundError:
+            logging.error("mtype command not found. Please install mtools.")
+            return None
+
+
+def make_log_reader(backend: str, mtools_path: str, image_path: Optional[str] = None,
+                    fallback: bool = True) -> LogReader:
+    """
+    Builds the requested reader backend, falling back to `mtype` when the image
+    cannot be opened as FAT32.
+
+    Parameters:
+        backend (str): "fat32" or "mtype".
+        mtools_path (str): mtools path of the log file, e.g. "p:/LOGGER.GAM".
+        image_path (str or None): Image file; defaults to the one in mtools.conf.
+        fallback (bool): Fall back to `mtype` if the FAT32 reader cannot open the
+            image; with False the error is raised instead.
+
+    Returns:
+        LogReader: The reader instance.
+
+    Raises:
+        OSError, Fat32Error: Only with fallback=False, if the image cannot be opened.
+    """
+    if backend == "fat32":
+        drive, _, file_name = mtools_path.rpartition(":")
+        try:
+            return Fat32LogReader(file_name.lstrip("/"), image_path or image_path_from_mtools_conf(drive or DEFAULT_DRIVE))
+        except (OSError, Fat32Error) as e:
+            if not fallback:
+                raise
+            logging.error("FAT32 reader unavailable (%s); falling back to mtype.", e)
+    return MtypeLogReader(mtools_path)
+
+
+# ============================
+#      Write Notifications
+# ============================
+
+class ImageWatcher:
+    """
+    Blocks until the gadget writes to the image file, using inotify.
+
+    The mass-storage gadget writes host data through the VFS, so IN_MODIFY fires
+    on the backing file. Bursts of events (one host write is usually several
+    block writes) are collapsed into a single wakeup by a debounce window.
+    """
+
+    def __init__(self, path: str, debounce: float = 0.1, max_debounce: float = 1.0):
+        self.path = path
+        self.debounce = debounce
+        self.max_debounce = max_debounce
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd: int = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        if libc.inotify_add_watch(self.fd, path.encode(), IN_MODIFY | IN_CLOSE_WRITE) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch({path}) failed: {os.strerror(errno)}")
+        self.wakeups: int = 0      # Wakeups caused by write events
+        self.timeouts: int = 0     # Wakeups caused by the fallback timer
+
+    def _drain(self) -> None:
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Waits for a write to the image, then for the burst to settle.
+
+        Parameters:
+            timeout (float): Fallback timer in seconds if no write happens.
+
+        Returns:
+            bool: True if woken by a write event, False if the timer expired.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            self.timeouts += 1
+            return False
+        self._drain()
+        deadline = time.monotonic() + self.max_debounce
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.fd], [], [], min(self.debounce, remaining))[0]:
+                break
+            self._drain()
+        self.wakeups += 1
+        return True
+
+    def close(self) -> None:
+        """Closes the inotify descriptor."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,666 @@
+# /home/pi/gcp_clients.py
+"""
+Construction of the BigQuery and Firestore clients used by both scripts.
+
+Two transports are available behind the same calls (`insert_rows_json`,
+`collection().document()` and the document's `get` / `set` / `update`):
+
+- "official": google-cloud-bigquery and google-cloud-firestore. Importing them
+  pulls in gRPC, protobuf and their dependencies, which costs seconds and tens
+  of MB of RSS on a Pi Zero 2 W.
+- "rest": a small client for the BigQuery insertAll (and, for occasional
+  queries, jobs.query) and Firestore documents/commit REST endpoints, built on google-auth and one pooled HTTP
+  session. Only google-auth and requests are imported.
+
+The official libraries are imported only when that transport is selected,
+and LazyClients builds the clients on a background thread so a script can
+start reading its input while they load. The OAuth access token is cached on
+disk (TokenCache) and refreshed ahead of expiry (TokenRefresher), so a restart
+reuses it instead of exchanging the key for a new token first.
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from urllib.parse import quote
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# ============================
+#         Configuration
+# ============================
+CLOUD_SCOPE: str = "https://www.googleapis.com/auth/cloud-platform"
+BIGQUERY_ENDPOINT: str = "https://bigquery.googleapis.com"
+FIRESTORE_ENDPOINT: str = "https://firestore.googleapis.com"
+FIRESTORE_DATABASE: str = "(default)"
+HTTP_POOL_SIZE: int = 4                    # Keep-alive connections per host in the shared session
+TOKEN_CACHE_FILE: str = "/home/pi/.gcp_token.json"   # Last access token and its expiry (mode 0600)
+TOKEN_MIN_REMAINING: float = 300.0         # A cached token is reused only if valid for at least this long
+TOKEN_REFRESH_MARGIN: float = 600.0        # Refresh in the background this many seconds before expiry
+TOKEN_RETRY_DELAY: float = 30.0            # Seconds before retrying a failed background refresh
+TOKEN_REQUEST_TIMEOUT: float = 15.0        # Seconds one token request may take
+
+_SIMPLE_FIELD = re.compile(r"^[A-Za-z_][A-Za-z_0-9]*$")
+
+
+class RestError(Exception):
+    """Raised when a REST call returns an HTTP error status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+# ============================
+#      Firestore Values
+# ============================
+
+def to_firestore_value(value: Any) -> Dict[str, Any]:
+    """
+    Encodes a Python value as a Firestore REST Value.
+
+    Parameters:
+        value (Any): None, bool, int, float, str, datetime, list or dict.
+            Naive datetimes are taken as UTC, like the official client does.
+
+    Returns:
+        dict: The typed value, e.g. {"stringValue": "Running"}.
+    """
+    if value is None:
+        return {"nullValue": None}
+    if isinstance(value, bool):
+        return {"booleanValue": value}
+    if isinstance(value, int):
+        return {"integerValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, str):
+        return {"stringValue": value}
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return {"timestampValue": value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [to_firestore_value(item) for item in value]}}
+    if isinstance(value, dict):
+        return {"mapValue": {"fields": {key: to_firestore_value(item) for key, item in value.items()}}}
+    raise TypeError(f"Cannot store {type(value).__name__} in Firestore")
+
+
+def from_firestore_value(value: Dict[str, Any]) -> Any:
+    """
+    Decodes a Firestore REST Value; timestamps become UTC datetimes.
+
+    Parameters:
+        value (dict): The typed value.
+
+    Returns:
+        Any: The Python value.
+    """
+    kind, raw = next(iter(value.items()))
+    if kind == "integerValue":
+        return int(raw)
+    if kind == "doubleValue":
+        return float(raw)
+    if kind == "timestampValue":
+        # RFC 3339 with up to nanoseconds; datetime keeps microseconds
+        stamp, _, fraction = raw.rstrip("Z").partition(".")
+        return datetime.fromisoformat(f"{stamp}.{fraction[:6].ljust(6, '0')}").replace(tzinfo=timezone.utc)
+    if kind == "arrayValue":
+        return [from_firestore_value(item) for item in raw.get("values", [])]
+    if kind == "mapValue":
+        return {key: from_firestore_value(item) for key, item in raw.get("fields", {}).items()}
+    return raw
+
+
+def field_path(name: str) -> str:
+    """Quotes a top-level field name for an update mask when it is not a plain identifier."""
+    if _SIMPLE_FIELD.match(name):
+        return name
+    return "`" + name.replace("\\", "\\\\").replace("`", "\\`") + "`"
+
+
+# ============================
+#        REST Transport
+# ============================
+
+class RestSession:
+    """Thin wrapper over one HTTP session that raises RestError on error statuses."""
+
+    def __init__(self, session: Any):
+        self.session = session
+
+    def call(self, method: str, url: str, body: Optional[Dict[str, Any]] = None,
+             timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Sends a JSON request and returns the decoded JSON response.
+
+        Parameters:
+            method (str): HTTP method.
+            url (str): Full URL.
+            body (dict or None): JSON body.
+            timeout (float or None): Seconds the request may take.
+
+        Returns:
+            dict: The response body (empty if it had none).
+
+        Raises:
+            RestError: For HTTP statuses of 400 and above.
+        """
+        response = self.session.request(method, url, json=body, timeout=timeout)
+        if response.status_code >= 400:
+            raise RestError(response.status_code, response.text[:500])
+        return response.json() if response.content else {}
+
+
+class RestBigQueryClient:
+    """The insert_rows_json() subset of bigquery.Client over the insertAll REST endpoint, plus jobs.query."""
+
+    def __init__(self, session: RestSession, endpoint: str = BIGQUERY_ENDPOINT):
+        self.session = session
+        self.endpoint = endpoint.rstrip("/")
+
+    def insert_rows_json(self, table: str, json_rows: List[Dict[str, Any]], row_ids: Optional[List[str]] = None,
+                         timeout: Optional[float] = None, retry: Any = None) -> List[Dict[str, Any]]:
+        """
+        Streams rows into a table.
+
+        Parameters:
+            table (str): "project.dataset.table".
+            json_rows (list): The JSON rows.
+            row_ids (list or None): insertId of each row.
+            timeout (float or None): Seconds the request may take.
+            retry: Ignored; retries are done by the caller.
+
+        Returns:
+            list: Per-row errors ({"index": ..., "errors": [...]}), as bigquery.Client returns them.
+        """
+        project, dataset, table_name = table.split(".")
+        rows = [{"json": row} for row in json_rows]
+        if row_ids is not None:
+            for row, row_id in zip(rows, row_ids):
+                row["insertId"] = row_id
+        url = f"{self.endpoint}/bigquery/v2/projects/{project}/datasets/{dataset}/tables/{table_name}/insertAll"
+        return self.session.call("POST", url, {"rows": rows}, timeout).get("insertErrors", [])
+
+    def query_rows(self, project: str, query: str, parameters: List[Tuple[str, str, Any]],
+                   timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Runs a small standard SQL query through the jobs.query REST endpoint.
+
+        Parameters:
+            project (str): Project the query job runs in.
+            query (str): The query, with @name parameters.
+            parameters (list): (name, type, value) of each parameter, e.g. ("machine", "STRING", "G-250").
+            timeout (float or None): Seconds the query may take.
+
+        Returns:
+            list: One dict per result row; TIMESTAMP values become UTC datetimes.
+
+        Raises:
+            TimeoutError: If the query did not complete within `timeout`.
+        """
+        body: Dict[str, Any] = {
+            "query": query,
+            "useLegacySql": False,
+            "parameterMode": "NAMED",
+            "queryParameters": [{"name": name, "parameterType": {"type": kind}, "parameterValue": {"value": str(value)}}
+                                for name, kind, value in parameters],
+        }
+        if timeout is not None:
+            body["timeoutMs"] = int(timeout * 1000)
+        result = self.session.call("POST", f"{self.endpoint}/bigquery/v2/projects/{project}/queries", body, timeout)
+        if not result.get("jobComplete", False):
+            raise TimeoutError("BigQuery query did not complete in time")
+        fields = result.get("schema", {}).get("fields", [])
+        return [{field["name"]: from_bigquery_value(field["type"], cell.get("v"))
+                 for field, cell in zip(fields, row["f"])}
+                for row in result.get("rows", [])]
+
+
+def from_bigquery_value(kind: str, raw: Any) -> Any:
+    """
+    Decodes a scalar cell of a jobs.query response, where every value is a string.
+
+    Parameters:
+        kind (str): Column type from the response schema.
+        raw (Any): The cell value, or None for NULL.
+
+    Returns:
+        Any: int, float, bool, UTC datetime or str.
+    """
+    if raw is None:
+        return None
+    if kind in ("INTEGER", "INT64"):
+        return int(raw)
+    if kind in ("FLOAT", "FLOAT64"):
+        return float(raw)
+    if kind in ("BOOLEAN", "BOOL"):
+        return raw == "true"
+    if kind == "TIMESTAMP":
+        # Seconds since the epoch, possibly in scientific notation
+        return datetime.fromtimestamp(float(raw), timezone.utc)
+    return raw
+
+
+def query_rows(client: Any, project: str, query: str, parameters: List[Tuple[str, str, Any]],
+               timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Runs a small parameterized query with either transport's BigQuery client.
+
+    Parameters:
+        client: RestBigQueryClient or bigquery.Client.
+        project (str): Project the query job runs in.
+        query (str): The query, with @name parameters.
+        parameters (list): (name, type, value) of each parameter.
+        timeout (float or None): Seconds the query may take.
+
+    Returns:
+        list: One dict per result row; TIMESTAMP values are UTC datetimes.
+    """
+    if isinstance(client, RestBigQueryClient):
+        return client.query_rows(project, query, parameters, timeout)
+    from google.cloud import bigquery
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter(name, kind, value) for name, kind, value in parameters]
+    )
+    job = client.query(query, job_config=job_config, project=project, timeout=timeout)
+    return [dict(row.items()) for row in job.result(timeout=timeout)]
+
+
+class RestSnapshot:
+    """The `exists` / `to_dict()` subset of a Firestore DocumentSnapshot."""
+
+    def __init__(self, fields: Optional[Dict[str, Any]]):
+        self.exists = fields is not None
+        self._fields = fields
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._fields) if self._fields is not None else None
+
+
+class RestDocument:
+    """The get / set / update subset of a Firestore DocumentReference."""
+
+    def __init__(self, client: "RestFirestoreClient", path: str):
+        self.client = client
+        self.name = f"{client.root}/documents/{path}"
+
+    def get(self, timeout: Optional[float] = None, retry: Any = None) -> RestSnapshot:
+        try:
+            # Document IDs such as "UIP 1 [G50-H] - Coteau" must be escaped in the URL, not in request bodies
+            url = f"{self.client.endpoint}/v1/{quote(self.name, safe='/()')}"
+            document = self.client.session.call("GET", url, timeout=timeout)
+        except RestError as e:
+            if e.status == 404:
+                return RestSnapshot(None)
+            raise
+        return RestSnapshot({key: from_firestore_value(value) for key, value in document.get("fields", {}).items()})
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False,
+            timeout: Optional[float] = None, retry: Any = None) -> None:
+        write: Dict[str, Any] = {"update": self._document(document_data)}
+        if merge:
+            write["updateMask"] = {"fieldPaths": [field_path(name) for name in document_data]}
+        self.client.commit([write], timeout)
+
+    def update(self, field_updates: Dict[str, Any], timeout: Optional[float] = None, retry: Any = None) -> None:
+        # Like the official client: only the listed fields, and the document must exist
+        self.client.commit([{
+            "update": self._document(field_updates),
+            "updateMask": {"fieldPaths": [field_path(name) for name in field_updates]},
+            "currentDocument": {"exists": True},
+        }], timeout)
+
+    def _document(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        return {"name": self.name, "fields": {name: to_firestore_value(value) for name, value in fields.items()}}
+
+
+class RestCollection:
+    def __init__(self, client: "RestFirestoreClient", path: str):
+        self.client = client
+        self.path = path
+
+    def document(self, document_id: str) -> RestDocument:
+        return RestDocument(self.client, f"{self.path}/{document_id}")
+
+
+class RestFirestoreClient:
+    """The collection().document() subset of firestore.Client over the REST API."""
+
+    def __init__(self, session: RestSession, project: str, database: str = FIRESTORE_DATABASE,
+                 endpoint: str = FIRESTORE_ENDPOINT):
+        self.session = session
+        self.endpoint = endpoint.rstrip("/")
+        self.root = f"projects/{project}/databases/{database}"
+
+    def collection(self, name: str) -> RestCollection:
+        return RestCollection(self, name)
+
+    def commit(self, writes: List[Dict[str, Any]], timeout: Optional[float] = None) -> None:
+        """Applies the writes atomically with documents:commit."""
+        self.session.call("POST", f"{self.endpoint}/v1/{self.root}/documents:commit", {"writes": writes}, timeout)
+
+
+def authorized_session(credentials: Any, pool_size: int = HTTP_POOL_SIZE) -> Any:
+    """
+    Builds one keep-alive HTTP session that adds (and refreshes) the OAuth token.
+
+    Parameters:
+        credentials: google-auth credentials; scoped to cloud-platform if needed.
+        pool_size (int): Connections kept open per host.
+
+    Returns:
+        google.auth.transport.requests.AuthorizedSession: The session.
+    """
+    from google.auth.credentials import with_scopes_if_required
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    session = AuthorizedSession(with_scopes_if_required(credentials, [CLOUD_SCOPE]))
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# ============================
+#        Client Factory
+# ============================
+
+def make_clients(transport: str, project_id: str, credentials: Any,
+                 bigquery_endpoint: Optional[str] = None,
+                 firestore_endpoint: Optional[str] = None) -> Tuple[Any, Any]:
+    """
+    Builds the BigQuery and Firestore clients for the selected transport.
+
+    Parameters:
+        transport (str): "official" or "rest".
+        project_id (str): Google Cloud project ID.
+        credentials: google-auth credentials.
+        bigquery_endpoint (str or None): Override of the BigQuery API root (tests, stand-ins).
+        firestore_endpoint (str or None): Override of the Firestore API root ("rest" only).
+
+    Returns:
+        tuple: (BigQuery client, Firestore client).
+    """
+    if transport == "rest":
+        session = RestSession(authorized_session(credentials))
+        logging.info("Using the REST transport for BigQuery and Firestore.")
+        return (RestBigQueryClient(session, bigquery_endpoint or BIGQUERY_ENDPOINT),
+                RestFirestoreClient(session, project_id, endpoint=firestore_endpoint or FIRESTORE_ENDPOINT))
+    if transport != "official":
+        raise ValueError(f"Unknown GCP transport: {transport!r}")
+    from google.cloud import bigquery, firestore
+
+    options = {"api_endpoint": bigquery_endpoint} if bigquery_endpoint else None
+    return (bigquery.Client(project=project_id, credentials=credentials, client_options=options),
+            firestore.Client(project=project_id, credentials=credentials))
+
+
+class LazyClients:
+    """
+    Builds the (BigQuery, Firestore) client pair on a background thread.
+
+    start() begins the build, and only start() does: the main script calls it
+    once its network gate is decided, so the libraries and credentials are not
+    loaded while the network is still down. bigquery() / firestore() wait for
+    the build, up to a timeout. Once started, a failed build is reported to the
+    waiting caller and retried on the next access; reset() drops the clients
+    so the next access builds fresh ones.
+    """
+
+    def __init__(self, build: Callable[[], Tuple[Any, Any]]):
+        self.build = build
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.clients: Optional[Tuple[Any, Any]] = None
+        self.error: Optional[BaseException] = None
+        self.building: bool = False
+        self.started: bool = False
+        self.build_seconds: Optional[float] = None   # Duration of the last successful build
+
+    def start(self) -> None:
+        """Starts the background build unless it already started."""
+        with self.lock:
+            if self.started:
+                return
+            self._start_locked()
+
+    def _start_locked(self) -> None:
+        self.started = True
+        if self.building or self.clients is not None:
+            return
+        self.building = True
+        self.ready.clear()
+        threading.Thread(target=self._build, name="gcp-clients", daemon=True).start()
+
+    def _build(self) -> None:
+        start = time.monotonic()
+        try:
+            clients, error = self.build(), None
+        except Exception as e:
+            clients, error = None, e
+            logging.error("Could not build the cloud clients: %s", e)
+        with self.lock:
+            self.clients, self.error, self.building = clients, error, False
+            if clients is not None:
+                self.build_seconds = time.monotonic() - start
+                logging.info("Cloud clients ready after %.2f s.", self.build_seconds)
+            self.ready.set()
+
+    def get(self, timeout: Optional[float] = None) -> Tuple[Any, Any]:
+        """
+        Returns the clients, waiting for the build.
+
+        Parameters:
+            timeout (float or None): Seconds to wait; None waits indefinitely.
+
+        Returns:
+            tuple: (BigQuery client, Firestore client).
+
+        Raises:
+            TimeoutError: If the build did not finish in time.
+            Exception: The build's error; the next call builds again.
+        """
+        with self.lock:
+            # Rebuild after a failure or reset(); the first build is left to start()
+            if self.started and self.clients is None and not self.building:
+                self._start_locked()
+        if not self.ready.wait(timeout):
+            raise TimeoutError("cloud clients are still being built" if self.started
+                               else "cloud clients have not been started")
+        with self.lock:
+            if self.clients is not None:
+                return self.clients
+            error, self.error = self.error, None
+        raise error or RuntimeError("cloud clients are not available")
+
+    def bigquery(self, timeout: Optional[float] = None) -> Any:
+        return self.get(timeout)[0]
+
+    def firestore(self, timeout: Optional[float] = None) -> Any:
+        return self.get(timeout)[1]
+
+    def reset(self) -> None:
+        """Drops the clients; the next access builds new ones (e.g. with reloaded credentials)."""
+        with self.lock:
+            if not self.building:
+                self.clients = None
+                self.ready.clear()
+
+
+# ============================
+#     Access Token Caching
+# ============================
+
+def seconds_until_expiry(credentials: Any, now: Optional[float] = None) -> float:
+    """
+    Seconds until the credentials' access token expires (negative once expired, -inf if none).
+
+    Parameters:
+        credentials: google-auth credentials.
+        now (float or None): Current epoch seconds; defaults to the system clock.
+    """
+    if not getattr(credentials, "token", None) or credentials.expiry is None:
+        return float("-inf")
+    current = datetime.now(timezone.utc) if now is None else datetime.fromtimestamp(now, timezone.utc)
+    # google-auth keeps `expiry` as a naive UTC datetime
+    return (credentials.expiry - current.replace(tzinfo=None)).total_seconds()
+
+
+class TokenCache:
+    """
+    Persists the access token of a service account and its expiry, so a
+    restarted process can reuse it. The file is written atomically with mode
+    0600; it is bound to the key it was issued for (private_key_id) and holds
+    a short-lived token, never the key itself.
+    """
+
+    def __init__(self, path: str = TOKEN_CACHE_FILE, min_remaining: float = TOKEN_MIN_REMAINING,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.min_remaining = min_remaining
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def load(self, credentials: Any) -> bool:
+        """
+        Installs the cached token into `credentials` if it belongs to the same
+        key and is valid for at least `min_remaining` seconds.
+
+        Parameters:
+            credentials: google-auth service account credentials.
+
+        Returns:
+            bool: True if the cached token was installed.
+        """
+        try:
+            with open(self.path, "r") as f:
+                cached = json.load(f)
+            if cached.get("key_id") != getattr(credentials, "private_key_id", None):
+                return False
+            token, expiry = cached["token"], datetime.fromisoformat(cached["expiry"])
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning("Ignoring token cache %s: %s", self.path, e)
+            return False
+        credentials.token, credentials.expiry = token, expiry
+        remaining = seconds_until_expiry(credentials, self.clock())
+        if remaining < self.min_remaining:
+            credentials.token, credentials.expiry = None, None
+            return False
+        logging.info("Reusing the cached access token (valid for %.0f s).", remaining)
+        return True
+
+    def save(self, credentials: Any) -> None:
+        """
+        Replaces the cache with the credentials' current token.
+
+        Parameters:
+            credentials: google-auth service account credentials with a token.
+        """
+        if not credentials.token or credentials.expiry is None:
+            return
+        state = {
+            "key_id": getattr(credentials, "private_key_id", None),
+            "token": credentials.token,
+            "expiry": credentials.expiry.isoformat(),
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with self.lock:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+def load_credentials(service_account_file: str, cache: Optional[TokenCache] = None) -> Any:
+    """
+    Loads service account credentials scoped to cloud-platform and, if a cache
+    is given, installs a still-valid cached access token.
+
+    Parameters:
+        service_account_file (str): Path to the service account JSON key.
+        cache (TokenCache or None): Token cache.
+
+    Returns:
+        google.oauth2.service_account.Credentials: The credentials.
+    """
+    from google.oauth2 import service_account
+
+    credentials = service_account.Credentials.from_service_account_file(service_account_file, scopes=[CLOUD_SCOPE])
+    if cache is not None:
+        cache.load(credentials)
+    return credentials
+
+
+class TokenRefresher(threading.Thread):
+    """
+    Refreshes the tracked credentials' access token `margin` seconds before it
+    expires and writes each new token to the cache, so client calls never wait
+    for a token exchange. Failed refreshes are retried every `retry_delay`
+    seconds; the client libraries still refresh on their own if needed.
+    """
+
+    def __init__(self, cache: Optional[TokenCache], margin: float = TOKEN_REFRESH_MARGIN,
+                 retry_delay: float = TOKEN_RETRY_DELAY, timeout: float = TOKEN_REQUEST_TIMEOUT):
+        super().__init__(name="token-refresh", daemon=True)
+        self.cache = cache
+        self.margin = margin
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.credentials: Any = None
+        self.wakeup = threading.Event()
+        self.refreshes: int = 0
+        self.failures: int = 0
+
+    def track(self, credentials: Any) -> None:
+        """
+        Refreshes `credentials` from now on (replacing any previous ones) and
+        starts the thread on first use.
+
+        Parameters:
+            credentials: google-auth credentials used by the clients.
+        """
+        self.credentials = credentials
+        self.wakeup.set()
+        if not self.is_alive():
+            self.start()
+
+    def run(self) -> None:
+        from google.auth.transport.requests import Request
+
+        session_request = Request()
+
+        def request(*args: Any, **kwargs: Any) -> Any:
+            kwargs["timeout"] = self.timeout
+            return session_request(*args, **kwargs)
+
+        while True:
+            self.wakeup.clear()
+            credentials = self.credentials
+            wait = seconds_until_expiry(credentials) - self.margin
+            if wait > 0:
+                self.wakeup.wait(wait)
+                continue
+            try:
+                credentials.refresh(request)
+            except Exception as e:
+                self.failures += 1
+                logging.warning("Background token refresh failed: %s", e)
+                self.wakeup.wait(self.retry_delay)
+                continue
+            self.refreshes += 1
+            logging.info("Access token refreshed (valid for %.0f s).", seconds_until_expiry(credentials))
+            if self.cache is not None:
+                try:
+                    self.cache.save(credentials)
+                except OSError as e:
+                    logging.warning("Could not write token cache %s: %s", self.cache.path, e)
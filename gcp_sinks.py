@@ -0,0 +1,744 @@
+# /home/pi/gcp_sinks.py
+"""
+Cloud sink helpers shared by raspberry_to_gcp.py and raspberry_to_gcp_monitoring.py.
+"""
+import json
+import hashlib
+import time
+import random
+import logging
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+from local_store import MemoryOutbox
+
+T = TypeVar("T")
+
+# ============================
+#     Batching Configuration
+# ============================
+BQ_BATCH_MAX_ROWS: int = 500            # Flush once this many rows are buffered
+BQ_BATCH_MAX_BYTES: int = 1_000_000     # Flush once the JSON payload reaches this size
+BQ_BATCH_MAX_LATENCY: float = 5.0       # Flush once the oldest buffered row is this old (seconds)
+
+
+# ============================
+#   Circuit Breaker Defaults
+# ============================
+BREAKER_WINDOW: float = 60.0            # Seconds of call history used for the failure rate
+BREAKER_FAILURE_RATE: float = 0.5       # Open once this share of calls in the window failed
+BREAKER_MIN_CALLS: int = 2              # ...and at least this many calls were made
+BREAKER_OPEN_DURATION: float = 25.0     # Seconds to stay open before a half-open probe
+
+# ============================
+#     Deadline Defaults
+# ============================
+CALL_TIMEOUT: float = 10.0              # Seconds one request may take (socket / RPC timeout)
+CALL_DEADLINE: float = 30.0             # Seconds all attempts of one operation may take, backoff included
+CALL_MAX_ATTEMPTS: int = 5
+CALL_BASE_DELAY: float = 1.0            # First backoff delay; doubled after each failed attempt
+
+
+# ============================
+#   Firestore Heartbeat Defaults
+# ============================
+FS_HEARTBEAT_PERIOD: float = 60.0       # Seconds between heartbeat-only document writes
+FS_HEARTBEAT_JITTER: float = 0.2        # Each period is randomized by up to +/- this share
+
+CLOSED: str = "closed"
+OPEN: str = "open"
+HALF_OPEN: str = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Per-sink circuit breaker with a sliding failure-rate window.
+
+    closed:    calls flow; outcomes are recorded in the window. Once the failure
+               rate reaches `failure_rate` (over at least `min_calls` calls) it opens.
+    open:      calls are refused for `open_duration` seconds so callers can buffer
+               locally instead of sleeping.
+    half-open: exactly one probe call is let through; success closes the breaker,
+               failure re-opens it for another `open_duration`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: float = BREAKER_WINDOW,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        min_calls: int = BREAKER_MIN_CALLS,
+        open_duration: float = BREAKER_OPEN_DURATION,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.window = window
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.clock = clock
+        self.state: str = CLOSED
+        self.opened_at: float = 0.0
+        self.probe_in_flight: bool = False
+        self.calls: Deque[Tuple[float, bool]] = deque()
+        self.times_opened: int = 0
+        self.refused: int = 0
+
+    def _trim(self, now: float) -> None:
+        while self.calls and self.calls[0][0] < now - self.window:
+            self.calls.popleft()
+
+    def allow(self) -> bool:
+        """
+        Asks whether a call may be made now.
+
+        Returns:
+            bool: True if the caller should make the call and then record its outcome.
+        """
+        now = self.clock()
+        if self.state == OPEN and now - self.opened_at >= self.open_duration:
+            self.state = HALF_OPEN
+            self.probe_in_flight = False
+            logging.info("Circuit breaker %s half-open: sending a probe request.", self.name)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.refused += 1
+        return False
+
+    def retry_after(self) -> float:
+        """
+        Returns the seconds until allow() could succeed again.
+
+        Returns:
+            float: 0 when closed (or a probe is due), else the remaining open time.
+        """
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_duration - self.clock())
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.probe_in_flight = False
+        self.times_opened += 1
+        logging.warning("Circuit breaker %s open for %.0f s.", self.name, self.open_duration)
+
+    def record(self, success: bool) -> None:
+        """
+        Records the outcome of a call that allow() let through.
+
+        Parameters:
+            success (bool): Whether the call succeeded.
+        """
+        now = self.clock()
+        if self.state == HALF_OPEN:
+            if success:
+                self.state = CLOSED
+                self.calls.clear()
+                logging.info("Circuit breaker %s closed: probe succeeded.", self.name)
+            else:
+                self._open(now)
+            return
+        self.calls.append((now, success))
+        self._trim(now)
+        failures = sum(1 for _, ok in self.calls if not ok)
+        if self.state == CLOSED and len(self.calls) >= self.min_calls and failures / len(self.calls) >= self.failure_rate:
+            self._open(now)
+
+
+# ============================
+#   Deadline-Aware Retries
+# ============================
+
+class CallDeadlineExceeded(TimeoutError):
+    """Raised when an operation's deadline expires before any attempt could run."""
+
+
+def is_timeout(error: BaseException) -> bool:
+    """
+    Tells whether an exception is a timeout, whichever library raised it
+    (socket, requests / urllib3, google.api_core DeadlineExceeded, gRPC).
+
+    Parameters:
+        error (BaseException): The exception raised by a cloud call.
+
+    Returns:
+        bool: True for timeouts.
+    """
+    if isinstance(error, TimeoutError):
+        return True
+    return any("Timeout" in cls.__name__ or cls.__name__ == "DeadlineExceeded" for cls in type(error).__mro__)
+
+
+class CallStats:
+    """Counters for one kind of cloud call made through call_with_deadline()."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: int = 0         # Operations started
+        self.attempts: int = 0      # Requests made, retries included
+        self.failures: int = 0      # Operations that gave up
+        self.timeouts: int = 0      # Requests that timed out
+        self.deadlines: int = 0     # Operations stopped by their deadline
+
+    def __str__(self) -> str:
+        return (f"{self.name}: {self.calls} calls, {self.attempts} attempts, {self.failures} failed, "
+                f"{self.timeouts} timed out, {self.deadlines} hit the deadline")
+
+
+def call_with_deadline(
+    operation: Callable[[float], T],
+    stats: CallStats,
+    deadline: float = CALL_DEADLINE,
+    call_timeout: float = CALL_TIMEOUT,
+    max_attempts: int = CALL_MAX_ATTEMPTS,
+    base_delay: float = CALL_BASE_DELAY,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """
+    Runs a cloud call with a per-request timeout, exponential backoff with jitter,
+    and an end-to-end deadline covering every attempt and every backoff sleep.
+
+    Parameters:
+        operation (callable): Called with the timeout (seconds) for one request;
+            should pass it to the client call and raise on failure.
+        stats (CallStats): Counters to update.
+        deadline (float): Seconds the whole operation may take.
+        call_timeout (float): Upper bound for one request; shortened to the time left.
+        max_attempts (int): Maximum number of requests.
+        base_delay (float): First backoff delay in seconds.
+        clock (callable): Monotonic clock.
+        sleep (callable): Sleep function.
+
+    Returns:
+        Any: The result of the first successful attempt.
+
+    Raises:
+        Exception: The last attempt's exception, or CallDeadlineExceeded if no
+            attempt could be made in time.
+        ValueError: If max_attempts is below 1.
+    """
+    if max_attempts < 1:
+        raise ValueError(f"{stats.name}: max_attempts must be at least 1, got {max_attempts}")
+    end = clock() + deadline
+    stats.calls += 1
+    last_error: Optional[BaseException] = None
+    for attempt in range(1, max_attempts + 1):
+        remaining = end - clock()
+        if remaining <= 0:
+            break
+        stats.attempts += 1
+        try:
+            return operation(min(call_timeout, remaining))
+        except Exception as e:
+            last_error = e
+            timed_out = is_timeout(e)
+            if timed_out:
+                stats.timeouts += 1
+            logging.warning("%s attempt %d/%d failed%s: %s", stats.name, attempt, max_attempts,
+                            " (timed out)" if timed_out else "", e)
+        if attempt == max_attempts:
+            break
+        delay = base_delay * (2 ** (attempt - 1)) + random.uniform(0, 0.1 * base_delay)
+        if clock() + delay >= end:
+            break
+        sleep(delay)
+    stats.failures += 1
+    if clock() >= end or attempt < max_attempts:
+        stats.deadlines += 1
+    if last_error is None:
+        raise CallDeadlineExceeded(f"{stats.name}: deadline of {deadline:.1f} s expired")
+    raise last_error
+
+
+# ============================
+#   Idempotent BigQuery Inserts
+# ============================
+
+def row_insert_id(row: Dict[str, Any], keys: Tuple[str, ...]) -> str:
+    """
+    Builds a deterministic BigQuery insertId from the columns that identify a
+    row, so a retried or replayed insert of the same row carries the same ID
+    and BigQuery drops the copy instead of storing it twice.
+
+    Parameters:
+        row (dict): The JSON row.
+        keys (tuple): Names of the identifying columns, e.g. machine, timestamp, Minute ID.
+
+    Returns:
+        str: A 32-character hex digest of the key columns.
+    """
+    key = "\x1f".join(str(row.get(name)) for name in keys)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# ============================
+#     Per-Row Insert Errors
+# ============================
+# insertAll error reasons worth retrying. "stopped" marks valid rows that were
+# not inserted only because another row of the request failed.
+RETRYABLE_ROW_REASONS = frozenset({"backendError", "internalError", "rateLimitExceeded", "timeout", "stopped"})
+
+
+class RowErrors(Exception):
+    """Raised when rows of an insert failed with retryable reasons."""
+
+
+def insert_rows(
+    insert: Callable[[List[Dict[str, Any]], List[str], float], List[Dict[str, Any]]],
+    rows: List[Dict[str, Any]],
+    row_ids: List[str],
+    stats: CallStats,
+    reasons: Counter,
+    dead_letter: Callable[[Dict[str, Any], List[Dict[str, Any]]], None],
+    **retry: Any,
+) -> List[int]:
+    """
+    Inserts rows with call_with_deadline(), resending only the rows that failed
+    with a retryable reason. Rows that failed for any other reason (e.g.
+    "invalid") are handed to `dead_letter` and not sent again. Once the attempts
+    or the deadline run out, the rows still pending are returned rather than
+    raised, so the caller can keep just those and drop the rest.
+
+    Parameters:
+        insert (callable): Called with (rows, row_ids, timeout); returns the
+            insertAll error list (entries with "index" and "errors").
+        rows (list): The JSON rows.
+        row_ids (list): The insertId of each row.
+        stats (CallStats): Counters for the calls.
+        reasons (Counter): Failed rows counted per error reason; updated in place.
+        dead_letter (callable): Called with (row, errors) for each rejected row.
+        **retry: Deadline, timeout and backoff settings for call_with_deadline().
+
+    Returns:
+        list: Indices (into `rows`) of the rows neither inserted nor dead-lettered;
+            empty once every row was handled.
+    """
+    pending: List[int] = list(range(len(rows)))
+
+    def attempt(timeout: float) -> None:
+        nonlocal pending
+        errors = insert([rows[i] for i in pending], [row_ids[i] for i in pending], timeout)
+        retry_rows: List[int] = []
+        for entry in errors:
+            index = pending[entry["index"]]
+            row_errors = entry.get("errors") or [{"reason": "unknown"}]
+            row_reasons = {error.get("reason") or "unknown" for error in row_errors}
+            reasons.update(row_reasons)
+            if row_reasons <= RETRYABLE_ROW_REASONS:
+                retry_rows.append(index)
+            else:
+                dead_letter(rows[index], row_errors)
+        pending = retry_rows
+        if pending:
+            raise RowErrors(f"{len(pending)} of {len(rows)} rows failed with retryable errors")
+
+    try:
+        call_with_deadline(attempt, stats, **retry)
+    except Exception as e:
+        logging.error("%s: %d of %d rows still pending: %s", stats.name, len(pending), len(rows), e)
+    return pending
+
+
+class BatchMetrics(NamedTuple):
+    """Metrics for one flushed BigQuery batch."""
+    rows: int
+    bytes: int
+    latency: float         # Seconds the oldest row waited in the outbox
+    duration: float        # Seconds spent in the insert call
+    reason: str            # "rows", "bytes", "latency" or "shutdown"
+    success: bool
+
+
+# ============================
+#    Batched BigQuery Writer
+# ============================
+
+class BigQueryBatchWriter:
+    """
+    Accumulates rows in an outbox and hands them to `send` in batches.
+
+    A flush is triggered when the outbox holds `max_rows` rows or `max_bytes`
+    bytes of JSON, when its oldest row has waited `max_latency` seconds, or on
+    close(). A flush drains the outbox in order, one batch of at most `max_rows`
+    rows / `max_bytes` bytes at a time. `send` returns the indices of the batch
+    rows it could not deliver; every other row of the batch is removed from the
+    outbox. Undelivered rows stay in the outbox and are retried after another
+    `max_latency` seconds, or once the optional circuit breaker lets a probe
+    through. `progress`, if given, is called
+    after every batch, so a long catch-up flush still reports progress.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[Dict[str, Any]]], List[int]],
+        max_rows: int = BQ_BATCH_MAX_ROWS,
+        max_bytes: int = BQ_BATCH_MAX_BYTES,
+        max_latency: float = BQ_BATCH_MAX_LATENCY,
+        clock: Callable[[], float] = time.monotonic,
+        history: int = 100,
+        outbox: Optional[MemoryOutbox] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        progress: Optional[Callable[[], None]] = None,
+    ):
+        self.send = send
+        self.progress = progress
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.clock = clock
+        self.outbox: MemoryOutbox = outbox if outbox is not None else MemoryOutbox()
+        self.breaker = breaker
+        # Rows left over from a previous run are due one latency window after start
+        self.oldest: Optional[float] = self.clock() if self.outbox.pending_rows else None
+        self.recent: Deque[BatchMetrics] = deque(maxlen=history)
+        self.rows_sent: int = 0
+        self.rows_failed: int = 0
+        self.batches: int = 0
+        self.backoff_until: float = 0.0   # After a failed send, size thresholds wait until then
+
+    def add(self, row: Any) -> Optional[BatchMetrics]:
+        """
+        Stores a row in the outbox and flushes if a size threshold is reached.
+
+        Parameters:
+            row (dict): The row to insert, or a record the outbox knows how to encode.
+
+        Returns:
+            BatchMetrics or None: Metrics of the last batch if a flush happened.
+        """
+        return self.add_many([row])
+
+    def add_many(self, rows: List[Any]) -> Optional[BatchMetrics]:
+        """
+        Stores rows in the outbox with a single append, which the SQLite outbox
+        commits as one transaction, then flushes if a size threshold is reached.
+        Use it for catch-up and replay chunks instead of one add() per row.
+
+        Parameters:
+            rows (list): The rows to insert, or records the outbox knows how to encode.
+
+        Returns:
+            BatchMetrics or None: Metrics of the last batch if a flush happened.
+        """
+        if not rows:
+            return None
+        if self.oldest is None:
+            self.oldest = self.clock()
+        self.outbox.append(rows)
+        if self.clock() < self.backoff_until:
+            return None
+        if self.outbox.pending_rows >= self.max_rows:
+            return self.flush("rows")
+        if self.outbox.pending_bytes >= self.max_bytes:
+            return self.flush("bytes")
+        return None
+
+    def time_until_due(self) -> float:
+        """
+        Returns the seconds until the buffered rows hit the latency threshold.
+
+        Returns:
+            float: Seconds left, 0 if overdue, or infinity if the outbox is empty.
+        """
+        if self.oldest is None:
+            return float("inf")
+        due = max(0.0, self.oldest + self.max_latency - self.clock())
+        if self.breaker is not None:
+            due = max(due, self.breaker.retry_after())
+        return due
+
+    def maybe_flush(self) -> Optional[BatchMetrics]:
+        """
+        Flushes the outbox if its oldest row has waited long enough.
+
+        Returns:
+            BatchMetrics or None: Metrics of the last batch if a flush happened.
+        """
+        if self.oldest is not None and self.time_until_due() <= 0:
+            return self.flush("latency")
+        return None
+
+    def _next_batch(self) -> Tuple[List[Dict[str, Any]], int, List[int]]:
+        rows: List[Dict[str, Any]] = []
+        size = 0
+        ids: List[int] = []
+        for row_id, row in self.outbox.peek(self.max_rows):
+            row_size = len(json.dumps(row, default=str))
+            if rows and size + row_size > self.max_bytes:
+                break
+            rows.append(row)
+            size += row_size
+            ids.append(row_id)
+        return rows, size, ids
+
+    def flush(self, reason: str = "manual") -> Optional[BatchMetrics]:
+        """
+        Drains the outbox in batches until it is empty or a send fails.
+
+        Parameters:
+            reason (str): Why the flush happened, recorded in the metrics.
+
+        Returns:
+            BatchMetrics or None: Metrics of the last batch, or None if the outbox was empty.
+        """
+        metrics: Optional[BatchMetrics] = None
+        while self.outbox.pending_rows:
+            if self.breaker is not None and not self.breaker.allow():
+                # Breaker open: rows stay buffered in the outbox until a probe is due
+                return metrics
+            rows, size, ids = self._next_batch()
+            if not rows:
+                break
+            start = self.clock()
+            try:
+                pending = set(self.send(rows))
+            except Exception:
+                logging.exception("BigQuery batch send failed")
+                pending = set(range(len(rows)))
+            success = not pending
+            end = self.clock()
+            if self.breaker is not None:
+                self.breaker.record(success)
+            if self.progress is not None:
+                self.progress()
+
+            oldest = self.oldest if self.oldest is not None else start
+            metrics = BatchMetrics(len(rows), size, start - oldest, end - start, reason, success)
+            self.recent.append(metrics)
+            self.batches += 1
+            logging.info("BigQuery batch (%s): %d rows, %d bytes, waited %.2f s, insert %.2f s, %s.",
+                         reason, metrics.rows, metrics.bytes, metrics.latency, metrics.duration,
+                         "ok" if success else f"{len(pending)} rows failed")
+            self.rows_sent += len(rows) - len(pending)
+            if not success:
+                self.rows_failed += len(pending)
+                # Drop the rows that were delivered, keep the rest and retry after another latency window
+                self.outbox.remove([row_id for index, row_id in enumerate(ids) if index not in pending])
+                self.oldest = self.clock()
+                self.backoff_until = self.oldest + self.max_latency
+                return metrics
+            self.outbox.ack(ids[-1])
+        self.oldest = None
+        return metrics
+
+    def close(self) -> Optional[BatchMetrics]:
+        """
+        Flushes any remaining rows; call on shutdown.
+
+        Returns:
+            BatchMetrics or None: Metrics of the final batch, if any.
+        """
+        metrics = self.flush("shutdown")
+        self.outbox.close()
+        return metrics
+
+
+# ============================
+#     Latest-Value Sink
+# ============================
+
+class LatestValueSink:
+    """
+    Sink for "latest value wins" updates (e.g. the Firestore status document).
+
+    While the breaker is open, submitted items replace each other in a one-slot
+    local buffer instead of blocking; the buffered item is sent as the half-open
+    probe once the breaker allows it.
+    """
+
+    def __init__(self, send: Callable[[Any], bool], breaker: CircuitBreaker):
+        self.send = send
+        self.breaker = breaker
+        self.pending: Optional[Any] = None
+        self.diverted: int = 0
+
+    def submit(self, item: Any) -> None:
+        """
+        Sends an item now, or buffers it if the breaker is open.
+
+        Parameters:
+            item (Any): The update to send.
+        """
+        self.pending = item
+        self._try_send()
+
+    def _try_send(self) -> None:
+        if self.pending is None:
+            return
+        if not self.breaker.allow():
+            self.diverted += 1
+            return
+        item, self.pending = self.pending, None
+        try:
+            success = bool(self.send(item))
+        except Exception:
+            logging.exception("%s send failed", self.breaker.name)
+            success = False
+        self.breaker.record(success)
+        if not success and self.pending is None:
+            self.pending = item
+
+    def tick(self) -> float:
+        """
+        Retries the buffered item if the breaker allows it.
+
+        Returns:
+            float: Seconds until the next retry could happen.
+        """
+        self._try_send()
+        if self.pending is None:
+            return float("inf")
+        return max(self.breaker.retry_after(), 1.0)
+
+
+# ============================
+#    Heartbeat Coalescing
+# ============================
+
+class HeartbeatCoalescer:
+    """
+    Throttles "still alive" document writes.
+
+    Updates that change something (e.g. the machine status) are always sent;
+    heartbeat-only updates (just a newer PI_Timestamp) are sent at most once per
+    `period` seconds. Each period is randomized by +/- `jitter` so a fleet of Pis
+    restarted together (e.g. by the scheduled reboots) does not write in lockstep.
+    """
+
+    def __init__(
+        self,
+        period: float = FS_HEARTBEAT_PERIOD,
+        jitter: float = FS_HEARTBEAT_JITTER,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        self.period = period
+        self.jitter = jitter
+        self.clock = clock
+        self.rng = rng if rng is not None else random.Random()
+        self.next_heartbeat: float = 0.0   # The first update is always sent
+        self.sent: int = 0
+        self.avoided: int = 0              # Heartbeat writes skipped
+
+    def should_send(self, changed: bool) -> bool:
+        """
+        Decides whether an update should be written now.
+
+        Parameters:
+            changed (bool): True if the update changes more than the heartbeat timestamp.
+
+        Returns:
+            bool: True to write the update, False to skip it.
+        """
+        now = self.clock()
+        if not changed and now < self.next_heartbeat:
+            self.avoided += 1
+            return False
+        self.next_heartbeat = now + self.period * (1 + self.rng.uniform(-self.jitter, self.jitter))
+        self.sent += 1
+        return True
+
+    def time_until_due(self) -> float:
+        """
+        Returns:
+            float: Seconds until a heartbeat-only update would be sent (0 if one is due now).
+        """
+        return max(0.0, self.next_heartbeat - self.clock())
+
+
+# ============================
+#      Document Mirror
+# ============================
+
+class DocumentMirror:
+    """
+    Local copy of the fields of one Firestore document, so each write can send
+    only the fields that differ from what the document already holds.
+
+    The mirror is "known" once the document was read or fully written; until then
+    every desired field counts as changed and the caller should write with merge.
+    """
+
+    def __init__(self) -> None:
+        self.fields: Dict[str, Any] = {}
+        self.known: bool = False
+        self.fields_written: int = 0
+        self.fields_skipped: int = 0     # Unchanged fields left out of writes
+
+    def seed(self, fields: Optional[Dict[str, Any]]) -> None:
+        """
+        Replaces the mirror with the fields read from the document.
+
+        Parameters:
+            fields (dict or None): The document's fields, or None if it does not exist.
+        """
+        self.fields = dict(fields or {})
+        self.known = fields is not None
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """
+        Returns a field as last read or written.
+
+        Parameters:
+            name (str): Field name, e.g. "Status".
+            default (Any): Value returned if the field is not in the mirror.
+
+        Returns:
+            Any: The mirrored value, or `default`.
+        """
+        return self.fields.get(name, default)
+
+    def diff(self, desired: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Returns the desired fields whose value differs from the mirror.
+
+        Parameters:
+            desired (dict): Field values the document should hold.
+
+        Returns:
+            dict: The changed fields (every field while the mirror is unknown).
+        """
+        if not self.known:
+            return dict(desired)
+        return {name: value for name, value in desired.items()
+                if name not in self.fields or self.fields[name] != value}
+
+    def apply(self, changes: Dict[str, Any], skipped: int = 0) -> None:
+        """
+        Records a successful write.
+
+        Parameters:
+            changes (dict): The fields that were written.
+            skipped (int): Desired fields left out because they were unchanged.
+        """
+        self.fields.update(changes)
+        self.known = True
+        self.fields_written += len(changes)
+        self.fields_skipped += skipped
+
+
+def status_fields(mirror: DocumentMirror, location: str, status: str,
+                  status_time: Any, heartbeat_time: Any) -> Dict[str, Any]:
+    """
+    Builds the desired fields of a machine status document: "Timestamp" records
+    when the status last changed, "PI_Timestamp" when the Pi last reported.
+
+    Parameters:
+        mirror (DocumentMirror): Current state of the document.
+        location (str): Location name.
+        status (str): Current machine status.
+        status_time (datetime): Device time of the reading.
+        heartbeat_time (datetime): Time the Pi read the reading.
+
+    Returns:
+        dict: Field values the document should hold.
+    """
+    fields: Dict[str, Any] = {"Location": location, "Status": status, "PI_Timestamp": heartbeat_time}
+    if not mirror.known or mirror.get("Status") != status:
+        fields["Timestamp"] = status_time
+    return fields
@@ -0,0 +1,441 @@
+# /home/pi/local_store.py
+"""
+Local, on-disk state that must survive Wi-Fi outages and reboots.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# ============================
+#     Outbox Configuration
+# ============================
+OUTBOX_FILE: str = "/home/pi/outbox.sqlite3"   # SQLite database holding unsent rows
+OUTBOX_MAX_BYTES: int = 200 * 1024 * 1024      # Payload budget; oldest rows are evicted beyond it
+OUTBOX_MIN_FREE_BYTES: int = 100 * 1024 * 1024 # Keep at least this much free space on the SD card
+
+
+class MemoryOutbox:
+    """
+    In-process outbox with the same interface as SqliteOutbox.
+
+    Rows are lost if the process exits before they are acknowledged; used where
+    durability is not worth the SD-card writes (e.g. heartbeat rows).
+
+    `encode`, if given, turns a stored row into its JSON dict. Rows are then kept
+    in their compact form and only encoded when measured or peeked.
+    """
+
+    def __init__(self, max_rows: int = 100_000, encode: Optional[Callable[[Any], Dict[str, Any]]] = None) -> None:
+        self.rows: Deque[Tuple[int, Any, int]] = deque()
+        self.max_rows = max_rows
+        self.encode = encode
+        self.next_id: int = 1
+        self.pending_bytes: int = 0
+        self.evicted: int = 0
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self.rows)
+
+    def _encode(self, row: Any) -> Dict[str, Any]:
+        return self.encode(row) if self.encode is not None else row
+
+    def append(self, rows: List[Any]) -> None:
+        """
+        Stores rows at the tail of the outbox.
+
+        Parameters:
+            rows (list): Rows to store (JSON dicts, or records accepted by `encode`).
+        """
+        for row in rows:
+            size = len(json.dumps(self._encode(row), default=str))
+            self.rows.append((self.next_id, row, size))
+            self.next_id += 1
+            self.pending_bytes += size
+        while len(self.rows) > self.max_rows:
+            self.pending_bytes -= self.rows.popleft()[2]
+            self.evicted += 1
+
+    def peek(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Returns the oldest rows without removing them.
+
+        Parameters:
+            limit (int): Maximum number of rows to return.
+
+        Returns:
+            List[Tuple[int, dict]]: (row id, row) pairs in insertion order.
+        """
+        return [(row_id, self._encode(row)) for row_id, row, _ in list(self.rows)[:limit]]
+
+    def ack(self, up_to_id: int) -> None:
+        """
+        Deletes every row with an id up to and including `up_to_id`.
+
+        Parameters:
+            up_to_id (int): Id of the last acknowledged row.
+        """
+        while self.rows and self.rows[0][0] <= up_to_id:
+            self.pending_bytes -= self.rows.popleft()[2]
+
+    def remove(self, row_ids: List[int]) -> None:
+        """
+        Deletes specific rows, e.g. the delivered rows of a partly failed batch.
+
+        Parameters:
+            row_ids (list): Ids of the rows to delete.
+        """
+        if not row_ids:
+            return
+        wanted = set(row_ids)
+        kept: Deque[Tuple[int, Any, int]] = deque()
+        for entry in self.rows:
+            if entry[0] in wanted:
+                self.pending_bytes -= entry[2]
+            else:
+                kept.append(entry)
+        self.rows = kept
+
+    def close(self) -> None:
+        """Nothing to release for the in-memory outbox."""
+
+
+class SqliteOutbox(MemoryOutbox):
+    """
+    Append-only, crash-safe outbox stored in SQLite (WAL mode, full sync).
+
+    Every row is committed to disk before any upload is attempted, and only rows
+    acknowledged by the sink are deleted, so rows logged during an outage or
+    pending at a reboot are replayed in order on the next start.
+    """
+
+    def __init__(self, path: str = OUTBOX_FILE, max_bytes: int = OUTBOX_MAX_BYTES,
+                 min_free_bytes: int = OUTBOX_MIN_FREE_BYTES,
+                 encode: Optional[Callable[[Any], Dict[str, Any]]] = None):
+        self.path = path
+        self.encode = encode
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.evicted: int = 0
+        # Created by the main thread, then used only by the BigQuery stage
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        count, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outbox").fetchone()
+        self._pending_rows: int = count
+        self.pending_bytes: int = size
+        if count:
+            logging.info("Outbox %s holds %d unsent rows (%d bytes) from a previous run.", path, count, size)
+            self._enforce_budget()
+
+    @property
+    def pending_rows(self) -> int:
+        return self._pending_rows
+
+    def append(self, rows: List[Any]) -> None:
+        # One transaction (one fsync) and one free-space check per call, however many rows
+        payloads = [json.dumps(self._encode(row), default=str) for row in rows]
+        now = time.time()
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT INTO outbox (payload, size, created) VALUES (?, ?, ?)",
+                [(payload, len(payload), now) for payload in payloads],
+            )
+        self._pending_rows += len(payloads)
+        self.pending_bytes += sum(len(payload) for payload in payloads)
+        self._enforce_budget()
+
+    def _free_bytes(self) -> int:
+        stats = os.statvfs(os.path.dirname(os.path.abspath(self.path)))
+        return stats.f_bavail * stats.f_frsize
+
+    def _enforce_budget(self) -> None:
+        """Evicts the oldest rows while over the payload budget or short on disk."""
+        while self._pending_rows and (self.pending_bytes > self.max_bytes or self._free_bytes() < self.min_free_bytes):
+            batch = max(1, self._pending_rows // 10)
+            row = self.db.execute(
+                "SELECT MAX(id), COUNT(*), SUM(size) FROM (SELECT id, size FROM outbox ORDER BY id LIMIT ?)", (batch,)
+            ).fetchone()
+            self.db.execute("DELETE FROM outbox WHERE id <= ?", (row[0],))
+            self._pending_rows -= row[1]
+            self.pending_bytes -= row[2]
+            self.evicted += row[1]
+            logging.warning("Outbox over budget: evicted %d oldest rows (%d evicted in total).", row[1], self.evicted)
+
+    def peek(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        cursor = self.db.execute("SELECT id, payload FROM outbox ORDER BY id LIMIT ?", (limit,))
+        return [(row_id, json.loads(payload)) for row_id, payload in cursor]
+
+    def ack(self, up_to_id: int) -> None:
+        with self.db:
+            self.db.execute("BEGIN")
+            count, size = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outbox WHERE id <= ?", (up_to_id,)
+            ).fetchone()
+            self.db.execute("DELETE FROM outbox WHERE id <= ?", (up_to_id,))
+        self._pending_rows -= count
+        self.pending_bytes -= size
+
+    def remove(self, row_ids: List[int]) -> None:
+        if not row_ids:
+            return
+        count = size = 0
+        with self.db:
+            self.db.execute("BEGIN")
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(row_ids), 500):
+                chunk = row_ids[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                found, found_size = self.db.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outbox WHERE id IN ({marks})", chunk
+                ).fetchone()
+                self.db.execute(f"DELETE FROM outbox WHERE id IN ({marks})", chunk)
+                count += found
+                size += found_size
+        self._pending_rows -= count
+        self.pending_bytes -= size
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def open_outbox(path: Optional[str], encode: Optional[Callable[[Any], Dict[str, Any]]] = None) -> MemoryOutbox:
+    """
+    Opens the durable outbox, falling back to memory if the database is unusable.
+
+    Parameters:
+        path (str or None): SQLite file, or None for an in-memory outbox.
+        encode (callable or None): Turns a queued record into its JSON dict.
+
+    Returns:
+        MemoryOutbox: The outbox instance.
+    """
+    if path is None:
+        return MemoryOutbox(encode=encode)
+    try:
+        return SqliteOutbox(path, encode=encode)
+    except sqlite3.Error as e:
+        logging.error("Could not open outbox %s (%s); rows will only be kept in memory.", path, e)
+        return MemoryOutbox(encode=encode)
+
+
+# ============================
+#         Checkpoint
+# ============================
+CHECKPOINT_FILE: str = "/home/pi/checkpoint.json"  # Last log line and row handed to the outbox
+
+
+class Checkpoint:
+    """
+    Small JSON state file replaced atomically (write to a temp file, fsync, then
+    rename and fsync the directory), so a crash or power cut leaves either the
+    previous or the new checkpoint, never a torn one.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_FILE):
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """
+        Reads the checkpoint.
+
+        Returns:
+            dict or None: The saved state, or None if missing or unreadable.
+        """
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.error("Could not read checkpoint %s: %s", self.path, e)
+            return None
+
+    def save(self, state: Dict[str, Any]) -> None:
+        """
+        Replaces the checkpoint with `state`.
+
+        Parameters:
+            state (dict): JSON-serializable state to persist.
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+# ============================
+#       Deduplication
+# ============================
+DEDUP_FILE: str = "/home/pi/dedup.bin"   # Digests of log lines already handed to the outbox
+DEDUP_CAPACITY: int = 50_000             # Digests kept (about 28 h of lines at one per 2 s)
+DEDUP_DIGEST_SIZE: int = 8
+
+
+def line_digest(line: str) -> bytes:
+    """
+    Hashes the content of a log line (device timestamp and every reading).
+
+    Parameters:
+        line (str): A line from the log file.
+
+    Returns:
+        bytes: A short BLAKE2b digest of the stripped line.
+    """
+    return hashlib.blake2b(line.strip().encode("utf-8"), digest_size=DEDUP_DIGEST_SIZE).digest()
+
+
+class LineDeduplicator:
+    """
+    Bounded LRU of line digests, persisted across restarts.
+
+    The parser asks contains() before queueing a row; the sink calls add() once
+    the row is in the outbox, so a crash never marks an unsent line as seen.
+    persist() appends new digests to an append-only file that is compacted
+    when it grows past twice the capacity.
+    """
+
+    def __init__(self, path: Optional[str] = DEDUP_FILE, capacity: int = DEDUP_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.digests: "OrderedDict[bytes, None]" = OrderedDict()
+        self.unpersisted: List[bytes] = []
+        self.file_entries: int = 0
+        self.suppressed: int = 0     # Duplicate rows not inserted
+        self.checked: int = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logging.error("Could not read dedup file %s: %s", self.path, e)
+            return
+        usable = len(data) - len(data) % DEDUP_DIGEST_SIZE
+        self.file_entries = usable // DEDUP_DIGEST_SIZE
+        for pos in range(max(0, usable - self.capacity * DEDUP_DIGEST_SIZE), usable, DEDUP_DIGEST_SIZE):
+            self.digests[data[pos:pos + DEDUP_DIGEST_SIZE]] = None
+
+    def contains(self, digest: bytes) -> bool:
+        """
+        Checks a digest and counts it as suppressed if already seen.
+
+        Parameters:
+            digest (bytes): Digest from line_digest().
+
+        Returns:
+            bool: True if the line was already handed to the outbox.
+        """
+        with self.lock:
+            self.checked += 1
+            if digest in self.digests:
+                self.digests.move_to_end(digest)
+                self.suppressed += 1
+                return True
+            return False
+
+    def add(self, digest: bytes) -> None:
+        """
+        Records a digest whose row is now in the outbox.
+
+        Parameters:
+            digest (bytes): Digest from line_digest().
+        """
+        with self.lock:
+            self.digests[digest] = None
+            self.digests.move_to_end(digest)
+            while len(self.digests) > self.capacity:
+                self.digests.popitem(last=False)
+            self.unpersisted.append(digest)
+
+    def persist(self) -> None:
+        """Appends digests recorded since the last call to the dedup file."""
+        if self.path is None:
+            return
+        with self.lock:
+            pending, self.unpersisted = self.unpersisted, []
+            snapshot = list(self.digests) if self.file_entries + len(pending) > 2 * self.capacity else None
+        if snapshot is not None:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(snapshot))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.file_entries = len(snapshot)
+        elif pending:
+            with open(self.path, "ab") as f:
+                f.write(b"".join(pending))
+                f.flush()
+                os.fsync(f.fileno())
+            self.file_entries += len(pending)
+
+
+# ============================
+#        Dead Letters
+# ============================
+DEADLETTER_FILE: str = "/home/pi/bq_deadletter.jsonl"   # Rows BigQuery rejected as invalid
+DEADLETTER_MAX_BYTES: int = 20 * 1024 * 1024            # Rotated to <file>.1 beyond this size
+
+
+class DeadLetterFile:
+    """
+    Append-only JSON-lines file for rows BigQuery will never accept, kept so
+    they can be inspected and fixed by hand instead of blocking the outbox.
+    When the file grows past `max_bytes` it is renamed to `<path>.1`,
+    replacing the previous generation.
+    """
+
+    def __init__(self, path: str = DEADLETTER_FILE, max_bytes: int = DEADLETTER_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rows_written: int = 0
+        self.lock = threading.Lock()
+
+    def write(self, row: Dict[str, Any], errors: List[Dict[str, Any]]) -> None:
+        """
+        Appends a rejected row with the errors BigQuery reported for it.
+
+        Parameters:
+            row (dict): The JSON row.
+            errors (list): The row's error entries (reason, location, message).
+        """
+        record = json.dumps({"time": time.time(), "errors": errors, "row": row}, default=str)
+        with self.lock:
+            try:
+                if os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+            except FileNotFoundError:
+                pass
+            with open(self.path, "a") as f:
+                f.write(record + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.rows_written += 1
@@ -0,0 +1,235 @@
+# /home/pi/pipeline.py
+"""
+Thread-based pipeline stages joined by bounded queues.
+
+Each stage runs in its own thread and consumes (enqueued_at, payload) items
+from its inbox, so a slow cloud call only stalls its own stage. When a bounded
+queue fills, producers block (backpressure) or, for "latest value wins" data,
+the oldest item is dropped.
+"""
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, NamedTuple, Optional
+
+STOP = object()     # Sentinel that tells a stage to exit once its inbox is drained
+STAGE_BUDGET: float = 120.0     # Default seconds a stage may spend on one item without progress
+
+
+class StageSnapshot(NamedTuple):
+    """Metrics of one stage since the previous snapshot."""
+    name: str
+    depth: int              # Items waiting in the stage's inbox
+    items: int              # Items handled
+    dropped: int            # Items discarded because the inbox was full
+    mean_latency: float     # Seconds from enqueue to handled, averaged
+    max_latency: float
+
+
+class StageStats:
+    """Thread-safe counters for one pipeline stage."""
+
+    def __init__(self, name: str, inbox: Optional[queue.Queue] = None):
+        self.name = name
+        self.inbox = inbox
+        self.lock = threading.Lock()
+        self.items = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency: float) -> None:
+        """
+        Records one handled item.
+
+        Parameters:
+            latency (float): Seconds the item spent in the stage (queueing + handling).
+        """
+        with self.lock:
+            self.items += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_drop(self) -> None:
+        """Records one item discarded because the inbox was full."""
+        with self.lock:
+            self.dropped += 1
+
+    def snapshot(self) -> StageSnapshot:
+        """
+        Returns the metrics since the previous snapshot and resets them.
+
+        Returns:
+            StageSnapshot: Queue depth, throughput and latency of the stage.
+        """
+        with self.lock:
+            snap = StageSnapshot(
+                self.name,
+                self.inbox.qsize() if self.inbox is not None else 0,
+                self.items,
+                self.dropped,
+                self.total_latency / self.items if self.items else 0.0,
+                self.max_latency,
+            )
+            self.items = self.dropped = 0
+            self.total_latency = self.max_latency = 0.0
+        return snap
+
+
+class Liveness:
+    """
+    Progress tracker of one stage for the systemd watchdog.
+
+    The stage calls begin() before a unit of work and end() after it; long
+    operations call progress() as they advance. A stage waiting for work is
+    idle, and idle is alive; it is stalled once one unit of work has run for
+    more than `budget` seconds without progress, or once its thread died.
+    """
+
+    def __init__(self, name: str, budget: float = STAGE_BUDGET, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.budget = budget
+        self.clock = clock
+        self.busy_since: Optional[float] = None
+        self.thread: Optional[threading.Thread] = None   # Checked for liveness when set
+
+    def begin(self) -> None:
+        self.busy_since = self.clock()
+        self.thread = self.thread or threading.current_thread()
+
+    def progress(self) -> None:
+        if self.busy_since is not None:
+            self.busy_since = self.clock()
+
+    def end(self) -> None:
+        self.busy_since = None
+
+    def stalled(self) -> Optional[str]:
+        """
+        Returns:
+            str or None: Why the stage is considered stalled, or None if it is alive.
+        """
+        if self.thread is not None and not self.thread.is_alive():
+            return f"{self.name} thread has exited"
+        busy_since = self.busy_since
+        if busy_since is not None and self.clock() - busy_since > self.budget:
+            return f"{self.name} has been busy for {self.clock() - busy_since:.0f} s (budget {self.budget:.0f} s)"
+        return None
+
+
+def put(inbox: queue.Queue, payload: Any, liveness: Optional[Liveness] = None) -> None:
+    """
+    Enqueues a payload, blocking while the queue is full (backpressure).
+
+    With `liveness`, the producer counts as idle while it is blocked: it waits on
+    the consumer, whose own liveness covers the wait. Each accepted payload
+    counts as progress.
+
+    Parameters:
+        inbox (queue.Queue): Destination queue.
+        payload (Any): Item to enqueue.
+        liveness (Liveness or None): Progress tracker of the producing stage.
+    """
+    item = (time.monotonic(), payload)
+    if liveness is None:
+        inbox.put(item)
+        return
+    try:
+        inbox.put_nowait(item)
+    except queue.Full:
+        liveness.end()
+        inbox.put(item)
+        liveness.begin()
+    else:
+        liveness.progress()
+
+
+def put_latest(inbox: queue.Queue, payload: Any, stats: Optional[StageStats] = None) -> None:
+    """
+    Enqueues a payload without blocking, dropping the oldest item if the queue is full.
+
+    Parameters:
+        inbox (queue.Queue): Destination queue.
+        payload (Any): Item to enqueue.
+        stats (StageStats or None): Consumer stats to record drops against.
+    """
+    item = (time.monotonic(), payload)
+    while True:
+        try:
+            inbox.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                inbox.get_nowait()
+                if stats is not None:
+                    stats.record_drop()
+            except queue.Empty:
+                pass
+
+
+class Stage(threading.Thread):
+    """
+    Worker thread that applies `handle` to every payload in its inbox.
+
+    `tick`, if given, is called whenever the inbox has been idle for the number
+    of seconds it last returned, which lets a sink flush on a timer. Each
+    handle / tick call is tracked by `liveness` for the watchdog.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        inbox: queue.Queue,
+        handle: Callable[[Any], None],
+        tick: Optional[Callable[[], float]] = None,
+        budget: float = STAGE_BUDGET,
+    ):
+        super().__init__(name=name, daemon=True)
+        self.inbox = inbox
+        self.handle = handle
+        self.tick = tick
+        self.stats = StageStats(name, inbox)
+        self.liveness = Liveness(name, budget)
+
+    def run(self) -> None:
+        self.liveness.thread = self
+        timeout: Optional[float] = None
+        while True:
+            try:
+                item = self.inbox.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is not None and item[1] is STOP:
+                return
+            if item is not None:
+                enqueued_at, payload = item
+                self.liveness.begin()
+                try:
+                    self.handle(payload)
+                except Exception:
+                    logging.exception("Pipeline stage %s failed", self.name)
+                self.liveness.end()
+                self.stats.record(time.monotonic() - enqueued_at)
+            if self.tick is not None:
+                self.liveness.begin()
+                try:
+                    timeout = max(0.05, min(self.tick(), 60.0))
+                except Exception:
+                    logging.exception("Pipeline stage %s timer failed", self.name)
+                    timeout = 1.0
+                self.liveness.end()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Asks the stage to finish its queued work and waits for it.
+
+        Parameters:
+            timeout (float or None): Seconds to wait for the thread.
+
+        Returns:
+            bool: True if the thread exited within the timeout.
+        """
+        put(self.inbox, STOP)
+        self.join(timeout)
+        return not self.is_alive()
@@ -1,10 +1,15 @@
+import sys
 import time
-import random
+import signal
 import subprocess
+from collections import Counter
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from google.cloud import bigquery, firestore
-from google.oauth2 import service_account
+from gcp_clients import LazyClients, TokenCache, TokenRefresher, load_credentials, make_clients
+from gcp_sinks import (BQ_BATCH_MAX_BYTES, BQ_BATCH_MAX_ROWS, FS_HEARTBEAT_JITTER, FS_HEARTBEAT_PERIOD,
+                       BigQueryBatchWriter, CallStats, HeartbeatCoalescer, call_with_deadline, insert_rows,
+                       row_insert_id)
+from local_store import DeadLetterFile
 
 # ============================
 #      Configuration
@@ -14,28 +19,57 @@ CURRENT_LOCATION = "Montreal"                        # Location name (str)
 LOCATION_INFO = "POINT(-73.5961598 45.4748343)"      # Geographical coordinates (str)
 
 SERVICE_ACCOUNT_FILE = "2-auth-key.json"             # Path to GCP service account file (str)
+TOKEN_CACHE_FILE = ".gcp_token.json"                 # Access token reused across restarts (str)
 PROJECT_ID = "gf-canada-iot"                         # GCP project ID (str)
 DATASET_ID = "GF_CAN_Machines"                       # BigQuery dataset ID (str)
 TABLE_ID = "pi-monitoring"                           # BigQuery table ID (str)
 FIRESTORE_COLLECTION = "gamma_machines_status"       # Firestore collection name (str)
+GCP_TRANSPORT = "official"                           # "official" or "rest" (lean google-auth + HTTP client) (str)
+
+# Batch size limits (BQ_BATCH_MAX_ROWS / _BYTES) and the heartbeat throttle (FS_HEARTBEAT_*) come from gcp_sinks.py
+BQ_BATCH_MAX_LATENCY = 60.0                          # Flush once the oldest row is this old, in seconds (float)
+CALL_TIMEOUT = 10.0                                  # Seconds one BigQuery or Firestore request may take (float)
+CYCLE_DEADLINE = 20.0                                # Seconds a cycle's Firestore write may take, retries included (float)
+BQ_DEADLINE = 45.0                                   # Seconds a BigQuery batch may take, retries included (float)
+DEADLETTER_FILE = "bq_deadletter.jsonl"              # Rows BigQuery rejected as invalid (str)
+
+# Attempts, timeouts and expired deadlines of the cloud calls
+bq_calls = CallStats("BigQuery insert")
+fs_calls = CallStats("Firestore write")
+# Rows BigQuery rejected, counted per error reason
+bq_row_errors = Counter()
+dead_letters = DeadLetterFile(DEADLETTER_FILE)
+
+# Access token persisted across restarts and refreshed before it expires
+token_cache = TokenCache(TOKEN_CACHE_FILE)
+token_refresher = TokenRefresher(token_cache)
+
+def build_clients():
+    """
+    Load credentials, with the cached access token if it is still valid, and
+    build the BigQuery and Firestore clients.
+
+    Returns:
+        tuple: (BigQuery client, Firestore client).
+    """
+    credentials = load_credentials(SERVICE_ACCOUNT_FILE, token_cache)
+    built = make_clients(GCP_TRANSPORT, PROJECT_ID, credentials)
+    token_refresher.track(credentials)
+    return built
 
-# Initialize credentials and clients for BigQuery and Firestore
-credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
-bigquery_client = bigquery.Client(project=PROJECT_ID, credentials=credentials)
-firestore_client = firestore.Client(project=PROJECT_ID, credentials=credentials)
+# Clients for BigQuery and Firestore, built in the background on startup
+clients = LazyClients(build_clients)
 
 def reinitialize_gcp_auth_session() -> None:
     """
-    Reinitialize the GCP authentication session by reloading credentials and 
-    reinitializing the BigQuery and Firestore clients.
+    Reinitialize the GCP authentication session: the next call reloads the
+    credentials and rebuilds the BigQuery and Firestore clients. A cached
+    access token that is still valid is reused, so no token exchange is needed.
     
     Returns:
         None
     """
-    global bigquery_client, firestore_client, credentials
-    credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
-    bigquery_client = bigquery.Client(project=PROJECT_ID, credentials=credentials)
-    firestore_client = firestore.Client(project=PROJECT_ID, credentials=credentials)
+    clients.reset()
     print("Reinitialized GCP auth session.")
 
 def reset_wifi() -> None:
@@ -62,66 +96,68 @@ def generate_timestamp() -> str:
     """
     return datetime.now(ZoneInfo("UTC")).strftime("%Y-%m-%d %H:%M:%S.%f UTC")
 
-def retry_operation(operation, *args, max_retries: int = 5, base_delay: float = 1, **kwargs):
+def update_firestore(data: dict, timeout: float) -> None:
     """
-    Retry an operation using exponential backoff.
+    Update this machine's Firestore document with the provided data.
 
     Args:
-        operation (callable): The function to execute.
-        *args: Positional arguments for the operation.
-        max_retries (int): Maximum retry attempts.
-        base_delay (float): Initial delay in seconds before retrying.
-        **kwargs: Keyword arguments for the operation.
+        data (dict): Data to update the document with.
+        timeout (float): Seconds the request may take.
     
     Returns:
-        Any: Result of the successful operation.
-    
-    Raises:
-        Exception: The last exception if all retry attempts fail.
+        None
     """
-    for attempt in range(max_retries):
-        try:
-            return operation(*args, **kwargs)
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise e
-            sleep_time = base_delay * (2 ** attempt) + random.uniform(0, 0.1)
-            time.sleep(sleep_time)
+    doc_ref = clients.firestore(timeout).collection(FIRESTORE_COLLECTION).document(MACHINE_NAME)
+    doc_ref.update(data, timeout=timeout, retry=None)
 
-def update_firestore(doc_ref, data: dict) -> None:
+def insert_bigquery_rows(table_id: str, rows: list, row_ids: list, timeout: float) -> list:
     """
-    Update a Firestore document with the provided data.
+    Insert rows into a BigQuery table.
 
     Args:
-        doc_ref: Firestore document reference.
-        data (dict): Data to update the document with.
+        table_id (str): Full identifier for the BigQuery table.
+        rows (list): List of dictionaries representing rows to insert.
+        row_ids (list): insertId of each row.
+        timeout (float): Seconds the request may take.
     
     Returns:
-        None
+        list: Per-row errors reported by BigQuery (empty if every row was inserted).
     """
-    doc_ref.update(data)
+    return clients.bigquery(timeout).insert_rows_json(table_id, rows, row_ids=row_ids, timeout=timeout, retry=None)
 
-def insert_bigquery_rows(table_id: str, rows: list) -> None:
+def send_bigquery_batch(table_id: str, rows: list) -> list:
     """
-    Insert rows into a BigQuery table. Raises an exception if errors occur.
+    Insert a batch of rows with retry logic bounded by BQ_DEADLINE, resetting
+    WiFi and the GCP session if rows are still unsent once it runs out. Each
+    row's insertId is derived from its machine and timestamp, so retries do not
+    duplicate rows BigQuery already accepted. Only rows that failed with a
+    retryable reason are resent; invalid rows are written to DEADLETTER_FILE.
 
     Args:
         table_id (str): Full identifier for the BigQuery table.
         rows (list): List of dictionaries representing rows to insert.
     
     Returns:
-        None
-
-    Raises:
-        Exception: If BigQuery insertion returns errors.
+        list: Indices of the rows still unsent (empty if every row was inserted or dead-lettered).
     """
-    errors = bigquery_client.insert_rows_json(table_id, rows)
-    if errors:
-        raise Exception(f"BigQuery errors: {errors}")
+    row_ids = [row_insert_id(row, ("Machine", "Timestamp")) for row in rows]
+    dead_lettered = dead_letters.rows_written
+    pending = insert_rows(lambda batch, batch_ids, timeout: insert_bigquery_rows(table_id, batch, batch_ids, timeout),
+                          rows, row_ids, bq_calls, bq_row_errors, dead_letters.write,
+                          deadline=BQ_DEADLINE, call_timeout=CALL_TIMEOUT)
+    rejected = dead_letters.rows_written - dead_lettered
+    if rejected:
+        print(f"{rejected} invalid rows written to {DEADLETTER_FILE} (row errors: {dict(bq_row_errors)}).")
+    if pending:
+        print(f"BigQuery insert error: {len(pending)} of {len(rows)} rows unsent ({bq_calls}, row errors: {dict(bq_row_errors)})")
+        reset_wifi()
+        reinitialize_gcp_auth_session()
+    return pending
 
 def monitor_and_update_firestore_bigquery(interval: int = 2) -> None:
     """
     Continuously monitor and update Firestore and BigQuery with new timestamp data.
+    BigQuery rows are batched and flushed by size or age, and on shutdown.
     If updates fail, performs a WiFi reset and reinitializes GCP authentication.
 
     Args:
@@ -131,7 +167,31 @@ def monitor_and_update_firestore_bigquery(interval: int = 2) -> None:
         None
     """
     table_id = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
-    doc_ref = firestore_client.collection(FIRESTORE_COLLECTION).document(MACHINE_NAME)
+    bq_writer = BigQueryBatchWriter(
+        lambda rows: send_bigquery_batch(table_id, rows),
+        BQ_BATCH_MAX_ROWS, BQ_BATCH_MAX_BYTES, BQ_BATCH_MAX_LATENCY,
+    )
+    try:
+        monitor_loop(bq_writer, interval)
+    finally:
+        bq_writer.close()
+
+def monitor_loop(bq_writer: BigQueryBatchWriter, interval: int) -> None:
+    """
+    Run the heartbeat cycle until the process is stopped. Every cycle queues a
+    BigQuery row; the Firestore PI_Timestamp is only written once per
+    FS_HEARTBEAT_PERIOD (with jitter), and may take at most CYCLE_DEADLINE
+    seconds so a hung request cannot stall the heartbeat.
+
+    Args:
+        bq_writer (BigQueryBatchWriter): Batching writer for BigQuery rows.
+        interval (int): Time in seconds between each update cycle.
+    
+    Returns:
+        None
+    """
+    clients.start()
+    heartbeats = HeartbeatCoalescer(FS_HEARTBEAT_PERIOD, FS_HEARTBEAT_JITTER)
     
     while True:
         try:
@@ -139,25 +199,22 @@ def monitor_and_update_firestore_bigquery(interval: int = 2) -> None:
             timestamp = generate_timestamp()
             data = {"Timestamp": timestamp, "Machine": MACHINE_NAME}
             
-            # Update Firestore with retry logic
+            # Update Firestore with retry logic, at most once per heartbeat period
             try:
-                # Convert timestamp string to datetime object for Firestore
-                ts = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f UTC")
-                retry_operation(update_firestore, doc_ref, {"PI_Timestamp": ts})
+                if heartbeats.should_send(changed=False):
+                    # Convert timestamp string to datetime object for Firestore
+                    ts = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f UTC")
+                    call_with_deadline(lambda timeout: update_firestore({"PI_Timestamp": ts}, timeout),
+                                       fs_calls, deadline=CYCLE_DEADLINE, call_timeout=CALL_TIMEOUT)
+                    print(f"Firestore heartbeat written ({heartbeats.avoided} writes avoided so far).")
             except Exception as e:
-                print(f"Firestore update error: {e}")
+                print(f"Firestore update error: {e} ({fs_calls})")
                 reset_wifi()
                 reinitialize_gcp_auth_session()
-                # Update document reference with the renewed firestore_client
-                doc_ref = firestore_client.collection(FIRESTORE_COLLECTION).document(MACHINE_NAME)
             
-            # Insert data into BigQuery with retry logic
-            try:
-                retry_operation(insert_bigquery_rows, table_id, [data])
-            except Exception as e:
-                print(f"BigQuery insert error: {e}")
-                reset_wifi()
-                reinitialize_gcp_auth_session()
+            # Queue the row for BigQuery; full or overdue batches are sent with retry logic
+            bq_writer.add(data)
+            bq_writer.maybe_flush()
             
         except Exception as e:
             print(f"Monitoring error: {e}")
@@ -165,4 +222,6 @@ def monitor_and_update_firestore_bigquery(interval: int = 2) -> None:
         time.sleep(interval)
 
 if __name__ == "__main__":
+    # Turn systemd's SIGTERM into SystemExit so buffered rows are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     monitor_and_update_firestore_bigquery()
@@ -0,0 +1,212 @@
+# /home/pi/service.py
+"""
+Integration with systemd: readiness gates checked at startup, sd_notify
+messages (READY=1, STATUS=...) sent over $NOTIFY_SOCKET, and the watchdog.
+
+Instead of sleeping a fixed time before starting, the service waits for the
+conditions it actually needs. Each gate polls its own check, starts as soon as
+the gates it requires have passed, and gives up after its own timeout.
+"""
+import os
+import sys
+import socket
+import traceback
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+GATE_POLL_INTERVAL: float = 0.2       # Seconds between two checks of a gate
+
+
+def sd_notify(state: str) -> bool:
+    """
+    Sends a state string (e.g. "READY=1") to systemd's notification socket.
+
+    Parameters:
+        state (str): One or more newline-separated KEY=VALUE assignments.
+
+    Returns:
+        bool: True if sent; False when not run by systemd or on error.
+    """
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        address = "\0" + address[1:]   # Abstract socket namespace
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode("utf-8"))
+        return True
+    except OSError as e:
+        logging.warning("sd_notify(%r) failed: %s", state, e)
+        return False
+
+
+def tcp_reachable(host: str, port: int = 443, timeout: float = 2.0) -> bool:
+    """
+    Resolves `host` and opens (then closes) a TCP connection to it.
+
+    Parameters:
+        host (str): Host name.
+        port (int): TCP port.
+        timeout (float): Seconds for the connection attempt.
+
+    Returns:
+        bool: True if DNS and the route work. Raises OSError otherwise.
+    """
+    with socket.create_connection((host, port), timeout=timeout):
+        return True
+
+
+class GateResult(NamedTuple):
+    name: str
+    ready: bool
+    waited: float      # Seconds from the gate's start (its prerequisites passing) to the outcome
+    detail: str        # Last failure when not ready
+
+
+class Gate:
+    """One readiness condition, polled until `check()` returns True or `timeout` expires."""
+
+    def __init__(self, name: str, check: Callable[[], bool], timeout: float,
+                 requires: Tuple[str, ...] = (), poll_interval: float = GATE_POLL_INTERVAL):
+        self.name = name
+        self.check = check
+        self.timeout = timeout
+        self.requires = requires
+        self.poll_interval = poll_interval
+
+
+class ReadinessGates:
+    """
+    Runs every gate on its own thread. A gate whose prerequisite failed fails
+    immediately. `on_done` is called (on the gate's thread) with each result.
+    """
+
+    def __init__(self, gates: Iterable[Gate], on_done: Optional[Callable[[GateResult], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.gates: Dict[str, Gate] = {gate.name: gate for gate in gates}
+        self.on_done = on_done
+        self.clock = clock
+        self.done: Dict[str, threading.Event] = {name: threading.Event() for name in self.gates}
+        self.results: Dict[str, GateResult] = {}
+
+    def start(self) -> "ReadinessGates":
+        for gate in self.gates.values():
+            threading.Thread(target=self._run, args=(gate,), name=f"gate-{gate.name}", daemon=True).start()
+        return self
+
+    def _run(self, gate: Gate) -> None:
+        result: Optional[GateResult] = None
+        for name in gate.requires:
+            self.done[name].wait()
+            if not self.results[name].ready:
+                result = GateResult(gate.name, False, 0.0, f"{name} is not ready")
+        if result is None:
+            result = self._poll(gate)
+        self.results[gate.name] = result
+        self.done[gate.name].set()
+        if result.ready:
+            logging.info("Startup gate %s ready after %.2f s.", gate.name, result.waited)
+        else:
+            logging.error("Startup gate %s not ready after %.2f s: %s", gate.name, result.waited, result.detail)
+        if self.on_done is not None:
+            try:
+                self.on_done(result)
+            except Exception:
+                logging.exception("Startup gate %s callback failed", gate.name)
+
+    def _poll(self, gate: Gate) -> GateResult:
+        start = self.clock()
+        detail = "timed out"
+        while True:
+            try:
+                if gate.check():
+                    return GateResult(gate.name, True, self.clock() - start, "")
+                detail = "not ready"
+            except Exception as e:
+                detail = str(e) or type(e).__name__
+            remaining = start + gate.timeout - self.clock()
+            if remaining <= 0:
+                return GateResult(gate.name, False, self.clock() - start, detail)
+            time.sleep(min(gate.poll_interval, remaining))
+
+    def wait(self, *names: str) -> List[GateResult]:
+        """
+        Blocks until the named gates have passed or failed.
+
+        Parameters:
+            *names (str): Gate names.
+
+        Returns:
+            list: Their results, in the same order.
+        """
+        for name in names:
+            self.done[name].wait()
+        return [self.results[name] for name in names]
+
+
+# ============================
+#          Watchdog
+# ============================
+
+def watchdog_interval() -> Optional[float]:
+    """
+    Reads the watchdog period systemd configured for this process (WatchdogSec=).
+
+    Returns:
+        float or None: Seconds between required pings, or None if the watchdog is off.
+    """
+    usec = os.environ.get("WATCHDOG_USEC")
+    pid = os.environ.get("WATCHDOG_PID")
+    if not usec or (pid and pid != str(os.getpid())):
+        return None
+    return int(usec) / 1e6
+
+
+class Watchdog(threading.Thread):
+    """
+    Pings the systemd watchdog (WATCHDOG=1) every `interval` seconds, but only
+    while no tracked stage is stalled. `stages` are objects with `stalled()`
+    returning None or a reason (see pipeline.Liveness). When a stage stalls,
+    the reason and its thread's stack are logged once and pings stop, so
+    systemd restarts the service after WatchdogSec.
+    """
+
+    def __init__(self, stages: List[Any], interval: float):
+        super().__init__(name="watchdog", daemon=True)
+        self.stages = stages
+        self.interval = interval
+        self.pings: int = 0
+        self.withheld: int = 0
+        self.stopping = threading.Event()
+
+    def run(self) -> None:
+        reported: Dict[str, str] = {}
+        while not self.stopping.wait(self.interval):
+            reasons = [(stage, stage.stalled()) for stage in self.stages]
+            stalled = [(stage, reason) for stage, reason in reasons if reason is not None]
+            if not stalled:
+                if reported:
+                    logging.info("Watchdog: all stages are making progress again.")
+                    reported.clear()
+                sd_notify("WATCHDOG=1")
+                self.pings += 1
+                continue
+            self.withheld += 1
+            for stage, reason in stalled:
+                if stage.name not in reported:
+                    logging.error("Watchdog: %s; withholding the watchdog ping.\n%s", reason, thread_stack(stage.thread))
+                    reported[stage.name] = reason
+            sd_notify("STATUS=Stalled: " + "; ".join(reason for _, reason in stalled))
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+
+def thread_stack(thread: Optional[threading.Thread]) -> str:
+    """Formats the current stack of a thread, to show where a stalled stage is stuck."""
+    frame = sys._current_frames().get(thread.ident) if thread is not None and thread.ident else None
+    return "".join(traceback.format_stack(frame)) if frame is not None else "(no stack)"
@@ -0,0 +1,265 @@
+# tests/test_gam_image.py
+"""
+Checks the in-process FAT32 reader of gam_image.py against a small FAT32 image
+built by the test itself (boot sector, two FATs, a root directory with 8.3
+entries and fragmented cluster chains), written in place the way the USB
+gadget updates /piusb.bin. Neither mtools nor a real image is needed:
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+import struct
+import tempfile
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gam_image import Fat32Error, Fat32Image, Fat32LogReader, MtypeLogReader, make_log_reader  # noqa: E402
+
+HEADER = "GAMA LOG TYPE: G-250 H D;VERSION: 090617;METRIC: N"
+
+
+class SyntheticImage:
+    """
+    Minimal FAT32 image: 512-byte sectors, one sector per cluster, two FATs and
+    the root directory in cluster 2. Files are rewritten in place, keeping their
+    first cluster, like the gadget's host appending to or truncating a file.
+    """
+
+    SECTOR = 512
+    RESERVED_SECTORS = 32
+    FATS = 2
+    FAT_SECTORS = 4         # 512 FAT entries
+    CLUSTERS = 400
+
+    def __init__(self, path: str):
+        self.path = path
+        self.image = bytearray((self.RESERVED_SECTORS + self.FATS * self.FAT_SECTORS + self.CLUSTERS) * self.SECTOR)
+        struct.pack_into("<HBHB", self.image, 11, self.SECTOR, 1, self.RESERVED_SECTORS, self.FATS)
+        struct.pack_into("<I", self.image, 36, self.FAT_SECTORS)
+        struct.pack_into("<I", self.image, 44, 2)
+        self.image[510:512] = b"\x55\xaa"
+        self.fat: List[int] = [0x0FFFFFF8, 0x0FFFFFFF, 0x0FFFFFFF] + [0] * (self.FAT_SECTORS * 128 - 3)
+        self.next_free = 3
+        self.slots = 0
+        self.files: Dict[str, Tuple[int, List[int]]] = {}     # name -> (directory slot, cluster chain)
+        # Entries the reader must skip: a volume label, a long-name entry and a deleted LOGGER.GAM
+        self._entry(self._new_slot(), b"GAMMA USB  ", 0x08, 0, 0, 0)
+        self._entry(self._new_slot(), b"Alogger.gam", 0x0F, 0, 0, 0)
+        self._entry(self._new_slot(), b"\xe5OGGER  GAM", 0x20, 0, 0, 0)
+        self._flush()
+
+    def _new_slot(self) -> int:
+        self.slots += 1
+        return self.slots - 1
+
+    def _cluster_offset(self, cluster: int) -> int:
+        return (self.RESERVED_SECTORS + self.FATS * self.FAT_SECTORS + cluster - 2) * self.SECTOR
+
+    def _entry(self, slot: int, name: bytes, attributes: int, first_cluster: int, size: int, write_time: int) -> None:
+        raw = bytearray(32)
+        raw[0:11] = name
+        raw[11] = attributes
+        struct.pack_into("<HHHHI", raw, 20, first_cluster >> 16, write_time, 0x5A62, first_cluster & 0xFFFF, size)
+        offset = self._cluster_offset(2) + slot * 32
+        self.image[offset:offset + 32] = raw
+
+    def _flush(self) -> None:
+        fat = struct.pack(f"<{len(self.fat)}I", *self.fat)
+        for copy in range(self.FATS):
+            offset = (self.RESERVED_SECTORS + copy * self.FAT_SECTORS) * self.SECTOR
+            self.image[offset:offset + len(fat)] = fat
+        # In place, like the gadget: readers keep their descriptor open
+        with open(self.path, "r+b" if os.path.exists(self.path) else "wb") as f:
+            f.write(self.image)
+
+    def write(self, name: str, data: bytes, write_time: int = 0x6000, gap: int = 0) -> int:
+        """
+        Replaces the content of a root-directory file, keeping its first cluster.
+
+        Parameters:
+            name (str): 8.3 file name, e.g. "LOGGER.GAM".
+            data (bytes): New content.
+            write_time (int): Raw FAT time word of the directory entry.
+            gap (int): Free clusters skipped before each new cluster, to fragment the chain.
+
+        Returns:
+            int: The first cluster of the file.
+        """
+        slot, chain = self.files.get(name) or (self._new_slot(), [])
+        needed = max(1, -(-len(data) // self.SECTOR))
+        while len(chain) < needed:
+            chain.append(self.next_free + gap)
+            self.next_free += gap + 1
+        for cluster in chain[needed:]:
+            self.fat[cluster] = 0
+        del chain[needed:]
+        for cluster, next_cluster in zip(chain, chain[1:] + [0x0FFFFFFF]):
+            self.fat[cluster] = next_cluster
+        for index, cluster in enumerate(chain):
+            offset = self._cluster_offset(cluster)
+            self.image[offset:offset + self.SECTOR] = data[index * self.SECTOR:(index + 1) * self.SECTOR].ljust(self.SECTOR, b"\0")
+        base, _, ext = name.partition(".")
+        self._entry(slot, (base.ljust(8) + ext.ljust(3)).encode(), 0x20, chain[0], len(data), write_time)
+        self.files[name] = (slot, chain)
+        self._flush()
+        return chain[0]
+
+
+def log_line(counter: int) -> str:
+    return f"03-02-2025 12:{counter // 60 % 60:02d}:{counter % 60:02d};91597;82;80;90;88;81;69;500;1;0;0;620;770;{counter};0"
+
+
+def text(lines: List[str]) -> bytes:
+    return "".join(line + "\r\n" for line in lines).encode()
+
+
+def image_path() -> str:
+    return os.path.join(tempfile.mkdtemp(), "piusb.bin")
+
+
+def test_read_lines_across_clusters() -> None:
+    path = image_path()
+    image = SyntheticImage(path)
+    lines = [HEADER] + [log_line(940 + i) for i in range(40)]
+    first_cluster = image.write("LOGGER.GAM", text(lines), gap=1)
+
+    reader = make_log_reader("fat32", "p:/LOGGER.GAM", path, fallback=False)
+    try:
+        assert isinstance(reader, Fat32LogReader)
+        entry = reader.image.find_entry("LOGGER.GAM")
+        assert entry.first_cluster == first_cluster and entry.size == len(text(lines))
+        # The file spans 6 clusters, every other one, so each read follows the FAT
+        chain = reader.image.cluster_chain(entry.first_cluster)
+        assert chain == list(range(first_cluster, first_cluster + 12, 2))
+        assert reader.read_lines() == lines
+        assert reader.image.find_entry("LOGS_BKP.GAM") is None
+    finally:
+        reader.close()
+
+
+def test_tail_append_partial_line_and_rotation() -> None:
+    path = image_path()
+    image = SyntheticImage(path)
+    lines = [HEADER] + [log_line(940 + i) for i in range(5)]
+    image.write("LOGGER.GAM", text(lines))
+    reader = Fat32LogReader("LOGGER.GAM", path)
+    try:
+        assert reader.read_new_lines() == (lines, False)
+        assert reader.read_new_lines() == ([], False)
+
+        # Appended lines cross into the following clusters
+        appended = [log_line(945 + i) for i in range(20)]
+        image.write("LOGGER.GAM", text(lines + appended))
+        assert reader.read_new_lines() == (appended, False)
+
+        # A line still being written is left for the next poll...
+        partial = log_line(965)
+        image.write("LOGGER.GAM", text(lines + appended) + partial[:25].encode())
+        assert reader.read_new_lines() == ([], False)
+        # ...and returned whole once its line ending lands
+        image.write("LOGGER.GAM", text(lines + appended + [partial, log_line(966)]))
+        assert reader.read_new_lines() == ([partial, log_line(966)], False)
+
+        # Rotation: the file shrinks but keeps its first cluster
+        first_cluster = reader.first_cluster
+        rotated = [HEADER, log_line(1000)]
+        assert image.write("LOGGER.GAM", text(rotated)) == first_cluster
+        assert reader.read_new_lines() == (rotated, True)
+        assert reader.read_new_lines() == ([], False)
+    finally:
+        reader.close()
+
+
+def test_backlog_stops_at_uploaded_lines() -> None:
+    path = image_path()
+    image = SyntheticImage(path)
+    lines = [HEADER] + [log_line(940 + i) for i in range(30)]
+    image.write("LOGS_BKP.GAM", text(lines), gap=2)
+    image.write("LOGGER.GAM", text([HEADER]))
+
+    def is_newer(line: str) -> bool:
+        return line != HEADER and int(line.split(";")[14]) > 955
+
+    reader = Fat32LogReader("LOGGER.GAM", path)
+    try:
+        # Backlog smaller than one chunk: a single read from the top
+        assert reader.read_backlog("LOGS_BKP.GAM", is_newer) == lines[17:]
+        # Chunks shorter than a line: the cut line is carried to the previous chunk
+        assert reader.read_backlog("LOGS_BKP.GAM", is_newer, chunk_size=50) == lines[17:]
+        assert reader.read_backlog("LOGS_BKP.GAM", lambda line: True, chunk_size=100) == lines
+        assert reader.read_backlog("MISSING.GAM", is_newer) == []
+    finally:
+        reader.close()
+
+
+def test_probe_skips_unchanged_entry() -> None:
+    path = image_path()
+    image = SyntheticImage(path)
+    lines = [HEADER] + [log_line(940 + i) for i in range(5)]
+    image.write("LOGGER.GAM", text(lines))
+    reader = Fat32LogReader("LOGGER.GAM", path)
+    calls = {"find_entry": 0, "read_file": 0}
+
+    def counted(name):
+        method = getattr(reader.image, name)
+
+        def wrapper(*args):
+            calls[name] += 1
+            return method(*args)
+        return wrapper
+
+    reader.image.find_entry = counted("find_entry")
+    reader.image.read_file = counted("read_file")
+
+    def poll() -> List[str]:
+        # What the tailer does each poll: read only when the probe saw a change
+        return reader.read_lines() if reader.has_changed() else []
+
+    try:
+        assert poll() == lines
+        assert calls == {"find_entry": 1, "read_file": 1}
+        # Unchanged entry: one 32-byte read each, no directory scan and no file read
+        for _ in range(3):
+            assert poll() == []
+        assert calls == {"find_entry": 1, "read_file": 1}
+        assert reader.probe_counters() == (3, 1)
+
+        # A size change triggers the read
+        lines.append(log_line(945))
+        image.write("LOGGER.GAM", text(lines))
+        assert poll() == lines
+        # So does a write-time change alone
+        image.write("LOGGER.GAM", text(lines), write_time=0x6001)
+        assert poll() == lines
+        assert poll() == []
+        assert calls == {"find_entry": 1, "read_file": 3}
+        assert reader.probe_counters() == (4, 3)
+    finally:
+        reader.close()
+
+
+def test_not_a_fat32_image() -> None:
+    path = image_path()
+    with open(path, "wb") as f:
+        f.write(bytes(4096))
+    try:
+        Fat32Image(path)
+        raise AssertionError("an image without a boot sector was opened")
+    except Fat32Error:
+        pass
+    # The service falls back to mtype; the benchmark asks for an error instead
+    assert isinstance(make_log_reader("fat32", "p:/LOGGER.GAM", path), MtypeLogReader)
+    try:
+        make_log_reader("fat32", "p:/LOGGER.GAM", path, fallback=False)
+        raise AssertionError("fallback=False fell back to mtype")
+    except Fat32Error:
+        pass
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,164 @@
+# tests/test_gcp_sinks.py
+"""
+Checks the call guards of gcp_sinks.py on a manually advanced clock: the
+circuit breaker's state machine and thresholds, and the deadline, timeout
+and retry accounting of call_with_deadline().
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gcp_sinks import (  # noqa: E402
+    CLOSED, HALF_OPEN, OPEN, CallDeadlineExceeded, CallStats, CircuitBreaker, call_with_deadline, is_timeout,
+)
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class SlowRequest:
+    """Cloud call that uses up its whole timeout and then times out, `failures` times."""
+
+    def __init__(self, clock: FakeClock, failures: int = 1_000, error: type = TimeoutError):
+        self.clock = clock
+        self.failures = failures
+        self.error = error
+        self.timeouts: List[float] = []
+
+    def __call__(self, timeout: float) -> str:
+        self.timeouts.append(timeout)
+        if len(self.timeouts) > self.failures:
+            return "ok"
+        self.clock.now += timeout
+        raise self.error(f"request {len(self.timeouts)} timed out")
+
+
+def test_breaker_opens_on_failure_rate() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker("bigquery", window=60.0, failure_rate=0.5, min_calls=3, open_duration=25.0, clock=clock)
+
+    # Fewer than min_calls calls never open the breaker, even if all failed
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+    # Failures older than the window no longer count
+    clock.now = 61.0
+    breaker.record(True)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == CLOSED and len(breaker.calls) == 3
+    # 2 failures out of 4 reaches the 50% rate
+    breaker.record(False)
+    assert breaker.state == OPEN and breaker.times_opened == 1
+    assert breaker.retry_after() == 25.0
+
+
+def test_breaker_half_open_probe() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker("firestore", window=60.0, failure_rate=0.5, min_calls=2, open_duration=25.0, clock=clock)
+    assert breaker.allow() and breaker.retry_after() == 0.0
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    # Open: calls are refused until open_duration has passed
+    clock.now = 10.0
+    assert not breaker.allow() and breaker.refused == 1
+    assert breaker.retry_after() == 15.0
+
+    # Half-open: a single probe goes through; a failed probe re-opens
+    clock.now = 25.0
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow() and breaker.refused == 2
+    assert breaker.retry_after() == 0.0
+    breaker.record(False)
+    assert breaker.state == OPEN and breaker.times_opened == 2
+    assert breaker.retry_after() == 25.0
+
+    # A successful probe closes the breaker with a fresh window
+    clock.now = 50.0
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED and not breaker.calls
+    breaker.record(False)
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_is_timeout_across_libraries() -> None:
+    ReadTimeout = type("ReadTimeout", (OSError,), {})                   # requests / urllib3
+    DeadlineExceeded = type("DeadlineExceeded", (Exception,), {})       # google.api_core
+    assert is_timeout(TimeoutError()) and is_timeout(ReadTimeout()) and is_timeout(DeadlineExceeded())
+    assert not is_timeout(ConnectionError()) and not is_timeout(ValueError())
+
+
+def test_deadline_bounds_timed_out_attempts() -> None:
+    clock = FakeClock()
+    stats = CallStats("bigquery.insert")
+    request = SlowRequest(clock)
+    try:
+        call_with_deadline(request, stats, deadline=30.0, call_timeout=10.0, max_attempts=5, base_delay=1.0,
+                           clock=clock, sleep=clock.sleep)
+        raise AssertionError("a call that always times out succeeded")
+    except TimeoutError as e:
+        assert str(e) == "request 3 timed out"
+    # Two full timeouts and backoffs, then a last attempt cut to the time left
+    assert request.timeouts[:2] == [10.0, 10.0] and 0 < request.timeouts[2] < 7.0
+    assert clock.now == 30.0
+    assert (stats.calls, stats.attempts, stats.timeouts, stats.failures, stats.deadlines) == (1, 3, 3, 1, 1)
+
+
+def test_retries_until_success_or_max_attempts() -> None:
+    clock = FakeClock()
+    stats = CallStats("firestore.set")
+    request = SlowRequest(clock, failures=1, error=ConnectionError)
+    assert call_with_deadline(request, stats, deadline=30.0, call_timeout=5.0, clock=clock, sleep=clock.sleep) == "ok"
+    assert (stats.calls, stats.attempts, stats.timeouts, stats.failures, stats.deadlines) == (1, 2, 0, 0, 0)
+
+    # Attempts run out before the deadline: a failure, not a deadline
+    request = SlowRequest(clock)
+    try:
+        call_with_deadline(request, stats, deadline=300.0, call_timeout=5.0, max_attempts=2,
+                           clock=clock, sleep=clock.sleep)
+        raise AssertionError("a call that always times out succeeded")
+    except TimeoutError:
+        pass
+    assert (stats.calls, stats.attempts, stats.timeouts, stats.failures, stats.deadlines) == (2, 4, 2, 1, 0)
+
+
+def test_no_attempt_without_time_or_attempts() -> None:
+    clock = FakeClock()
+    stats = CallStats("bigquery.insert")
+    request = SlowRequest(clock)
+    try:
+        call_with_deadline(request, stats, deadline=0.0, clock=clock, sleep=clock.sleep)
+        raise AssertionError("an attempt ran past its deadline")
+    except CallDeadlineExceeded:
+        pass
+    assert request.timeouts == [] and (stats.calls, stats.attempts, stats.deadlines) == (1, 0, 1)
+    try:
+        call_with_deadline(request, stats, max_attempts=0, clock=clock, sleep=clock.sleep)
+        raise AssertionError("max_attempts=0 was accepted")
+    except ValueError:
+        pass
+    assert request.timeouts == [] and stats.calls == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
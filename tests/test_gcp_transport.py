@@ -0,0 +1,212 @@
+# tests/test_gcp_transport.py
+"""
+Checks the REST transport of gcp_clients.py (RestBigQueryClient and
+RestFirestoreClient behind RestSession) against a local HTTP stand-in for the
+BigQuery and Firestore REST APIs that records every request, and when
+LazyClients builds the clients. The HTTP session
+is a small urllib shim with the request() / response subset of requests, so
+neither requests nor google-auth needs to be installed:
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+import json
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gcp_clients import (LazyClients, RestBigQueryClient, RestError, RestFirestoreClient, RestSession,  # noqa: E402
+                         query_rows)
+
+PROJECT_ID = "test-project"
+TABLE = f"{PROJECT_ID}.test_dataset.test_table"
+DOCUMENT_ID = "UIP 1 [G50-H] - Coteau"
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Answers insertAll, jobs.query, documents:commit and document GETs like the real APIs."""
+
+    protocol_version = "HTTP/1.1"
+    requests: List[Tuple[str, str, Any]] = []       # (method, unquoted path, JSON body)
+    documents: Dict[str, Dict[str, Any]] = {}
+    insert_errors: List[Dict[str, Any]] = []
+
+    def reply(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.requests.append(("POST", unquote(self.path), request))
+        if self.path.endswith("/insertAll"):
+            self.reply(200, {"insertErrors": self.insert_errors} if self.insert_errors else {})
+        elif self.path.endswith("/queries"):
+            self.reply(200, {"jobComplete": True,
+                             "schema": {"fields": [{"name": "Timestamp", "type": "TIMESTAMP"},
+                                                   {"name": "Counter", "type": "INTEGER"}]},
+                             "rows": [{"f": [{"v": "1.740934809E9"}, {"v": "949"}]}]})
+        elif self.path.endswith("/documents:commit"):
+            for write in request["writes"]:
+                name = write["update"]["name"]
+                if write.get("currentDocument", {}).get("exists") and name not in self.documents:
+                    self.reply(404, {"error": {"code": 404, "message": f"No document to update: {name}"}})
+                    return
+                document = self.documents.setdefault(name, {})
+                if "updateMask" not in write:
+                    document.clear()
+                document.update(write["update"]["fields"])
+            self.reply(200, {"writeResults": [{}], "commitTime": datetime.now(timezone.utc).isoformat()})
+        else:
+            self.reply(404, {"error": {"code": 404, "message": self.path}})
+
+    def do_GET(self) -> None:
+        self.requests.append(("GET", unquote(self.path), None))
+        name = unquote(self.path.split("/v1/", 1)[-1])
+        if name in self.documents:
+            self.reply(200, {"name": name, "fields": self.documents[name]})
+        else:
+            self.reply(404, {"error": {"code": 404, "message": "not found"}})
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class UrllibResponse:
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+        self.text = content.decode()
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class UrllibSession:
+    """The request() subset of requests.Session used by RestSession."""
+
+    def request(self, method: str, url: str, json: Optional[Dict[str, Any]] = None,
+                timeout: Optional[float] = None) -> UrllibResponse:
+        data = dumps(json).encode() if json is not None else None
+        request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return UrllibResponse(response.status, response.read())
+        except urllib.error.HTTPError as e:
+            return UrllibResponse(e.code, e.read())
+
+
+def serve() -> Tuple[ThreadingHTTPServer, str]:
+    StandIn.requests, StandIn.documents, StandIn.insert_errors = [], {}, []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_bigquery_insert_all_and_query() -> None:
+    server, url = serve()
+    try:
+        client = RestBigQueryClient(RestSession(UrllibSession()), url)
+        rows = [{"Timestamp": "2025-03-02T17:00:09+00:00", "Counter": 949}, {"Counter": 950}]
+        assert client.insert_rows_json(TABLE, rows, row_ids=["a", "b"], timeout=5.0) == []
+        method, path, body = StandIn.requests[-1]
+        assert path == f"/bigquery/v2/projects/{PROJECT_ID}/datasets/test_dataset/tables/test_table/insertAll"
+        assert body == {"rows": [{"json": rows[0], "insertId": "a"}, {"json": rows[1], "insertId": "b"}]}
+
+        # Per-row errors are returned as bigquery.Client returns them, not raised
+        StandIn.insert_errors = [{"index": 1, "errors": [{"reason": "invalid"}]}]
+        assert client.insert_rows_json(TABLE, rows, timeout=5.0) == StandIn.insert_errors
+
+        result = query_rows(client, PROJECT_ID, "SELECT Timestamp, Counter FROM t WHERE Machine = @machine",
+                            [("machine", "STRING", DOCUMENT_ID)], timeout=5.0)
+        assert result == [{"Timestamp": datetime(2025, 3, 2, 17, 0, 9, tzinfo=timezone.utc), "Counter": 949}]
+        _, path, body = StandIn.requests[-1]
+        assert path == f"/bigquery/v2/projects/{PROJECT_ID}/queries" and body["useLegacySql"] is False
+        assert body["queryParameters"] == [{"name": "machine", "parameterType": {"type": "STRING"},
+                                            "parameterValue": {"value": DOCUMENT_ID}}]
+    finally:
+        server.shutdown()
+
+
+def test_firestore_field_masks() -> None:
+    server, url = serve()
+    try:
+        client = RestFirestoreClient(RestSession(UrllibSession()), PROJECT_ID, endpoint=url)
+        document = client.collection("status").document(DOCUMENT_ID)
+        name = f"projects/{PROJECT_ID}/databases/(default)/documents/status/{DOCUMENT_ID}"
+
+        assert not document.get(timeout=5.0).exists
+        # update() of a missing document fails like the official client, instead of creating it
+        try:
+            document.update({"PI_Timestamp": datetime(2025, 3, 2, 17, 0, 9)}, timeout=5.0)
+            raise AssertionError("update() of a missing document succeeded")
+        except RestError as e:
+            assert e.status == 404
+
+        started = datetime(2025, 3, 2, 17, 0, 9, tzinfo=timezone.utc)
+        document.set({"Status": "Running", "Location Name": "Coteau-du-Lac", "Timestamp": started}, merge=True,
+                     timeout=5.0)
+        document.update({"PI_Timestamp": datetime(2025, 3, 2, 17, 1, 9, 123456)}, timeout=5.0)
+        commits = [body["writes"][0] for method, path, body in StandIn.requests if path.endswith("documents:commit")]
+        assert len(commits) == 3
+        # Merge and update name only the fields they send; field names with spaces are quoted
+        assert commits[1]["updateMask"] == {"fieldPaths": ["Status", "`Location Name`", "Timestamp"]}
+        assert commits[2]["updateMask"] == {"fieldPaths": ["PI_Timestamp"]}
+        assert commits[2]["currentDocument"] == {"exists": True}
+        assert commits[2]["update"] == {"name": name,
+                                        "fields": {"PI_Timestamp": {"timestampValue": "2025-03-02T17:01:09.123456Z"}}}
+
+        # The document ID is escaped in the URL only; the fields read back decoded
+        assert StandIn.requests[0] == ("GET", f"/v1/{name}", None)
+        fields = document.get(timeout=5.0).to_dict()
+        assert fields == {"Status": "Running", "Location Name": "Coteau-du-Lac", "Timestamp": started,
+                          "PI_Timestamp": datetime(2025, 3, 2, 17, 1, 9, 123456, tzinfo=timezone.utc)}
+    finally:
+        server.shutdown()
+
+
+def test_lazy_clients_build_only_once_started() -> None:
+    builds: List[int] = []
+
+    def build() -> Tuple[Any, Any]:
+        builds.append(len(builds))
+        if len(builds) == 2:
+            raise OSError("credentials unreadable")
+        return (f"bigquery {len(builds)}", f"firestore {len(builds)}")
+
+    clients = LazyClients(build)
+    # Callers wait for start() (the network gate) instead of starting the build themselves
+    try:
+        clients.bigquery(timeout=0.1)
+        raise AssertionError("clients were available before start()")
+    except TimeoutError:
+        assert builds == []
+    clients.start()
+    assert clients.bigquery(timeout=5.0) == "bigquery 1" and clients.firestore(timeout=5.0) == "firestore 1"
+
+    # After reset() the next access rebuilds; a failed build is reported, then retried
+    clients.reset()
+    try:
+        clients.get(timeout=5.0)
+        raise AssertionError("the failed build was not reported")
+    except OSError:
+        pass
+    assert clients.bigquery(timeout=5.0) == "bigquery 3" and len(builds) == 3
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,155 @@
+# tests/test_local_store.py
+"""
+Checks the on-disk state of local_store.py in a scratch directory: the SQLite
+outbox's budgets and replay, the checkpoint file and the persisted line
+deduplicator.
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from local_store import DEDUP_DIGEST_SIZE, Checkpoint, LineDeduplicator, SqliteOutbox, line_digest  # noqa: E402
+
+
+def rows(first: int, count: int) -> List[Dict[str, Any]]:
+    """Rows whose JSON payload is exactly 10 bytes, e.g. {"n": 100}."""
+    return [{"n": n} for n in range(first, first + count)]
+
+
+def outbox_path() -> str:
+    return os.path.join(tempfile.mkdtemp(), "outbox.sqlite3")
+
+
+def test_outbox_byte_budget_evicts_oldest_tenth() -> None:
+    outbox = SqliteOutbox(outbox_path(), max_bytes=1000, min_free_bytes=0)
+    try:
+        outbox.append(rows(100, 100))
+        assert (outbox.pending_rows, outbox.pending_bytes, outbox.evicted) == (100, 1000, 0)
+        # One row over budget drops the oldest 10% of the backlog, not a single row
+        outbox.append(rows(200, 1))
+        assert (outbox.pending_rows, outbox.pending_bytes, outbox.evicted) == (91, 910, 10)
+        assert outbox.peek(1) == [(11, {"n": 110})]
+        # A large append evicts in successive 10% rounds until it fits
+        outbox.append(rows(300, 100))
+        assert outbox.pending_bytes <= 1000 and outbox.peek(1)[0][1]["n"] > 110
+        assert outbox.pending_rows + outbox.evicted == 201
+    finally:
+        outbox.close()
+
+
+def test_outbox_keeps_free_space_floor() -> None:
+    outbox = SqliteOutbox(outbox_path(), max_bytes=10**9, min_free_bytes=1500)
+    # A 2000-byte disk that the outbox fills on its own
+    outbox._free_bytes = lambda: 2000 - outbox.pending_bytes
+    try:
+        outbox.append(rows(100, 45))
+        assert (outbox.pending_rows, outbox.evicted) == (45, 0)
+        # 600 bytes would leave 1400 free: evict 6 rows, then 5, back above the floor
+        outbox.append(rows(200, 15))
+        assert (outbox.pending_rows, outbox.pending_bytes, outbox.evicted) == (49, 490, 11)
+        assert outbox.peek(1) == [(12, {"n": 111})]
+    finally:
+        outbox.close()
+
+
+def test_outbox_replays_pending_rows_after_reopen() -> None:
+    path = outbox_path()
+    outbox = SqliteOutbox(path, min_free_bytes=0)
+    outbox.append(rows(100, 20))
+    outbox.ack(5)
+    outbox.remove([7, 9])
+    outbox.close()
+
+    reopened = SqliteOutbox(path, min_free_bytes=0)
+    try:
+        assert (reopened.pending_rows, reopened.pending_bytes) == (13, 130)
+        assert reopened.peek(100) == [(row_id, {"n": 99 + row_id}) for row_id in [6, 8] + list(range(10, 21))]
+        # New rows queue behind the replayed ones
+        reopened.append(rows(500, 1))
+        assert reopened.peek(100)[-1] == (21, {"n": 500})
+    finally:
+        reopened.close()
+
+    # A smaller budget on the next start is enforced before any upload
+    shrunk = SqliteOutbox(path, max_bytes=100, min_free_bytes=0)
+    try:
+        assert (shrunk.pending_rows, shrunk.pending_bytes, shrunk.evicted) == (10, 100, 4)
+        assert shrunk.peek(1) == [(12, {"n": 111})]
+    finally:
+        shrunk.close()
+
+
+def test_checkpoint_round_trip() -> None:
+    path = os.path.join(tempfile.mkdtemp(), "checkpoint.json")
+    checkpoint = Checkpoint(path)
+    assert checkpoint.load() is None
+
+    state = {"line": "03-02-2025 12:00:00;91597", "row": 940, "time": 1740934809.5}
+    checkpoint.save(state)
+    assert Checkpoint(path).load() == state
+    checkpoint.save({"line": "03-02-2025 12:00:02;91597", "row": 941, "time": 1740934811.5})
+    assert Checkpoint(path).load()["row"] == 941
+    # Replaced through a temp file that does not outlive the save
+    assert os.listdir(os.path.dirname(path)) == ["checkpoint.json"]
+
+
+def test_checkpoint_corrupt_file() -> None:
+    path = os.path.join(tempfile.mkdtemp(), "checkpoint.json")
+    for content in ('{"line": "03-02-2025 12:00', "", "\x00" * 16):
+        with open(path, "w") as f:
+            f.write(content)
+        assert Checkpoint(path).load() is None
+    # The next save replaces the unreadable file
+    Checkpoint(path).save({"row": 942})
+    assert Checkpoint(path).load() == {"row": 942}
+
+
+def test_dedup_lru_and_reopen() -> None:
+    path = os.path.join(tempfile.mkdtemp(), "dedup.bin")
+    digests = [line_digest(f"03-02-2025 12:00:{second:02d};91597;82") for second in range(6)]
+    dedup = LineDeduplicator(path, capacity=4)
+    for digest in digests[:4]:
+        dedup.add(digest)
+    # A hit refreshes the digest, so the next add evicts the least recently used one
+    assert dedup.contains(digests[0])
+    dedup.add(digests[4])
+    assert list(dedup.digests) == [digests[2], digests[3], digests[0], digests[4]]
+    assert not dedup.contains(digests[1]) and (dedup.checked, dedup.suppressed) == (2, 1)
+
+    # Nothing reaches the file before persist()
+    assert not LineDeduplicator(path, capacity=4).digests
+    dedup.persist()
+    assert os.path.getsize(path) == 5 * DEDUP_DIGEST_SIZE
+    # A reopen keeps the last `capacity` digests written
+    reopened = LineDeduplicator(path, capacity=4)
+    assert list(reopened.digests) == digests[1:5] and reopened.file_entries == 5
+    assert reopened.contains(digests[4]) and not reopened.contains(digests[5])
+
+
+def test_dedup_compacts_at_twice_capacity() -> None:
+    path = os.path.join(tempfile.mkdtemp(), "dedup.bin")
+    digests = [line_digest(f"03-02-2025 12:00:{second:02d};91597;82") for second in range(9)]
+    dedup = LineDeduplicator(path, capacity=4)
+    for digest in digests[:8]:
+        dedup.add(digest)
+        dedup.persist()
+    # Appending up to 2 x capacity entries
+    assert dedup.file_entries == 8 and os.path.getsize(path) == 8 * DEDUP_DIGEST_SIZE
+    # One more rewrites the file with the digests still held
+    dedup.add(digests[8])
+    dedup.persist()
+    assert dedup.file_entries == 4 and os.path.getsize(path) == 4 * DEDUP_DIGEST_SIZE
+    assert list(LineDeduplicator(path, capacity=4).digests) == digests[5:]
+    assert not os.path.exists(path + ".tmp")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,95 @@
+# tests/test_parser.py
+"""
+Checks the log parsers of gam_parser.py: which lines each layout accepts, for
+registered firmware headers and for unknown ones, and that the columnar batch
+parser and the per-line parser agree on every line, with the default device
+timestamp layout and a configured one.
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gam_parser import default_registry, parse_device_time, parse_log_batch, parse_log_line  # noqa: E402
+
+KNOWN_HEADER = "GAMA LOG TYPE: G-250 H D;VERSION: 090617;METRIC: N"
+UNKNOWN_HEADER = "GAMA LOG TYPE: G-250 H D;VERSION: 100101;METRIC: N"
+
+
+def log_line(second: int, counter: int, extra: str = "") -> str:
+    return f"03-02-2025 12:00:{second:02d};91597;82;80;90;88;81;69;500;1;0;0;620;770;{counter};0{extra}"
+
+
+def test_unknown_header_ignores_extra_fields() -> None:
+    registry = default_registry()
+    fmt = registry.select(UNKNOWN_HEADER)
+    assert fmt is registry.generic and registry.unknown_headers == 1
+    lines = [UNKNOWN_HEADER, log_line(0, 940, ";7.5"), log_line(2, 941, ";"), log_line(4, 942),
+             "03-02-2025 12:00:06;91597;82", ""]
+
+    batch = parse_log_batch(lines, fmt=fmt)
+    # A firmware that appends a column, or ends its lines with ";", still uploads
+    assert list(batch.line_numbers) == [1, 2, 3]
+    assert list(batch.column("Counter")) == [940, 941, 942]
+    assert list(batch.column("Value15")) == [0, 0, 0]
+    # Only lines short of the layout's width are rejected
+    assert [(reject.line_number, reject.reason) for reject in batch.rejects] == [(4, "3 fields, expected 16 or more")]
+
+
+def test_registered_header_requires_exact_width() -> None:
+    fmt = default_registry().select(KNOWN_HEADER)
+    assert fmt.field_error(16) is None and fmt.field_error(17) is not None
+    batch = parse_log_batch([KNOWN_HEADER, log_line(0, 940), log_line(2, 941, ";7.5"), log_line(4, 942)], fmt=fmt)
+    assert list(batch.column("Counter")) == [940, 942]
+    assert [(reject.line_number, reject.reason) for reject in batch.rejects] == [(2, "17 fields, expected 16")]
+
+
+def test_batch_and_line_parsers_agree() -> None:
+    tz = ZoneInfo("America/Toronto")
+    lines = [log_line(0, 940), log_line(2, 941, ";7.5"), log_line(4, 942, ";"),
+             "03-02-2025 12:00:06;91597;82",                          # Too few fields
+             log_line(8, 943).replace(";82;", ";x;"),                 # Malformed value
+             "03-02-2025 12:00:60" + log_line(10, 944)[19:],          # Bad second
+             "3-2-2025 12:00:12" + log_line(12, 945)[19:],            # Bad timestamp layout
+             log_line(14, 946)]
+    for fmt in (default_registry().generic, default_registry().select(KNOWN_HEADER)):
+        batch = parse_log_batch(lines, tz, fmt, chunk_lines=3)
+        rows, rejects = [], []
+        for number, line in enumerate(lines):
+            try:
+                rows.append(parse_log_line(line, tz, fmt).to_row())
+            except ValueError as e:
+                rejects.append((number, str(e)))
+        assert [batch.reading(row, "", 0.0).to_row() for row in range(len(batch))] == rows
+        assert [(reject.line_number, reject.reason) for reject in batch.rejects] == rejects
+        assert len(rows) == (4 if fmt.extra_fields else 2)
+
+
+def test_configured_timestamp_format() -> None:
+    tz = ZoneInfo("America/Toronto")
+    iso_format = "%Y-%m-%d %H:%M:%S"
+    lines = [log_line(second, 940 + second) for second in range(0, 6, 2)]
+    iso_lines = ["2025-03-02 12:00:" + line[17:] for line in lines] + ["03-02-2025 12:00:06" + lines[0][19:]]
+
+    expected = parse_log_batch(lines, tz)
+    batch = parse_log_batch(iso_lines, tz, time_format=iso_format)
+    # Same instants as the default layout; a line in the default layout is now a bad timestamp
+    assert list(batch.timestamps) == list(expected.timestamps) and len(batch) == 3
+    assert [(reject.line_number, reject.reason) for reject in batch.rejects] == [(3, "bad timestamp '03-02-2025 12:00:06'")]
+    assert [parse_log_line(line, tz, time_format=iso_format).timestamp for line in iso_lines[:3]] == list(batch.timestamps)
+    try:
+        parse_log_line(iso_lines[3], tz, time_format=iso_format)
+        raise AssertionError("a timestamp in another layout was accepted")
+    except ValueError as e:
+        assert str(e) == batch.rejects[0].reason
+    assert parse_device_time("2025-03-02 12:00:02", iso_format) == parse_device_time("03-02-2025 12:00:02")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
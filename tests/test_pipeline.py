@@ -0,0 +1,58 @@
+# tests/test_pipeline.py
+"""
+Checks how the pipeline's blocking put() reports to the watchdog: a producer
+blocked on a full queue is idle, not stalled, and each accepted item counts as
+progress.
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+import queue
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipeline import Liveness, put  # noqa: E402
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_put_progress_and_backpressure() -> None:
+    clock = FakeClock()
+    liveness = Liveness("parser", budget=10.0, clock=clock)
+    inbox: queue.Queue = queue.Queue(maxsize=1)
+    liveness.begin()
+
+    # An accepted item is progress
+    clock.now = 9.0
+    put(inbox, "chunk 1", liveness)
+    clock.now = 15.0
+    assert liveness.stalled() is None
+
+    # Blocked on a full queue: idle until the consumer takes an item
+    blocked = threading.Thread(target=put, args=(inbox, "chunk 2", liveness))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive() and liveness.busy_since is None
+    clock.now = 100.0
+    assert liveness.stalled() is None
+    assert inbox.get()[1] == "chunk 1"
+    blocked.join(5.0)
+    assert not blocked.is_alive() and liveness.busy_since == 100.0
+    assert inbox.get()[1] == "chunk 2"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,136 @@
+# tests/test_service.py
+"""
+Checks the systemd integration of service.py with fake checks and a fake
+sd_notify(): readiness gates start only once the gates they require have
+passed, and fail at once when a prerequisite failed; the watchdog withholds
+its ping while a stage is stalled.
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+import time
+import threading
+from typing import Callable, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import service  # noqa: E402
+from service import Gate, GateResult, ReadinessGates, Watchdog  # noqa: E402
+
+POLL: float = 0.001     # Gate poll interval, so the tests do not sleep
+
+
+class FakeCheck:
+    """Gate check that passes from its `passes_on`-th call (never if 0), recording each call in `log`."""
+
+    def __init__(self, name: str, log: List[str], passes_on: int = 1):
+        self.name = name
+        self.log = log
+        self.passes_on = passes_on
+        self.calls = 0
+
+    def __call__(self) -> bool:
+        self.calls += 1
+        self.log.append(self.name)
+        return self.passes_on > 0 and self.calls >= self.passes_on
+
+
+def test_gates_wait_for_requirements() -> None:
+    log: List[str] = []
+    finished: List[str] = []
+    lock = threading.Lock()
+    all_done = threading.Event()
+
+    def on_done(result: GateResult) -> None:
+        with lock:
+            finished.append(result.name)
+            if len(finished) == 3:
+                all_done.set()
+
+    gates = ReadinessGates([
+        Gate("logger", FakeCheck("logger", log, passes_on=2), 5.0, requires=("image",), poll_interval=POLL),
+        Gate("image", FakeCheck("image", log, passes_on=3), 5.0, poll_interval=POLL),
+        Gate("clients", FakeCheck("clients", log), 5.0, requires=("image", "logger"), poll_interval=POLL),
+    ], on_done=on_done).start()
+
+    results = gates.wait("clients", "image", "logger")
+    assert [result.name for result in results] == ["clients", "image", "logger"]
+    assert all(result.ready and result.detail == "" for result in results)
+    # Declared first, but polled only once the image passed; clients only after both
+    assert log == ["image"] * 3 + ["logger"] * 2 + ["clients"]
+    # on_done runs on each gate's thread, after wait() is released
+    assert all_done.wait(5.0) and sorted(finished) == ["clients", "image", "logger"]
+
+
+def test_failed_requirement_fails_dependents() -> None:
+    log: List[str] = []
+
+    def broken() -> bool:
+        raise OSError("piusb.bin: no such file")
+
+    gates = ReadinessGates([
+        Gate("image", broken, 0.02, poll_interval=POLL),
+        Gate("logger", FakeCheck("logger", log), 5.0, requires=("image",), poll_interval=POLL),
+        Gate("network", FakeCheck("network", log, passes_on=0), 0.02, poll_interval=POLL),
+    ]).start()
+
+    image, logger, network = gates.wait("image", "logger", "network")
+    assert not image.ready and image.detail == "piusb.bin: no such file" and image.waited >= 0.02
+    # The dependent gate fails without polling or waiting out its own timeout
+    assert (logger.ready, logger.waited, logger.detail) == (False, 0.0, "image is not ready")
+    assert not network.ready and network.detail == "not ready"
+    assert "logger" not in log and "network" in log
+
+
+class FakeStage:
+    """Pipeline stage stand-in whose stalled() reason is set by the test."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.thread: Optional[threading.Thread] = None
+        self.reason: Optional[str] = None
+
+    def stalled(self) -> Optional[str]:
+        return self.reason
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.001)
+
+
+def test_watchdog_withholds_ping_while_stalled() -> None:
+    sent: List[str] = []
+    real_sd_notify = service.sd_notify
+    service.sd_notify = lambda state: sent.append(state) or True
+    parser, bigquery = FakeStage("parser"), FakeStage("bigquery")
+    watchdog = Watchdog([parser, bigquery], interval=0.002)
+    try:
+        watchdog.start()
+        wait_until(lambda: watchdog.pings >= 2)
+        assert set(sent) == {"WATCHDOG=1"}
+
+        bigquery.reason = "bigquery: no progress for 130 s (budget 120 s)"
+        wait_until(lambda: "STATUS=Stalled: bigquery: no progress for 130 s (budget 120 s)" in sent)
+        stalled_from, pings = len(sent), watchdog.pings
+        wait_until(lambda: watchdog.withheld >= 3)
+        # No ping at all while the stage is stalled, only status updates
+        assert watchdog.pings == pings and "WATCHDOG=1" not in sent[stalled_from:]
+
+        bigquery.reason = None
+        wait_until(lambda: watchdog.pings >= pings + 2)
+        assert sent[-1] == "WATCHDOG=1"
+    finally:
+        watchdog.stop()
+        watchdog.join(5.0)
+        service.sd_notify = real_sd_notify
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,395 @@
+# tests/test_sinks.py
+"""
+Checks the sinks of raspberry_to_gcp.py as shipped (send_to_bigquery() behind
+the batching writer, update_firestore() behind the heartbeat throttle) against
+in-process stand-ins for the BigQuery and Firestore clients, asserting on the
+requests they issue, and the parser stage that feeds them. No network or
+credentials are needed:
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+import queue
+import sqlite3
+import tempfile
+import importlib.util
+from array import array
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gam_parser import G250_FIELDS, Reading  # noqa: E402
+from gcp_clients import LazyClients, RestBigQueryClient  # noqa: E402
+from gcp_sinks import BigQueryBatchWriter, CircuitBreaker, DocumentMirror, HeartbeatCoalescer, LatestValueSink  # noqa: E402
+from local_store import Checkpoint, DeadLetterFile, LineDeduplicator, MemoryOutbox, SqliteOutbox  # noqa: E402
+from pipeline import StageStats  # noqa: E402
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "3_raspberry_to_gcp.py")
+START = 1740934809.0     # 2025-03-02T17:00:09Z
+
+
+def load_script() -> Any:
+    """Imports raspberry_to_gcp.py from a scratch directory, where its log file is created."""
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        spec = importlib.util.spec_from_file_location("raspberry_to_gcp", SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+script = load_script()
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeBigQueryClient:
+    """Stand-in for bigquery.Client that records insert_rows_json calls and fails rows listed in `row_errors`."""
+
+    def __init__(self) -> None:
+        self.requests: List[Tuple[List[Dict[str, Any]], List[str]]] = []
+        self.row_errors: Dict[int, str] = {}     # Counter -> error reason
+
+    def insert_rows_json(self, table: str, rows: List[Dict[str, Any]], row_ids: Optional[List[str]] = None,
+                         timeout: Optional[float] = None, retry: Any = None) -> List[Dict[str, Any]]:
+        assert table == f"{script.PROJECT_ID}.{script.DATASET_ID}.{script.TABLE_ID}"
+        assert timeout is not None and timeout <= script.CALL_TIMEOUT_BQ
+        self.requests.append((list(rows), list(row_ids or [])))
+        return [{"index": index, "errors": [{"reason": self.row_errors[row["Counter"]]}]}
+                for index, row in enumerate(rows) if row["Counter"] in self.row_errors]
+
+
+class FakeSnapshot:
+    def __init__(self, fields: Optional[Dict[str, Any]]):
+        self.exists = fields is not None
+        self.fields = fields
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self.fields) if self.fields is not None else None
+
+
+class FakeDocument:
+    """Stand-in for a Firestore DocumentReference that records every write."""
+
+    def __init__(self) -> None:
+        self.data: Optional[Dict[str, Any]] = None
+        self.writes: List[Tuple[str, List[str]]] = []
+
+    def get(self, timeout: Optional[float] = None, retry: Any = None) -> FakeSnapshot:
+        return FakeSnapshot(self.data)
+
+    def set(self, fields: Dict[str, Any], merge: bool = False, timeout: Optional[float] = None, retry: Any = None) -> None:
+        self.data = {**(self.data or {}), **fields} if merge else dict(fields)
+        self.writes.append(("set", sorted(fields)))
+
+    def update(self, fields: Dict[str, Any], timeout: Optional[float] = None, retry: Any = None) -> None:
+        assert self.data is not None, "update() of a missing document"
+        self.data.update(fields)
+        self.writes.append(("update", sorted(fields)))
+
+
+class FakeFirestoreClient:
+    """Stand-in for firestore.Client holding one collection of documents."""
+
+    def __init__(self) -> None:
+        self.documents: Dict[str, FakeDocument] = {}
+
+    def collection(self, name: str) -> "FakeFirestoreClient":
+        assert name == script.FIRESTORE_COLLECTION
+        return self
+
+    def document(self, name: str) -> FakeDocument:
+        return self.documents.setdefault(name, FakeDocument())
+
+
+def log_line(seconds: int, counter: int) -> str:
+    return f"03-02-2025 12:{seconds // 60:02d}:{seconds % 60:02d};91597;82;80;90;88;81;69;500;1;0;0;620;770;{counter};0"
+
+
+def use_clients(bigquery_client: Any = None, firestore_client: Any = None) -> None:
+    script.clients = LazyClients(lambda: (bigquery_client, firestore_client))
+    script.clients.start()
+
+
+def reading(seconds: float, status: str = "Running", counter: int = 940) -> Reading:
+    values = array("d", [91597, 82, 80, 90, 88, 81, 69, 500, 1, 0, 0, 620, 770, counter, 0])
+    return Reading(START + seconds, START + seconds + 0.5, values, status, G250_FIELDS)
+
+
+def test_bigquery_flush_policy() -> None:
+    client = FakeBigQueryClient()
+    use_clients(bigquery_client=client)
+    script.dead_letters = DeadLetterFile(os.path.join(tempfile.mkdtemp(), "deadletter.jsonl"))
+    clock = FakeClock()
+    writer = BigQueryBatchWriter(script.send_to_bigquery, max_rows=3, max_bytes=1_000_000, max_latency=5.0,
+                                 clock=clock, outbox=MemoryOutbox())
+
+    # Row limit: the third row flushes all three in one request
+    for i in range(3):
+        writer.add(reading(2 * i, counter=940 + i).to_row(script.STATIC_COLUMNS))
+    assert [len(rows) for rows, _ in client.requests] == [3]
+
+    # Latency: one row waits until it is max_latency old
+    writer.add(reading(6, counter=943).to_row(script.STATIC_COLUMNS))
+    clock.now = 4.9
+    assert writer.maybe_flush() is None
+    clock.now = 5.0
+    assert writer.maybe_flush().reason == "latency"
+
+    # Shutdown: a buffered row is flushed by close()
+    writer.add(reading(8, counter=944).to_row(script.STATIC_COLUMNS))
+    assert writer.close().reason == "shutdown"
+    assert [len(rows) for rows, _ in client.requests] == [3, 1, 1]
+
+    rows, row_ids = client.requests[0]
+    assert rows[0]["Machine"] == script.MACHINE_NAME and rows[0]["Counter"] == 940
+    assert rows[0]["Timestamp"] == "2025-03-02T17:00:09+00:00"
+    assert len(set(row_ids)) == 3, "each row needs its own insertId"
+    assert writer.rows_sent == 5 and writer.rows_failed == 0
+
+
+def test_bigquery_partial_batch() -> None:
+    client = FakeBigQueryClient()
+    use_clients(bigquery_client=client)
+    script.dead_letters = DeadLetterFile(os.path.join(tempfile.mkdtemp(), "deadletter.jsonl"))
+    clock = FakeClock()
+    writer = BigQueryBatchWriter(script.send_to_bigquery, max_rows=3, max_bytes=1_000_000, max_latency=5.0,
+                                 clock=clock, outbox=SqliteOutbox(os.path.join(tempfile.mkdtemp(), "outbox.sqlite3")))
+    delay, script.INITIAL_DELAY_BQ = script.INITIAL_DELAY_BQ, 0
+    try:
+        # 941 is invalid (dead-lettered), 942 keeps failing with a retryable reason, 940 goes through
+        client.row_errors = {941: "invalid", 942: "backendError"}
+        metrics = writer.add_many([reading(2 * i, counter=940 + i).to_row(script.STATIC_COLUMNS) for i in range(3)])
+        assert not metrics.success and [len(rows) for rows, _ in client.requests] == [3, 1, 1]
+        # Only the undelivered row stays in the outbox
+        assert [row["Counter"] for _, row in writer.outbox.peek(10)] == [942]
+        assert writer.rows_sent == 2 and writer.rows_failed == 1 and script.dead_letters.rows_written == 1
+
+        # The retry sends just that row; nothing is resent or dead-lettered twice
+        client.row_errors = {}
+        clock.now = 5.0
+        assert writer.maybe_flush().success
+        assert [row["Counter"] for row in client.requests[-1][0]] == [942]
+        assert writer.outbox.pending_rows == 0 and writer.outbox.pending_bytes == 0
+        assert writer.rows_sent == 3 and script.dead_letters.rows_written == 1
+    finally:
+        script.INITIAL_DELAY_BQ = delay
+        writer.close()
+
+
+def test_firestore_write_counts() -> None:
+    client = FakeFirestoreClient()
+    use_clients(firestore_client=client)
+    script.fs_mirror = DocumentMirror()
+    script.fs_mirror_loaded = False
+    clock = FakeClock()
+    heartbeats = HeartbeatCoalescer(60.0, 0.0, clock=clock)
+    sink = LatestValueSink(script.update_firestore, CircuitBreaker("firestore"))
+
+    # One reading every 2 s for 10 minutes; the status changes once, at 300 s
+    for i in range(300):
+        clock.now = 2.0 * i
+        status = "Running" if clock.now < 300 else "Stopped"
+        script.firestore_sink_stage(reading(clock.now, status), sink, heartbeats)
+
+    document = client.documents[script.MACHINE_NAME]
+    # The document did not exist: the first write is a merge of every field
+    assert document.writes[0] == ("set", ["Location", "PI_Timestamp", "Status", "Timestamp"])
+    # Heartbeats every 60 s send only PI_Timestamp; the status change is written at once with its time
+    heartbeat_only = [fields for op, fields in document.writes[1:] if fields == ["PI_Timestamp"]]
+    assert ("update", ["PI_Timestamp", "Status", "Timestamp"]) in document.writes
+    assert len(heartbeat_only) == 8
+    assert len(document.writes) == 10 and heartbeats.avoided == 300 - 10
+    assert document.data["Status"] == "Stopped" and document.data == script.fs_mirror.fields
+    assert all(op == "update" for op, _ in document.writes[1:])
+
+
+def test_firestore_heartbeats_while_idle() -> None:
+    client = FakeFirestoreClient()
+    use_clients(firestore_client=client)
+    script.fs_mirror = DocumentMirror()
+    script.fs_mirror_loaded = False
+    clock = FakeClock()
+    heartbeats = HeartbeatCoalescer(60.0, 0.0, clock=clock)
+    sink = LatestValueSink(script.update_firestore, CircuitBreaker("firestore"))
+
+    # One reading, then no new line for 5 minutes: the stage timer keeps PI_Timestamp fresh
+    script.firestore_sink_stage(reading(0), sink, heartbeats)
+    stamps = [script.fs_mirror.fields["PI_Timestamp"]]
+    wait = script.firestore_tick(sink, heartbeats)
+    assert wait == 60.0
+    while clock.now + wait <= 300:
+        clock.now += wait
+        wait = script.firestore_tick(sink, heartbeats)
+        stamps.append(script.fs_mirror.fields["PI_Timestamp"])
+
+    document = client.documents[script.MACHINE_NAME]
+    assert document.writes[1:] == [("update", ["PI_Timestamp"])] * 5
+    assert stamps == sorted(stamps) and stamps[-1] > stamps[0]
+    assert document.data["Status"] == "Running" and document.data["Timestamp"] == stamps[0] - timedelta(seconds=0.5)
+
+
+class FlakyDocument(FakeDocument):
+    """FakeDocument whose first `failing_gets` reads raise."""
+
+    def __init__(self, data: Dict[str, Any], failing_gets: int) -> None:
+        super().__init__()
+        self.data = data
+        self.failing_gets = failing_gets
+        self.gets = 0
+
+    def get(self, timeout: Optional[float] = None, retry: Any = None) -> FakeSnapshot:
+        self.gets += 1
+        if self.gets <= self.failing_gets:
+            raise ConnectionError("firestore.googleapis.com unreachable")
+        return super().get(timeout, retry)
+
+
+def test_firestore_mirror_read_is_retried() -> None:
+    client = FakeFirestoreClient()
+    document = client.documents[script.MACHINE_NAME] = FlakyDocument({"Status": "Stopped"}, failing_gets=1)
+    use_clients(firestore_client=client)
+    script.fs_mirror = DocumentMirror()
+    script.fs_mirror_loaded = False
+    heartbeats = HeartbeatCoalescer(60.0, 0.0, clock=FakeClock())
+    sends: List[Reading] = []
+
+    def failing_send(item: Reading) -> bool:
+        # The writes fail too, so only a successful read can make the mirror known
+        sends.append(item)
+        return False
+
+    sink = LatestValueSink(failing_send, CircuitBreaker("firestore", clock=FakeClock()))
+
+    script.firestore_sink_stage(reading(0), sink, heartbeats)
+    assert document.gets == 1 and not script.fs_mirror_loaded and len(sends) == 1
+    script.firestore_sink_stage(reading(2), sink, heartbeats)
+    assert document.gets == 2 and script.fs_mirror_loaded
+    assert script.fs_mirror.known and script.fs_mirror.get("Status") == "Stopped"
+    script.firestore_sink_stage(reading(4), sink, heartbeats)
+    assert document.gets == 2
+
+    # While the breaker refuses writes, the read is not retried either
+    client.documents[script.MACHINE_NAME] = document = FlakyDocument({"Status": "Stopped"}, failing_gets=10)
+    script.fs_mirror = DocumentMirror()
+    script.fs_mirror_loaded = False
+    for seconds in range(0, 20, 2):
+        script.firestore_sink_stage(reading(seconds), sink, heartbeats)
+    assert sink.breaker.state == "open" and document.gets == 0
+
+
+def test_rotation_keeps_first_lines() -> None:
+    script.dedup = LineDeduplicator(os.path.join(tempfile.mkdtemp(), "dedup.bin"), 100)
+    script.high_water = None
+    script.recent_counters.clear()
+    fs_queue: queue.Queue = queue.Queue(maxsize=1)
+    bq_queue: queue.Queue = queue.Queue()
+
+    # First run: only the newest line of the first read is uploaded
+    script.parse_stage(script.TailResult([log_line(i, 940 + i) for i in range(5)], False),
+                       fs_queue, bq_queue, StageStats("firestore"))
+    # Rotation: every line of the new file is newer than the checkpoint, including the first two
+    script.parse_stage(script.TailResult([log_line(i, 940 + i) for i in range(5, 9)], True),
+                       fs_queue, bq_queue, StageStats("firestore"))
+
+    chunks = [item for _, item in list(bq_queue.queue) if isinstance(item, script.RowChunk)]
+    rows = [row for chunk in chunks for row in chunk.batch.to_rows(chunk.statuses, 0.0)]
+    assert [row["Counter"] for row in rows] == [944, 945, 946, 947, 948]
+    assert all(row["Status"] == "Running" for row in rows)
+
+
+class FailingOutbox(MemoryOutbox):
+    """Outbox whose append() raises while `failing` is set, like SQLite on a full disk."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.failing = False
+
+    def append(self, rows: List[Any]) -> None:
+        if self.failing:
+            raise sqlite3.OperationalError("database or disk is full")
+        super().append(rows)
+
+
+def test_checkpoint_waits_for_failed_append() -> None:
+    script.dedup = LineDeduplicator(os.path.join(tempfile.mkdtemp(), "dedup.bin"), 100)
+    script.checkpoint = Checkpoint(os.path.join(tempfile.mkdtemp(), "checkpoint.json"))
+    script.high_water = script.line_key(log_line(0, 940))
+    script.recent_counters.clear()
+    script.unstored.clear()
+    outbox = FailingOutbox()
+    writer = BigQueryBatchWriter(lambda rows: [], max_rows=1000, outbox=outbox)
+
+    def read(lines: List[str]) -> None:
+        bq_queue: queue.Queue = queue.Queue()
+        script.parse_stage(script.TailResult(lines, False), queue.Queue(maxsize=1), bq_queue, StageStats("firestore"))
+        while not bq_queue.empty():
+            script.bigquery_sink_stage(bq_queue.get()[1], writer)
+
+    # The append of 942-944 fails: neither the checkpoint nor the dedup file moves past them
+    outbox.failing = True
+    read([log_line(i, 940 + i) for i in range(5)])
+    assert outbox.pending_rows == 0 and len(script.unstored) == 1
+    assert script.checkpoint.load() is None
+    assert not script.dedup.contains(script.line_digest(log_line(3, 943)))
+
+    # The next read stores the held rows first, in order, then moves the checkpoint
+    outbox.failing = False
+    read([log_line(i, 940 + i) for i in range(5, 7)])
+    assert [row["Counter"] for _, row in outbox.peek(10)] == [942, 943, 944, 945, 946]
+    assert not script.unstored and script.load_checkpoint() == script.line_key(log_line(6, 946))
+
+
+class FakeQuerySession:
+    """Stand-in for RestSession answering jobs.query with one row, as the REST API encodes it."""
+
+    def __init__(self) -> None:
+        self.bodies: List[Dict[str, Any]] = []
+
+    def call(self, method: str, url: str, body: Optional[Dict[str, Any]] = None,
+             timeout: Optional[float] = None) -> Dict[str, Any]:
+        assert method == "POST" and url.endswith(f"/projects/{script.PROJECT_ID}/queries")
+        self.bodies.append(body)
+        return {"jobComplete": True,
+                "schema": {"fields": [{"name": "Timestamp", "type": "TIMESTAMP"},
+                                      {"name": "Minute ID", "type": "INTEGER"},
+                                      {"name": "Counter", "type": "INTEGER"}]},
+                "rows": [{"f": [{"v": "1.740934809E9"}, {"v": "91597"}, {"v": "949"}]}]}
+
+
+def test_reconcile_moves_checkpoint_forward() -> None:
+    session = FakeQuerySession()
+    use_clients(bigquery_client=RestBigQueryClient(session))
+    script.checkpoint = Checkpoint(os.path.join(tempfile.mkdtemp(), "checkpoint.json"))
+    script.save_checkpoint(script.line_key(log_line(0, 900)))
+
+    script.reconcile_checkpoint()
+    # BigQuery's newest row (17:00:09 UTC) is line 12:00:09 local, Counter 949; only key columns are read
+    assert script.load_checkpoint() == script.line_key(log_line(9, 949))
+    assert "SELECT Timestamp, `Minute ID`, Counter FROM" in session.bodies[0]["query"]
+    assert set(script.checkpoint.load()) == {"Log Timestamp", "Minute ID", "Counter"}
+
+    # A checkpoint already past BigQuery is left alone
+    script.save_checkpoint(script.line_key(log_line(30, 970)))
+    script.reconcile_checkpoint()
+    assert script.load_checkpoint() == script.line_key(log_line(30, 970))
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
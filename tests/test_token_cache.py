@@ -0,0 +1,105 @@
+# tests/test_token_cache.py
+"""
+Checks the access-token cache of gcp_clients.py in a scratch directory on a
+manually set clock: a cached token is only reused for the key it was issued
+for and while it stays valid for TOKEN_MIN_REMAINING, and the file is private.
+google-auth is not needed:
+
+    python3 -m pytest -q tests
+"""
+import os
+import sys
+import stat
+import tempfile
+from datetime import datetime, timedelta
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gcp_clients import TokenCache  # noqa: E402
+
+START = 1740934809.0     # 2025-03-02T17:00:09Z
+EXPIRY = datetime(2025, 3, 2, 18, 0, 9)     # Naive UTC, as google-auth keeps it: START + 3600 s
+
+
+class FakeClock:
+    """Manually set wall clock."""
+
+    def __init__(self) -> None:
+        self.now = START
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeCredentials:
+    """The attributes of google.oauth2.service_account.Credentials the cache uses."""
+
+    def __init__(self, key_id: str, token: Optional[str] = None, expiry: Optional[datetime] = None):
+        self.private_key_id = key_id
+        self.token = token
+        self.expiry = expiry
+
+
+def cache_path() -> str:
+    return os.path.join(tempfile.mkdtemp(), ".gcp_token.json")
+
+
+def test_token_bound_to_key() -> None:
+    path = cache_path()
+    clock = FakeClock()
+    cache = TokenCache(path, min_remaining=300.0, clock=clock)
+    cache.save(FakeCredentials("key-1", "ya29.token", EXPIRY))
+
+    credentials = FakeCredentials("key-1")
+    assert cache.load(credentials)
+    assert (credentials.token, credentials.expiry) == ("ya29.token", EXPIRY)
+    # A rotated service account key does not reuse the old key's token
+    rotated = FakeCredentials("key-2")
+    assert not cache.load(rotated) and rotated.token is None
+
+
+def test_token_expiry_margin() -> None:
+    path = cache_path()
+    clock = FakeClock()
+    cache = TokenCache(path, min_remaining=300.0, clock=clock)
+    cache.save(FakeCredentials("key-1", "ya29.token", EXPIRY))
+
+    clock.now = START + 3600 - 300
+    assert cache.load(FakeCredentials("key-1"))
+    # Less than min_remaining left: not installed, so the client refreshes first
+    clock.now = START + 3600 - 299
+    credentials = FakeCredentials("key-1")
+    assert not cache.load(credentials) and (credentials.token, credentials.expiry) == (None, None)
+    clock.now = START + 7200
+    assert not cache.load(FakeCredentials("key-1"))
+
+
+def test_cache_file_is_private() -> None:
+    path = cache_path()
+    cache = TokenCache(path, clock=FakeClock())
+    # Nothing to cache before the first token exchange
+    cache.save(FakeCredentials("key-1"))
+    assert not os.path.exists(path)
+
+    # A world-readable file left by hand is replaced, not rewritten in place
+    with open(path, "w") as f:
+        f.write("{}")
+    os.chmod(path, 0o644)
+    cache.save(FakeCredentials("key-1", "ya29.token", EXPIRY))
+    cache.save(FakeCredentials("key-1", "ya29.newer", EXPIRY + timedelta(hours=1)))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.listdir(os.path.dirname(path)) == [".gcp_token.json"]
+    with open(path) as f:
+        assert "ya29.newer" in f.read()
+
+    with open(path, "w") as f:
+        f.write("{not json")
+    assert not cache.load(FakeCredentials("key-1"))
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")